@@ -0,0 +1,165 @@
+"""
+Structured JSON access log.
+
+The ASGI middleware only decides whether to sample a request and hands the
+raw fields to a logging QueueHandler; JSON encoding and file I/O happen on
+the QueueListener thread, through a rotating file handler that flushes in
+batches instead of after every line.
+"""
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+
+from . import metrics
+from .config import settings
+
+ACCESS_LOG_DROPPED = metrics.counter("access_log_dropped", "Access log records dropped because the queue was full")
+
+logger = logging.getLogger("app.access")
+logger.propagate = False
+
+
+def decision_for(status_code: int) -> str:
+    if status_code in (401, 403):
+        return "deny"
+    return "error" if status_code >= 500 else "allow"
+
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener and drops when full"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            ACCESS_LOG_DROPPED.inc()
+
+
+class JSONAccessFormatter(logging.Formatter):
+    FIELDS = ("method", "route", "path", "status", "latency_ms", "sub", "decision", "client")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"ts": round(record.created, 3)}
+        entry.update(zip(self.FIELDS, getattr(record, "access", ())))
+        return json.dumps(entry, separators=(",", ":"))
+
+
+class BufferedRotatingFileHandler(RotatingFileHandler):
+    """Rotating file handler that flushes every ``flush_every`` records or ``flush_interval`` seconds"""
+
+    def __init__(self, filename: str, max_bytes: int, backup_count: int,
+                 flush_every: int = 64, flush_interval: float = 1.0):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        self._pending += 1
+        now = time.monotonic()
+        if self._pending >= self.flush_every or now - self._last_flush >= self.flush_interval:
+            self.force_flush()
+
+    def force_flush(self):
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        super().flush()
+
+    def close(self):
+        self.force_flush()
+        super().close()
+
+
+class AccessLog:
+    """Owns the queue, the listener thread and the output handler"""
+
+    def __init__(self, handler: Optional[logging.Handler] = None, max_queue: int = 10000):
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.handler = handler
+        self.listener: Optional[QueueListener] = None
+        logger.handlers = [DeferredQueueHandler(self.queue)]
+        logger.setLevel(logging.INFO)
+
+    def start(self):
+        if self.listener is None and self.handler is not None:
+            self.handler.setFormatter(JSONAccessFormatter())
+            self.listener = QueueListener(self.queue, self.handler)
+            self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            self.handler.close()
+
+
+class AccessLogMiddleware:
+    """
+    Logs one record per HTTP request.
+
+    ``sample_rates`` maps route templates (e.g. ``/health``) to the fraction
+    of requests logged; denials (401/403) and server errors are always
+    logged. The sampling decision is made before any record is built.
+    """
+
+    def __init__(self, app, sample_rates: Optional[Dict[str, float]] = None, default_rate: float = 1.0):
+        self.app = app
+        self.sample_rates = dict(sample_rates or {})
+        self.default_rate = default_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._log(scope, status_code, time.perf_counter() - start)
+
+    def _log(self, scope, status_code: int, elapsed: float):
+        if scope.get("state", {}).get("warmup"):
+            return
+        route = scope.get("route")
+        template = getattr(route, "path", None) or "unmatched"
+        decision = decision_for(status_code)
+        if decision == "allow":
+            rate = self.sample_rates.get(template, self.default_rate)
+            if rate < 1.0 and random.random() >= rate:
+                return
+
+        principal = scope.get("state", {}).get("principal") or {}
+        client = scope.get("client")
+        logger.info("access", extra={"access": (
+            scope["method"], template, scope["path"], status_code, round(elapsed * 1000, 3),
+            principal.get("sub"), decision, client[0] if client else None,
+        )})
+
+
+def _default_handler() -> logging.Handler:
+    if settings.access_log_path:
+        return BufferedRotatingFileHandler(
+            settings.access_log_path, settings.access_log_max_bytes, settings.access_log_backup_count
+        )
+    return logging.StreamHandler(sys.stdout)
+
+
+access_log = AccessLog(_default_handler(), max_queue=settings.access_log_queue_size)
@@ -0,0 +1,287 @@
+"""
+Audit log of authorization decisions.
+
+Request handlers only append a small tuple to an in-memory deque (atomic
+under the GIL, no lock taken); a background thread drains it in batches,
+serializes the records once and hands them to every sink. The queue is
+bounded: when full, ``record`` drops new records (counted). ``put``, which
+the request path awaits, does the same under the ``drop`` policy; under
+``block`` it waits for the writer to make room without blocking the event
+loop (the writer thread wakes it with ``call_soon_threadsafe``).
+"""
+import asyncio
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+AUDIT_RECORDS = metrics.counter("audit_records", "Authorization decisions recorded", ["decision"])
+AUDIT_DROPPED = metrics.counter("audit_dropped", "Audit records dropped because the queue was full")
+AUDIT_QUEUE_DEPTH = metrics.gauge("audit_queue_depth", "Audit records waiting to be written")
+AUDIT_SINK_SECONDS = metrics.histogram(
+    "audit_sink_write_seconds", "Time a sink takes to write one batch", ["sink"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+AUDIT_SINK_ERRORS = metrics.counter("audit_sink_errors", "Failed sink writes", ["sink"])
+
+OVERFLOW_POLICIES = ("drop", "block")
+
+
+class AuditSink:
+    """Destination for serialized audit records; subclass and override write()"""
+
+    name = "sink"
+
+    def write(self, lines: List[str]):
+        """Write a batch of JSON lines (without trailing newlines)"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RotatingFileSink(AuditSink):
+    """
+    Appends JSON lines to ``path``, rotating to ``path.1`` .. ``path.N``
+    once the file exceeds ``max_bytes``.
+    """
+
+    name = "file"
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._fp = None
+
+    def _open(self):
+        if self._fp is None:
+            self._fp = open(self.path, "a", encoding="utf-8")
+        return self._fp
+
+    def write(self, lines: List[str]):
+        fp = self._open()
+        fp.write("\n".join(lines) + "\n")
+        fp.flush()
+        if self.max_bytes and fp.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+
+class LoggerSink(AuditSink):
+    """Forwards records to a standard logger (e.g. to reach an existing log pipeline)"""
+
+    name = "logger"
+
+    def __init__(self, logger_name: str = "audit"):
+        self.logger = logging.getLogger(logger_name)
+
+    def write(self, lines: List[str]):
+        for line in lines:
+            self.logger.info(line)
+
+
+class MemorySink(AuditSink):
+    """Keeps the most recent records in memory (tests, debugging)"""
+
+    name = "memory"
+
+    def __init__(self, max_records: int = 1000):
+        self.records: collections.deque = collections.deque(maxlen=max_records)
+
+    def write(self, lines: List[str]):
+        self.records.extend(json.loads(line) for line in lines)
+
+
+class AuditLog:
+    """Bounded queue of audit records drained by a background writer thread"""
+
+    def __init__(
+        self,
+        sinks: Iterable[AuditSink] = (),
+        max_queue: int = 10000,
+        overflow: str = "drop",
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self.sinks: List[AuditSink] = list(sinks)
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: collections.deque = collections.deque()
+        self._wakeup = threading.Event()
+        # Futures of coroutines waiting in put() for room, with their loops
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._waiters_lock = threading.Lock()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+
+    def add_sink(self, sink: AuditSink):
+        self.sinks = self.sinks + [sink]
+
+    def remove_sink(self, sink: AuditSink):
+        self.sinks = [s for s in self.sinks if s is not sink]
+
+    def record(
+        self,
+        decision: str,
+        current_user: Dict,
+        method: str,
+        path: str,
+        policy: Optional[str] = None,
+        status_code: Optional[int] = None,
+    ):
+        """
+        Enqueue one decision, dropping it when the queue is full; never
+        waits, serializes or does I/O on the caller's thread
+        """
+        if len(self._queue) >= self.max_queue:
+            AUDIT_DROPPED.inc()
+            return
+        self._queue.append((
+            time.time(), decision, current_user.get("sub"), current_user.get("preferred_username"),
+            current_user.get("realm_access", {}).get("roles", []), method, path, policy, status_code,
+        ))
+        AUDIT_RECORDS.labels(decision).inc()
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def put(
+        self,
+        decision: str,
+        current_user: Dict,
+        method: str,
+        path: str,
+        policy: Optional[str] = None,
+        status_code: Optional[int] = None,
+    ):
+        """:meth:`record`, but with the ``block`` policy wait for room in the queue first"""
+        if self.overflow == "block":
+            while len(self._queue) >= self.max_queue and self._thread is not None and not self._stopping:
+                await self._room()
+        self.record(decision, current_user, method, path, policy, status_code)
+
+    async def _room(self):
+        loop = asyncio.get_running_loop()
+        room = loop.create_future()
+        with self._waiters_lock:
+            self._waiters.append((loop, room))
+        self._wakeup.set()
+        try:
+            # The timeout covers a drain that finished just before we registered
+            await asyncio.wait_for(room, 0.05)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._waiters_lock:
+                if (loop, room) in self._waiters:
+                    self._waiters.remove((loop, room))
+
+    def _release_waiters(self):
+        with self._waiters_lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, room in waiters:
+            try:
+                loop.call_soon_threadsafe(_set_done, room)
+            except RuntimeError:  # that loop is closed
+                pass
+
+    @staticmethod
+    def _serialize(item) -> str:
+        ts, decision, sub, user, roles, method, path, policy, status_code = item
+        return json.dumps({
+            "ts": round(ts, 3), "decision": decision, "sub": sub, "user": user, "roles": roles,
+            "method": method, "path": path, "policy": policy, "status": status_code,
+        }, separators=(",", ":"))
+
+    def drain(self) -> int:
+        """Write everything queued now; returns records written"""
+        written = 0
+        while self._queue:
+            batch: List[Tuple] = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            self._release_waiters()
+            lines = [self._serialize(item) for item in batch]
+            for sink in self.sinks:
+                start = time.perf_counter()
+                try:
+                    sink.write(lines)
+                except Exception:
+                    AUDIT_SINK_ERRORS.labels(sink.name).inc()
+                    logger.exception("Audit sink %s failed", sink.name)
+                AUDIT_SINK_SECONDS.labels(sink.name).observe(time.perf_counter() - start)
+            written += len(batch)
+        AUDIT_QUEUE_DEPTH.set(len(self._queue))
+        return written
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.drain()
+        self.drain()
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping = True
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.drain()
+        for sink in self.sinks:
+            sink.close()
+        self._release_waiters()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+
+def _set_done(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _default_sinks() -> List[AuditSink]:
+    if not settings.audit_log_path:
+        return []
+    return [RotatingFileSink(settings.audit_log_path, settings.audit_max_bytes, settings.audit_backup_count)]
+
+
+audit_log = AuditLog(
+    _default_sinks(),
+    max_queue=settings.audit_queue_size,
+    overflow=settings.audit_overflow,
+)
@@ -1,5 +1,11 @@
 from fastapi import HTTPException, Request, Header, Depends
-from typing import Dict, Optional, List
+from typing import AbstractSet, Dict, Iterable, Optional, List, Tuple
+import httpx
+
+from .audit import audit_log
+from .deadlines import DeadlineExceeded
+from .resilience import KeycloakUnavailable
+from .tokens import TokenError, token_verifier
 
 async def get_current_user(
     request: Request,
@@ -10,13 +16,22 @@ async def get_current_user(
     x_email: Optional[str] = Header(None),
     x_first_name: Optional[str] = Header(None),
     x_last_name: Optional[str] = Header(None),
-    x_preferred_username: Optional[str] = Header(None)
+    x_preferred_username: Optional[str] = Header(None),
+    x_authorization: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None)
 ) -> Dict:
     """
     Get current user information from HAProxy headers.
     HAProxy validates the JWT and extracts claims into headers.
+    When only the raw token is forwarded (X-Authorization / Authorization),
+    it is verified in-process against the realm JWKS.
     """
     if not x_user:
+        bearer = x_authorization or authorization
+        if bearer and bearer.startswith("Bearer "):
+            principal = await _user_from_token(bearer[7:].strip())
+            request.state.principal = principal
+            return principal
         raise HTTPException(status_code=401, detail="Authentication required")
     
     # Parse roles from comma-separated string
@@ -29,7 +44,7 @@ async def get_current_user(
     if x_groups:
         groups = [group.strip() for group in x_groups.split(',')]
     
-    return {
+    principal = {
         "sub": x_user,
         "preferred_username": x_preferred_username or x_user,
         "email": x_email,
@@ -41,24 +56,115 @@ async def get_current_user(
         },
         "groups": groups
     }
+    # Exposed to middleware (access log) without re-parsing headers
+    request.state.principal = principal
+    return principal
 
-async def require_admin(current_user: Dict = Depends(get_current_user)) -> Dict:
-    """Require admin role"""
-    roles = current_user.get("realm_access", {}).get("roles", [])
+async def _user_from_token(token: str) -> Dict:
+    """Verify a bearer token and map its claims to the principal shape"""
+    try:
+        claims = await token_verifier.verify(token)
+        roles, groups = _roles_and_groups(claims)
+    except TokenError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Request deadline exceeded")
+    except KeycloakUnavailable as e:
+        raise HTTPException(status_code=503, detail="Keycloak service unavailable",
+                            headers={"Retry-After": str(int(e.retry_after + 0.5))})
+    except httpx.HTTPError:
+        raise HTTPException(status_code=503, detail="Keycloak service unavailable")
+    
+    return {
+        "sub": claims.get("sub"),
+        "preferred_username": claims.get("preferred_username") or claims.get("sub"),
+        "email": claims.get("email"),
+        "given_name": claims.get("given_name"),
+        "family_name": claims.get("family_name"),
+        "iss": claims.get("iss"),
+        "realm_access": {
+            "roles": roles
+        },
+        "groups": groups,
+        "exp": claims.get("exp")
+    }
+
+def _is_str_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+def _roles_and_groups(claims: Dict) -> Tuple[List[str], List[str]]:
+    """Extract the role and group claims, rejecting ill-typed ones"""
+    realm_access = claims.get("realm_access", {})
+    if not isinstance(realm_access, dict):
+        raise TokenError("Invalid realm_access claim")
+    roles = realm_access.get("roles", [])
+    if not _is_str_list(roles):
+        raise TokenError("Invalid roles claim")
+    groups = claims.get("groups", [])
+    if not _is_str_list(groups):
+        raise TokenError("Invalid groups claim")
+    return list(roles), list(groups)
+
+class RolePolicy:
+    """
+    Authorization rule shared by require_role, require_admin and the batch
+    check endpoint: the user needs one of ``roles`` or one of ``groups``.
+    """
     
-    if "admin" not in roles:
+    def __init__(self, roles: Iterable[str], groups: Optional[Iterable[str]] = None, name: Optional[str] = None):
+        self.roles = frozenset(roles)
+        self.groups = frozenset(groups) if groups else None
+        self.name = name
+        self.detail = f"Access denied. Required: roles {list(roles)}" + \
+                      (f" or groups {list(groups)}" if groups else "")
+    
+    def allows_sets(self, user_roles: AbstractSet[str], user_groups: AbstractSet[str]) -> bool:
+        """Evaluate against pre-built role and group sets"""
+        if not self.roles.isdisjoint(user_roles):
+            return True
+        return self.groups is not None and not self.groups.isdisjoint(user_groups)
+    
+    def allows(self, current_user: Dict) -> bool:
+        return self.allows_sets(
+            frozenset(current_user.get("realm_access", {}).get("roles", [])),
+            frozenset(current_user.get("groups", []))
+        )
+
+
+# Named permissions, registered by require_role(..., permission=...)
+POLICIES: Dict[str, RolePolicy] = {}
+
+ADMIN_POLICY = RolePolicy(["admin"], name="admin")
+POLICIES["admin"] = ADMIN_POLICY
+
+
+async def require_admin(request: Request, current_user: Dict = Depends(get_current_user)) -> Dict:
+    """Require admin role"""
+    if not ADMIN_POLICY.allows(current_user):
+        await audit_log.put("deny", current_user, request.method, request.url.path, ADMIN_POLICY.name, 403)
         raise HTTPException(status_code=403, detail="Admin access required")
     
     return current_user
 
+setattr(require_admin, "policy", ADMIN_POLICY)
+
 
-def require_role(*allowed_roles: str, allowed_groups: Optional[List[str]] = None):
+def require_role(
+    *allowed_roles: str,
+    allowed_groups: Optional[List[str]] = None,
+    permission: Optional[str] = None,
+    audit: bool = False
+):
     """
     Dynamic role checker factory that creates a dependency function.
     
     Args:
         *allowed_roles: Variable number of role names. User must have at least one.
         allowed_groups: Optional list of group names. User must have at least one if provided.
+        permission: Optional permission name the policy is registered under
+            (used by the batch check endpoint).
+        audit: Also record granted requests in the audit log (denials are
+            always recorded).
     
     Returns:
         A dependency function that can be used with Depends()
@@ -68,29 +174,19 @@ def require_role(*allowed_roles: str, allowed_groups: Optional[List[str]] = None
         async def get_packages(current_user: Dict = Depends(require_role("view_dashboard", "packages_viewer"))):
             ...
     """
-    async def role_checker(current_user: Dict = Depends(get_current_user)) -> Dict:
-        user_roles = current_user.get("realm_access", {}).get("roles", [])
-        user_groups = current_user.get("groups", [])
-        
-        # Check if user has any of the required roles
-        has_role = any(role in user_roles for role in allowed_roles)
-        
-        # Check if user has any of the required groups (if specified)
-        has_group = False
-        if allowed_groups:
-            has_group = any(group in user_groups for group in allowed_groups)
-        
+    policy = RolePolicy(allowed_roles, allowed_groups, name=permission)
+    if permission:
+        POLICIES[permission] = policy
+    
+    async def role_checker(request: Request, current_user: Dict = Depends(get_current_user)) -> Dict:
         # User needs either a required role OR a required group (if groups are specified)
-        if not has_role and (allowed_groups is None or not has_group):
-            required = list(allowed_roles)
-            if allowed_groups:
-                required.extend(allowed_groups)
-            raise HTTPException(
-                status_code=403,
-                detail=f"Access denied. Required: roles {list(allowed_roles)}" + 
-                       (f" or groups {allowed_groups}" if allowed_groups else "")
-            )
+        if not policy.allows(current_user):
+            await audit_log.put("deny", current_user, request.method, request.url.path, policy.name, 403)
+            raise HTTPException(status_code=403, detail=policy.detail)
         
+        if audit:
+            await audit_log.put("allow", current_user, request.method, request.url.path, policy.name)
         return current_user
     
+    setattr(role_checker, "policy", policy)
     return role_checker
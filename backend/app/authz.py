@@ -0,0 +1,95 @@
+"""
+Batch authorization checks.
+
+Evaluates many (method, path) pairs or permission names for one principal in
+a single pass, using the exact RolePolicy objects attached to the route
+dependencies by require_role / require_admin.
+"""
+from typing import Dict, List, Optional, Pattern, Set, Tuple, Union
+
+from fastapi import FastAPI
+from fastapi.dependencies.models import Dependant
+from fastapi.routing import APIRoute
+
+from .auth import POLICIES, RolePolicy, get_current_user
+
+# Markers for routes that need no role: any authenticated user, or nobody at all
+AUTHENTICATED = "authenticated"
+PUBLIC = "public"
+
+Policy = Union[RolePolicy, str]
+RouteEntry = Tuple[Pattern, Set[str], Policy]
+
+_route_tables: Dict[int, List[RouteEntry]] = {}
+
+
+def _route_policy(dependant: Dependant) -> Policy:
+    """Find the policy guarding a route by walking its dependency tree"""
+    authenticated = False
+    stack = list(dependant.dependencies)
+    while stack:
+        dep = stack.pop()
+        policy = getattr(dep.call, "policy", None)
+        if isinstance(policy, RolePolicy):
+            return policy
+        if dep.call is get_current_user:
+            authenticated = True
+        stack.extend(dep.dependencies)
+    return AUTHENTICATED if authenticated else PUBLIC
+
+
+def compile_route_policies(app: FastAPI) -> List[RouteEntry]:
+    """Build (and cache) the route -> policy table for an app"""
+    table = _route_tables.get(id(app))
+    if table is None:
+        table = [
+            (route.path_regex, set(route.methods or ()), _route_policy(route.dependant))
+            for route in app.routes
+            if isinstance(route, APIRoute)
+        ]
+        _route_tables[id(app)] = table
+    return table
+
+
+def route_tables() -> Dict[int, List[RouteEntry]]:
+    """Compiled route -> policy tables, by app (memory diagnostics)"""
+    return _route_tables
+
+
+def evaluate(
+    app: FastAPI,
+    current_user: Dict,
+    routes: Optional[List[Tuple[str, str]]] = None,
+    permissions: Optional[List[str]] = None,
+) -> Dict[str, bool]:
+    """
+    Evaluate route and permission checks for one user.
+
+    Returns a map keyed by ``"METHOD /path"`` or permission name. Unknown
+    routes and permissions are reported as not allowed.
+    """
+    user_roles = frozenset(current_user.get("realm_access", {}).get("roles", []))
+    user_groups = frozenset(current_user.get("groups", []))
+    results: Dict[str, bool] = {}
+
+    def allowed(policy: Policy) -> bool:
+        if isinstance(policy, RolePolicy):
+            return policy.allows_sets(user_roles, user_groups)
+        return policy in (PUBLIC, AUTHENTICATED)
+
+    if routes:
+        table = compile_route_policies(app)
+        for method, path in routes:
+            method = method.upper()
+            policy = None
+            for regex, methods, route_policy in table:
+                if method in methods and regex.match(path):
+                    policy = route_policy
+                    break
+            results[f"{method} {path}"] = policy is not None and allowed(policy)
+
+    for name in permissions or []:
+        policy = POLICIES.get(name)
+        results[name] = policy is not None and allowed(policy)
+
+    return results
@@ -0,0 +1,300 @@
+"""
+Response caching for idempotent GET handlers.
+
+Responses that depend only on the caller's role set are stored pre-encoded,
+keyed by route plus a role-set fingerprint, with TTL expiry, LRU eviction
+bounded by entry count and total bytes, and ETag / If-None-Match support.
+Compressed variants are kept alongside each body, so a hit in a coding
+already seen is served without compressing again.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from . import compression
+from .config import settings
+
+_REQUEST_PARAM = "_cache_request"
+
+
+def role_fingerprint(current_user: Dict) -> str:
+    """Canonical, order-independent digest of a user's roles and groups"""
+    roles = sorted(set(current_user.get("realm_access", {}).get("roles", [])))
+    groups = sorted(set(current_user.get("groups", [])))
+    canonical = ",".join(roles) + "|" + ",".join(groups)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def encode_json(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class CacheEntry:
+    """
+    A pre-encoded JSON body.
+
+    When the handler echoes the caller's username, the body is stored without
+    the closing brace so the ``"user"`` member can be appended per request
+    without re-serializing the rest.
+
+    Compressed variants are built once per coding. A per-user body is only
+    offered gzip-encoded: the shared prefix is deflated once and each request
+    deflates just the ``"user"`` member onto it (see ``compression.gzip_open``).
+    """
+
+    __slots__ = ("prefix", "echo_user", "digest", "expires_at", "size", "variants", "_gzip_head")
+
+    def __init__(self, payload: Dict, ttl: float, echo_user: bool):
+        self.echo_user = echo_user
+        if echo_user:
+            payload = {k: v for k, v in payload.items() if k != "user"}
+            encoded = encode_json(payload)
+            self.prefix = encoded[:-1] + (b"," if payload else b"")
+        else:
+            self.prefix = encode_json(payload)
+        self.digest = hashlib.blake2b(self.prefix, digest_size=10).hexdigest()
+        self.expires_at = time.monotonic() + ttl
+        self.size = len(self.prefix) + 200
+        self.variants: Dict[str, bytes] = {}
+        self._gzip_head: Optional[Tuple[bytes, int]] = None
+
+    def etag(self, user: Optional[str]) -> str:
+        if not self.echo_user:
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{zlib.crc32((user or "").encode("utf-8")):08x}"'
+
+    def _suffix(self, user: Optional[str]) -> bytes:
+        return b'"user":' + encode_json(user) + b"}"
+
+    def body(self, user: Optional[str]) -> bytes:
+        if not self.echo_user:
+            return self.prefix
+        return self.prefix + self._suffix(user)
+
+    @property
+    def encodings(self) -> Tuple[str, ...]:
+        """Codings :meth:`variant` serves"""
+        return ("gzip",) if self.echo_user else compression.AVAILABLE
+
+    def variant(self, encoding: str, user: Optional[str]) -> bytes:
+        """The body compressed with one of :attr:`encodings`, the shared part only once"""
+        if self.echo_user:
+            if self._gzip_head is None:
+                self._gzip_head = compression.gzip_open(self.prefix)
+                self.size += len(self._gzip_head[0])
+            head, crc = self._gzip_head
+            return compression.gzip_close(head, crc, len(self.prefix), self._suffix(user))
+        data = self.variants.get(encoding)
+        if data is None:
+            data = compression.compress(self.prefix, encoding, compression.STATIC_LEVELS[encoding])
+            self.variants[encoding] = data
+            self.size += len(data)
+        return data
+
+
+class ResponseCache:
+    """Size-bounded LRU of CacheEntry objects with per-entry TTL"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Tuple, entry: CacheEntry):
+        if entry.size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        self.bytes += entry.size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def grow(self, key: Tuple, entry: CacheEntry, added: int):
+        """Account for bytes added to a stored entry (a compressed variant)"""
+        if self._entries.get(key) is not entry:
+            return
+        self.bytes += added
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: Tuple):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+
+    def invalidate(self, namespace: Optional[str] = None):
+        """Drop every entry of a namespace, or everything when omitted"""
+        if namespace is None:
+            self._entries.clear()
+            self.bytes = 0
+            return
+        for key in [k for k in self._entries if k[0] == namespace]:
+            self._remove(key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def if_none_match(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+PRINCIPAL_FIELDS = ("sub", "preferred_username", "email", "given_name", "family_name", "iss")
+
+
+def principal_etag(current_user: Dict, namespace: str) -> str:
+    """
+    Strong ETag derived from the principal's stable fields.
+
+    Bodies built only from these fields change exactly when the tag does, so
+    it can be checked before the response is built or serialized.
+    """
+    parts = [namespace]
+    parts.extend(str(current_user.get(field) or "") for field in PRINCIPAL_FIELDS)
+    parts.append(",".join(current_user.get("realm_access", {}).get("roles", [])))
+    parts.append(",".join(current_user.get("groups", [])))
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_response(
+    request: Request,
+    etag: str,
+    build: Callable[[], Any],
+    cache_control: str = "private, no-cache",
+) -> Response:
+    """Answer 304 when the client already has ``etag``, else encode ``build()``"""
+    if if_none_match(request, etag):
+        return not_modified(etag, cache_control)
+    payload = build()
+    if hasattr(payload, "model_dump"):
+        payload = payload.model_dump(mode="json")
+    return Response(
+        content=encode_json(payload),
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": cache_control}
+    )
+
+
+def cached_response(
+    cache: "ResponseCache",
+    namespace: str,
+    ttl: Optional[float] = None,
+    echo_user: bool = True,
+    cache_control: str = "private, no-cache",
+):
+    """
+    Cache a GET handler's JSON response per route and role set.
+
+    The handler must take ``current_user`` (the principal dict) and return a
+    dict. With ``echo_user`` the ``"user"`` member is filled from the caller
+    on every hit, so one entry serves every user holding the same roles.
+
+    Example:
+        @app.get("/api/packages")
+        @cached_response(response_cache, "packages")
+        async def get_packages(current_user: Dict = Depends(require_role(...))):
+            ...
+    """
+    def decorator(func: Callable):
+        signature = inspect.signature(func)
+        request_param = next(
+            (name for name, p in signature.parameters.items() if p.annotation is Request),
+            None
+        )
+        if request_param is None:
+            request_param = _REQUEST_PARAM
+            params = list(signature.parameters.values())
+            params.append(inspect.Parameter(_REQUEST_PARAM, inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+            signature = signature.replace(parameters=params)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            request: Request = kwargs[request_param]
+            if request_param == _REQUEST_PARAM:
+                del kwargs[_REQUEST_PARAM]
+            current_user = kwargs.get("current_user") or {}
+            user = current_user.get("preferred_username")
+
+            key = (namespace, request.url.path, request.url.query, role_fingerprint(current_user))
+            entry = cache.get(key)
+            if entry is None:
+                entry = CacheEntry(await func(*args, **kwargs), cache.ttl if ttl is None else ttl, echo_user)
+                cache.put(key, entry)
+
+            etag = entry.etag(user)
+            if if_none_match(request, etag):
+                return not_modified(etag, cache_control)
+
+            body = entry.body(user)
+            headers = {"ETag": etag, "Cache-Control": cache_control}
+            if settings.compression_enabled:
+                headers["Vary"] = "Accept-Encoding"
+                # Codings the entry cannot serve are left to the compression middleware
+                encoding = compression.negotiate(request.headers.get("accept-encoding"), entry.encodings)
+                if encoding and len(body) >= settings.compression_min_size:
+                    size = entry.size
+                    body = entry.variant(encoding, user)
+                    cache.grow(key, entry, entry.size - size)
+                    headers.update({"ETag": "W/" + etag, "Content-Encoding": encoding})
+            return Response(content=body, media_type="application/json", headers=headers)
+
+        setattr(wrapper, "__signature__", signature)
+        return wrapper
+
+    return decorator
+
+
+def invalidates(cache: "ResponseCache", *namespaces: str):
+    """Invalidate cache namespaces after a (mutating) handler succeeds"""
+    def decorator(func: Callable):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            result = await func(*args, **kwargs)
+            for namespace in namespaces:
+                cache.invalidate(namespace)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    max_bytes=settings.response_cache_max_bytes,
+    ttl=settings.response_cache_ttl,
+)
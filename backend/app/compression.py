@@ -0,0 +1,262 @@
+"""
+Response compression.
+
+The codec is negotiated from ``Accept-Encoding`` among those available:
+zstd and brotli when their optional packages (``zstandard``, ``brotli``)
+are installed, gzip always. Small bodies, already-compressed media types
+and event streams are sent as they are. A body that arrives in one message
+is compressed in one shot; a streamed body is compressed as it passes,
+with output flushed every ``flush_bytes`` of input so a client sees steady
+progress without each tiny chunk (one package row) costing a flush.
+"""
+import struct
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+
+try:
+    import zstandard
+except ImportError:  # optional codec
+    zstandard = None  # type: ignore[assignment]
+
+try:
+    import brotli
+except ImportError:  # optional codec
+    brotli = None
+
+COMPRESSED_RESPONSES = metrics.counter("compressed_responses", "Responses compressed", ["encoding", "mode"])
+COMPRESSION_BYTES = metrics.counter("compression_bytes", "Bytes before and after compression", ["stage"])
+
+PREFERENCE = ("zstd", "br", "gzip")
+AVAILABLE = tuple(e for e in PREFERENCE if {"zstd": zstandard, "br": brotli}.get(e, zlib) is not None)
+
+# Levels for per-request compression, and for variants computed once and cached
+LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+STATIC_LEVELS = {"zstd": 10, "br": 9, "gzip": 9}
+
+SKIP_TYPES = frozenset({
+    "application/gzip", "application/zip", "application/zstd", "application/x-7z-compressed",
+    "application/x-bzip2", "application/x-xz", "application/pdf", "application/octet-stream",
+    "text/event-stream", "font/woff", "font/woff2",
+})
+SKIP_PREFIXES = (b"image/", b"video/", b"audio/")
+COMPRESSIBLE_IMAGES = frozenset({b"image/svg+xml"})
+
+
+def negotiate(accept_encoding: Optional[str], available: Iterable[str] = AVAILABLE) -> Optional[str]:
+    """Best available coding the client accepts (highest q, then server preference)"""
+    if not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = weights.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Stream:
+    """Incremental compressor with the same three calls for every codec"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        # The codecs share no base type; the methods below dispatch on encoding
+        self._obj: Any
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        elif encoding == "br":
+            self._obj = brotli.Compressor(quality=level)
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == "br":
+            return self._obj.flush()
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "zstd":
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        if self.encoding == "br":
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """One-shot compression of a complete body"""
+    level = LEVELS[encoding] if level is None else level
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return zlib.compress(data, level, 31)
+
+
+# RFC 1952 member header: deflate, no flags, no mtime, maximum compression, unknown OS
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x02\xff"
+
+
+def gzip_open(prefix: bytes, level: int = STATIC_LEVELS["gzip"]) -> Tuple[bytes, int]:
+    """
+    A gzip member's header and ``prefix`` deflated up to a byte-aligned
+    sync point, plus the prefix's CRC: everything but the tail, so the same
+    head can end with different suffixes (see :func:`gzip_close`).
+    """
+    deflater = zlib.compressobj(level, zlib.DEFLATED, -15)
+    head = GZIP_HEADER + deflater.compress(prefix) + deflater.flush(zlib.Z_SYNC_FLUSH)
+    return head, zlib.crc32(prefix)
+
+
+def gzip_close(head: bytes, crc: int, prefix_length: int, suffix: bytes) -> bytes:
+    """
+    Complete a member from :func:`gzip_open` with ``suffix``.
+
+    The suffix is deflated by a fresh, small deflater: its blocks never refer
+    back into the prefix, so only the suffix is compressed per call, and the
+    trailer's CRC and length are extended rather than recomputed.
+    """
+    deflater = zlib.compressobj(1, zlib.DEFLATED, -9, 1)
+    tail = deflater.compress(suffix) + deflater.flush()
+    trailer = struct.pack("<II", zlib.crc32(suffix, crc), (prefix_length + len(suffix)) & 0xFFFFFFFF)
+    return head + tail + trailer
+
+
+def _weak(etag: bytes) -> bytes:
+    # The compressed body is a different representation; If-None-Match
+    # comparison ignores the W/ prefix, so conditional requests still match
+    return etag if etag.startswith(b"W/") else b"W/" + etag
+
+
+def encoded_headers(headers: Iterable[Tuple[bytes, bytes]], encoding: str,
+                    length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+    """Response headers rewritten for a body in ``encoding`` (chunked when ``length`` is None)"""
+    result = []
+    vary = True
+    for name, value in headers:
+        if name == b"content-length":
+            continue
+        if name == b"etag":
+            value = _weak(value)
+        elif name == b"vary" and b"accept-encoding" in value.lower():
+            vary = False
+        result.append((name, value))
+    result.append((b"content-encoding", encoding.encode("latin-1")))
+    if vary:
+        result.append((b"vary", b"Accept-Encoding"))
+    if length is not None:
+        result.append((b"content-length", str(length).encode("latin-1")))
+    return result
+
+
+class CompressionMiddleware:
+    """Compresses eligible HTTP responses in the negotiated coding"""
+
+    def __init__(self, app, min_size: int = 1024, flush_bytes: int = 16384,
+                 available: Iterable[str] = AVAILABLE, levels: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.min_size = min_size
+        self.flush_bytes = flush_bytes
+        self.available = tuple(available)
+        self.levels = {**LEVELS, **(levels or {})}
+
+    def _eligible(self, message) -> bool:
+        status = message["status"]
+        if status < 200 or status in (204, 304):
+            return False
+        for name, value in message.get("headers", ()):
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                media_type = value.split(b";", 1)[0].strip().lower()
+                if media_type.decode("latin-1") in SKIP_TYPES:
+                    return False
+                if media_type.startswith(SKIP_PREFIXES) and media_type not in COMPRESSIBLE_IMAGES:
+                    return False
+            elif name == b"content-length" and int(value) < self.min_size:
+                return False
+            elif name == b"cache-control" and b"no-transform" in value:
+                return False
+        return True
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        accept = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = negotiate(accept, self.available)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        level = self.levels[encoding]
+        start = None
+        stream: Optional[_Stream] = None
+        pending = 0
+
+        async def send_compressed(message):
+            nonlocal start, stream, pending
+            if start is None:
+                if message["type"] == "http.response.start" and self._eligible(message):
+                    start = message
+                    return
+                start = False
+            if start is False or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if stream is None:
+                if not more:
+                    if len(body) < self.min_size:
+                        await send(start)
+                        await send(message)
+                        return
+                    data = compress(body, encoding, level)
+                    COMPRESSED_RESPONSES.labels(encoding, "whole").inc()
+                    COMPRESSION_BYTES.labels("in").inc(len(body))
+                    COMPRESSION_BYTES.labels("out").inc(len(data))
+                    await send({**start, "headers": encoded_headers(start.get("headers", ()), encoding, len(data))})
+                    await send({"type": "http.response.body", "body": data})
+                    return
+                stream = _Stream(encoding, level)
+                COMPRESSED_RESPONSES.labels(encoding, "stream").inc()
+                await send({**start, "headers": encoded_headers(start.get("headers", ()), encoding, None)})
+
+            data = stream.compress(body) if body else b""
+            pending += len(body)
+            COMPRESSION_BYTES.labels("in").inc(len(body))
+            if not more:
+                data += stream.finish()
+            elif pending >= self.flush_bytes:
+                data += stream.flush()
+                pending = 0
+            if data or not more:
+                COMPRESSION_BYTES.labels("out").inc(len(data))
+                await send({"type": "http.response.body", "body": data, "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
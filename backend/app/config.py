@@ -1,9 +1,131 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
+    app_name: str = "Lab Test2 API"
     keycloak_url: str = "http://keycloak:8080/auth"
     keycloak_realm: str = "lab-test2"
     client_id: str = "myapp"
+    keycloak_timeout: float = 5.0
+    keycloak_max_connections: int = 20
+    # Per-endpoint circuit breakers and concurrency caps (default: max_connections)
+    keycloak_breaker_threshold: int = 5
+    keycloak_breaker_reset_timeout: float = 30.0
+    keycloak_max_concurrency: Optional[int] = None
+
+    # Admin REST API credentials (master realm admin-cli by default)
+    keycloak_admin_realm: str = "master"
+    keycloak_admin_client_id: str = "admin-cli"
+    keycloak_admin_username: Optional[str] = "admin"
+    keycloak_admin_password: Optional[str] = None
+    keycloak_admin_client_secret: Optional[str] = None
+
+    # In-process token verification (used when HAProxy forwards the raw token)
+    token_issuer: Optional[str] = None
+    token_audience: Optional[str] = None
+    jwks_ttl: float = 300.0
+    jwks_min_refresh_interval: float = 30.0
+    # Past jwks_ttl the old key set keeps verifying (refreshed in the background) for this long
+    jwks_max_stale: float = 3600.0
+
+    # CORS: explicit origins only ("*" is refused together with credentials)
+    cors_allow_origins: List[str] = [
+        "https://lab-test2.safa.nisvcg.comp.net",
+        "https://localhost",
+        "http://localhost:3000",
+    ]
+    cors_allow_credentials: bool = True
+    cors_max_age: int = 86400
+
+    # Request deadlines: per-route budgets (longest path prefix wins), which
+    # the X-Request-Timeout header set by HAProxy may only shorten
+    request_timeout: float = 45.0
+    request_timeouts: Dict[str, float] = {"/health": 2.0}
+    request_timeout_header: str = "X-Request-Timeout"
+
+    # Background dependency prober behind /health and /ready; "saturation"
+    # is the share of a pool or limit in use that counts as saturated
+    health_probe_interval: float = 5.0
+    health_probe_timeout: float = 2.0
+    health_saturation: float = 0.9
+
+    # Startup warm-up (readiness waits for it); each step is bounded by the timeout
+    warmup_enabled: bool = True
+    warmup_step_timeout: float = 10.0
+    warmup_keycloak_connections: int = 2
+
+    # Adaptive concurrency limit / load shedding
+    shed_enabled: bool = True
+    concurrency_initial_limit: int = 100
+    concurrency_min_limit: int = 10
+    concurrency_max_limit: int = 1000
+    concurrency_latency_tolerance: float = 2.0
+    shed_retry_after: int = 1
+
+    # Response cache for role-dependent GET endpoints
+    response_cache_ttl: float = 30.0
+    response_cache_max_entries: int = 1024
+    response_cache_max_bytes: int = 8 * 1024 * 1024
+
+    # Response compression (zstd and brotli when their packages are installed,
+    # else gzip); bodies below the minimum size are sent as they are
+    compression_enabled: bool = True
+    compression_min_size: int = 1024
+    # Streamed bodies are flushed to the client after this much input
+    compression_flush_bytes: int = 16384
+    # Event-loop monitor: lag is sampled every interval, a callback holding
+    # the loop past the threshold has its stack logged, and past offload_lag
+    # (off when unset) token signature checks run in a worker thread
+    loop_monitor_enabled: bool = True
+    loop_monitor_interval: float = 0.1
+    loop_block_threshold: float = 0.25
+    loop_offload_lag: Optional[float] = None
+
+    # On-demand sampling profiler (/debug/profile); the maximum stays below
+    # request_timeout so a profile is never cut off by its own deadline
+    profile_interval: float = 0.005
+    profile_max_seconds: float = 30.0
+
+    # Frames kept per allocation while an admin has tracemalloc running
+    tracemalloc_frames: int = 10
+
+    # Keycloak login/admin event ingestion (needs admin credentials)
+    events_enabled: bool = False
+    events_db_path: str = "events.db"
+    events_poll_interval: float = 10.0
+    events_queue_size: int = 10000
+    events_batch_size: int = 500
+    # Authorization audit log (empty path disables the file sink)
+    audit_log_path: Optional[str] = "audit.log"
+    audit_max_bytes: int = 10 * 1024 * 1024
+    audit_backup_count: int = 5
+    audit_queue_size: int = 10000
+    audit_overflow: str = "drop"
+    # Structured access log (stdout when no path is set); per-route sample
+    # rates apply to allowed requests, denials and errors are always logged
+    access_log_path: Optional[str] = None
+    access_log_max_bytes: int = 50 * 1024 * 1024
+    access_log_backup_count: int = 5
+    access_log_queue_size: int = 10000
+    access_log_sample_rates: Dict[str, float] = {"/health": 0.01, "/ready": 0.01, "/metrics": 0.0}
+    # Console jobs (process pool)
+    console_workers: int = 2
+    console_max_pending: int = 32
+    console_jobs_per_user: int = 2
+    # Package catalog (SQLite + FTS5)
+    packages_db_path: str = "packages.db"
+    packages_page_size: int = 100
+    packages_max_page_size: int = 1000
+    # VPN client configs (content-addressed file cache, process pool)
+    vpn_cache_dir: str = "vpn-cache"
+    # Tunnel address allocations; unlike the config cache this must persist
+    vpn_address_db_path: str = "vpn-addresses.db"
+    vpn_endpoint: str = "vpn.example.com:51820"
+    vpn_server_public_key: str = ""
+    vpn_dns: str = "10.0.0.2"
+    vpn_key_secret: Optional[str] = None
+    vpn_workers: int = 1
+    vpn_cache_max_files: int = 10000
     
     class Config:
         env_file = ".env"
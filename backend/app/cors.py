@@ -0,0 +1,106 @@
+"""
+CORS with an explicit origin allow-list.
+
+Every allowed origin maps (one dict lookup on the raw header bytes) to
+header tuples built once at startup: one set answering preflights, one
+appended to actual responses. Preflights are answered here, ahead of the
+rest of the stack, and carry a long ``Access-Control-Max-Age`` so browsers
+stop repeating them. A wildcard origin is only accepted without
+credentials, and is then sent as ``*``, never echoed back.
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from . import metrics
+
+CORS_PREFLIGHTS = metrics.counter("cors_preflights", "CORS preflight requests answered", ["outcome"])
+
+Headers = List[Tuple[bytes, bytes]]
+
+DEFAULT_METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE")
+DEFAULT_HEADERS = ("Authorization", "Content-Type", "If-None-Match", "X-Request-Timeout")
+DEFAULT_EXPOSE = ("ETag", "Retry-After", "Content-Disposition")
+
+
+def _pairs(headers: Iterable[Tuple[str, str]]) -> Headers:
+    return [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+class CORSMiddleware:
+    """
+    Answers preflights from an allowed origin with 204 and pre-built
+    headers; preflights from any other origin get a bare 204, which the
+    browser treats as a refusal. Actual responses to allowed origins get
+    ``Access-Control-Allow-Origin`` (plus credentials and exposed headers).
+    """
+
+    def __init__(
+        self,
+        app,
+        allow_origins: Iterable[str] = (),
+        allow_credentials: bool = True,
+        allow_methods: Iterable[str] = DEFAULT_METHODS,
+        allow_headers: Iterable[str] = DEFAULT_HEADERS,
+        expose_headers: Iterable[str] = DEFAULT_EXPOSE,
+        max_age: int = 86400,
+    ):
+        self.app = app
+        origins = [origin.rstrip("/") for origin in allow_origins]
+        self.any_origin = "*" in origins
+        if self.any_origin and allow_credentials:
+            raise ValueError("CORS: a wildcard origin cannot be combined with credentials; list the origins")
+
+        shared = [("Vary", "Origin")]
+        if allow_credentials:
+            shared.append(("Access-Control-Allow-Credentials", "true"))
+        preflight = shared + [
+            ("Access-Control-Allow-Methods", ", ".join(allow_methods)),
+            ("Access-Control-Allow-Headers", ", ".join(allow_headers)),
+            ("Access-Control-Max-Age", str(max_age)),
+        ]
+        simple = shared + ([("Access-Control-Expose-Headers", ", ".join(expose_headers))] if expose_headers else [])
+
+        def build(origin: str) -> Tuple[Headers, Headers]:
+            allow = [("Access-Control-Allow-Origin", origin)]
+            return _pairs(allow + preflight), _pairs(allow + simple)
+
+        self.origins: Dict[bytes, Tuple[Headers, Headers]] = {
+            origin.encode("latin-1"): build(origin) for origin in origins if origin != "*"
+        }
+        self.wildcard = build("*") if self.any_origin else None
+        self.refused: Headers = _pairs([("Vary", "Origin")])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        preflight = False
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                preflight = True
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = self.origins.get(origin) or self.wildcard
+        if preflight and scope["method"] == "OPTIONS":
+            CORS_PREFLIGHTS.labels("allowed" if headers else "refused").inc()
+            await send({"type": "http.response.start", "status": 204,
+                        "headers": list(headers[0] if headers else self.refused)})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        if headers is None:
+            await self.app(scope, receive, send)
+            return
+
+        extra = headers[1]
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *extra]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
@@ -0,0 +1,160 @@
+"""
+Per-request deadlines.
+
+Each HTTP request gets a time budget: the per-route default, shortened by
+the ``X-Request-Timeout`` header (seconds) that HAProxy sets a little under
+its own ``timeout server``. The absolute deadline lives in a contextvar, so
+code anywhere below the request (the Keycloak client, job submission) can
+ask how much time is left without it being passed around. The middleware
+answers 504 when the budget runs out before a response has started, and
+cancels the request task when the client goes away, so no CPU or Keycloak
+connections are spent on answers nobody will read.
+"""
+import asyncio
+import time
+from contextvars import ContextVar, Token
+from typing import Dict, Optional
+
+import httpx
+
+from . import metrics
+
+DEADLINES_EXCEEDED = metrics.counter("request_deadlines_exceeded", "Requests that ran out of time", ["stage"])
+REQUESTS_ABANDONED = metrics.counter("requests_abandoned", "Requests cancelled because the client disconnected")
+
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """The current request's deadline has passed (or will before a call could finish)"""
+
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message)
+
+
+def set_deadline(budget: Optional[float]) -> Token:
+    """Start a deadline ``budget`` seconds from now (``None`` clears it)"""
+    return _deadline.set(None if budget is None else time.monotonic() + budget)
+
+
+def reset(token: Token):
+    _deadline.reset(token)
+
+
+def detach():
+    """Drop the inherited deadline; for background work spawned from a request"""
+    _deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or ``None`` without one"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(default: float) -> float:
+    """``default`` capped by the time left; raises DeadlineExceeded when none is left"""
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        DEADLINES_EXCEEDED.labels("outbound").inc()
+        raise DeadlineExceeded()
+    return min(default, left)
+
+
+def route_budget(path: str, default: float, routes: Dict[str, float]) -> float:
+    """Budget of the longest matching path prefix in ``routes``, else ``default``"""
+    best = ""
+    for prefix in routes:
+        if len(prefix) > len(best) and path.startswith(prefix):
+            best = prefix
+    return routes[best] if best else default
+
+
+class DeadlineMiddleware:
+    """
+    Runs each HTTP request under its deadline.
+
+    The budget is cut off once the response has started (a stream may then
+    run for as long as the client reads it); a disconnect before the
+    response has completed cancels the request wherever it is waiting.
+    """
+
+    BODY = b'{"error":"Request deadline exceeded"}'
+    HEADERS = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(BODY)).encode("latin-1")),
+        (b"cache-control", b"no-store"),
+    ]
+
+    def __init__(self, app, default: float = 45.0, routes: Optional[Dict[str, float]] = None,
+                 header: str = "x-request-timeout"):
+        self.app = app
+        self.default = default
+        self.routes = dict(routes or {})
+        self.header = header.lower().encode("latin-1")
+
+    def budget(self, scope) -> float:
+        budget = route_budget(scope["path"], self.default, self.routes)
+        for name, value in scope["headers"]:
+            if name == self.header:
+                try:
+                    # The header may only shorten the budget
+                    budget = min(budget, max(float(value), 0.0))
+                except ValueError:
+                    pass
+                break
+        return budget
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = self.budget(scope)
+        token = set_deadline(budget)
+        task = asyncio.current_task()
+        messages: asyncio.Queue = asyncio.Queue()
+        started = completed = disconnected = False
+
+        async def watch():
+            nonlocal disconnected
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    if not completed:
+                        disconnected = True
+                        task.cancel()
+                    return
+
+        async def send_wrapper(message):
+            nonlocal started, completed
+            if message["type"] == "http.response.start":
+                started = True
+                # Streams outlive the budget; it only covers producing the answer
+                timer.reschedule(None)
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                completed = True
+            await send(message)
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            async with asyncio.timeout(budget) as timer:
+                await self.app(scope, messages.get, send_wrapper)
+        except TimeoutError:
+            if not timer.expired():
+                raise
+            DEADLINES_EXCEEDED.labels("request").inc()
+            if not started:
+                await send({"type": "http.response.start", "status": 504, "headers": list(self.HEADERS)})
+                await send({"type": "http.response.body", "body": self.BODY})
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+            task.uncancel()
+            REQUESTS_ABANDONED.inc()
+        finally:
+            watcher.cancel()
+            reset(token)
@@ -0,0 +1,412 @@
+"""
+Keycloak login and admin event ingestion.
+
+A poller reads new events from the Admin REST API through the shared
+KeycloakClient and puts them on a bounded queue; a writer drains the queue
+in batches into SQLite. When the writer falls behind the poller blocks on
+the queue, so backpressure never reaches request handlers, which only read.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from . import metrics
+from .config import settings
+from .keycloak import KeycloakClient, keycloak
+
+logger = logging.getLogger(__name__)
+
+EVENTS_INGESTED = metrics.counter("events_ingested", "Keycloak events written to the event store", ["kind"])
+EVENTS_QUEUE_DEPTH = metrics.gauge("events_queue_depth", "Events waiting to be written")
+EVENTS_POLL_ERRORS = metrics.counter("events_poll_errors", "Failed event polls", ["kind"])
+EVENTS_BATCH_SECONDS = metrics.histogram("events_batch_write_seconds", "Event batch write duration")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    user_id TEXT,
+    client_id TEXT,
+    ip_address TEXT,
+    details TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+CREATE INDEX IF NOT EXISTS events_user_time ON events (user_id, time);
+CREATE INDEX IF NOT EXISTS events_type_time ON events (type, time);
+"""
+
+# Row layout shared by the writer and the query helpers
+COLUMNS = ("key", "kind", "time", "type", "user_id", "client_id", "ip_address", "details")
+GROUP_BY = {"type": "type", "user": "user_id", "client": "client_id", "kind": "kind"}
+
+Row = Tuple[Any, ...]
+
+
+def login_event_row(event: Dict[str, Any]) -> Row:
+    return (
+        _event_key("login", event),
+        "login",
+        int(event["time"]),
+        event.get("type", "UNKNOWN"),
+        event.get("userId"),
+        event.get("clientId"),
+        event.get("ipAddress"),
+        json.dumps(event.get("details") or {}, separators=(",", ":")),
+    )
+
+
+def admin_event_row(event: Dict[str, Any]) -> Row:
+    auth = event.get("authDetails") or {}
+    details = {"resourceType": event.get("resourceType"), "resourcePath": event.get("resourcePath")}
+    return (
+        _event_key("admin", event),
+        "admin",
+        int(event["time"]),
+        f"{event.get('operationType', 'UNKNOWN')}:{event.get('resourceType', '')}",
+        auth.get("userId"),
+        auth.get("clientId"),
+        auth.get("ipAddress"),
+        json.dumps(details, separators=(",", ":")),
+    )
+
+
+def _event_key(kind: str, event: Dict[str, Any]) -> str:
+    """Event id when Keycloak provides one, else a digest of the event"""
+    if event.get("id"):
+        return f"{kind}:{event['id']}"
+    canonical = json.dumps(event, sort_keys=True, separators=(",", ":"))
+    return f"{kind}:{hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()}"
+
+
+class EventStore:
+    """
+    SQLite event table.
+
+    Writes and reads each run on their own single-thread executor with a
+    connection owned by that thread; WAL mode lets reads proceed while a
+    batch is being written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._open_executors()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _open_executors(self):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="events-writer")
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="events-reader")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, executor: ThreadPoolExecutor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    # --- writes -------------------------------------------------------
+
+    def _write(self, rows: List[Row]) -> Dict[str, int]:
+        by_kind: Dict[str, List[Row]] = {}
+        for row in rows:
+            by_kind.setdefault(row[1], []).append(row)
+        inserted = {}
+        conn = self._connection()
+        with conn:
+            for kind, kind_rows in by_kind.items():
+                before = conn.total_changes
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    kind_rows,
+                )
+                inserted[kind] = conn.total_changes - before
+        return inserted
+
+    async def write_batch(self, rows: List[Row]) -> Dict[str, int]:
+        """Insert rows in one transaction, skipping events already stored; returns rows inserted per kind"""
+        return await self._run(self._writer, self._write, rows)
+
+    def _latest(self, kind: str) -> Optional[int]:
+        row = self._connection().execute("SELECT MAX(time) FROM events WHERE kind = ?", (kind,)).fetchone()
+        return row[0]
+
+    async def latest_time(self, kind: str) -> Optional[int]:
+        return await self._run(self._writer, self._latest, kind)
+
+    # --- reads --------------------------------------------------------
+
+    def _query(self, sql: str, params: Tuple) -> List[sqlite3.Row]:
+        conn = self._connection()
+        conn.row_factory = sqlite3.Row
+        return conn.execute(sql, params).fetchall()
+
+    async def recent(
+        self,
+        user_id: Optional[str] = None,
+        type: Optional[str] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Newest events first, filtered by user, type and time range (ms)"""
+        where, params = self._filters(user_id, type, since, until)
+        rows = await self._run(
+            self._reader, self._query,
+            f"SELECT {', '.join(COLUMNS[1:])} FROM events{where} ORDER BY time DESC LIMIT ?",
+            (*params, limit),
+        )
+        return [{**dict(row), "details": json.loads(row["details"] or "{}")} for row in rows]
+
+    async def summary(
+        self,
+        group_by: str = "type",
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        type: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """Event counts grouped by type, user, client or kind, largest first"""
+        column = GROUP_BY[group_by]
+        where, params = self._filters(None, type, since, until)
+        rows = await self._run(
+            self._reader, self._query,
+            f"SELECT {column} AS key, COUNT(*) AS count, MIN(time) AS first, MAX(time) AS last "
+            f"FROM events{where} GROUP BY {column} ORDER BY count DESC LIMIT ?",
+            (*params, limit),
+        )
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _filters(user_id, type, since, until) -> Tuple[str, Tuple]:
+        clauses, params = [], []
+        for clause, value in (("user_id = ?", user_id), ("type = ?", type), ("time >= ?", since), ("time < ?", until)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), tuple(params)
+
+    def close(self):
+        """Close both connections; the store reopens them on next use"""
+        for executor in (self._writer, self._reader):
+            executor.submit(self._close_connection).result()
+            executor.shutdown(wait=True)
+        self._open_executors()
+
+    def _close_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class EventIngestor:
+    """
+    Polls login and admin events into an EventStore.
+
+    Keycloak returns events newest first, so each poll pages back until it
+    reaches events at or before the newest one already seen; events at that
+    boundary are skipped by key (and the store's primary key drops any
+    repeat after a restart). Listeners see each new event once, and only
+    events from ``notify_since`` on (ms; default: when the ingestor was
+    created): history caught up on at startup is stored without replaying
+    it to listeners.
+    """
+
+    SOURCES = (("login", "events", login_event_row), ("admin", "admin-events", admin_event_row))
+
+    def __init__(
+        self,
+        client: KeycloakClient,
+        store: EventStore,
+        realm: Optional[str] = None,
+        poll_interval: float = 10.0,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        page_size: int = 200,
+        notify_since: Optional[int] = None,
+    ):
+        self.client = client
+        self.store = store
+        self.realm = realm or client.realm
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.page_size = page_size
+        self.notify_since = int(time.time() * 1000) if notify_since is None else notify_since
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._watermarks: Dict[str, int] = {}
+        self._boundary: Dict[str, set] = {}
+        self.listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]):
+        """Call ``listener(kind, event)`` for every newly seen event"""
+        self.listeners.append(listener)
+
+    async def poll_once(self) -> int:
+        """Queue every event newer than the watermarks; returns events queued"""
+        queued = 0
+        for kind, path, to_row in self.SOURCES:
+            if kind not in self._watermarks:
+                self._watermarks[kind] = await self.store.latest_time(kind) or 0
+            watermark = self._watermarks[kind]
+            boundary = self._boundary.get(kind, set())
+            newest = watermark
+            # Only the newest timestamp's keys and the events to notify are
+            # kept; everything else goes straight to the writer page by page
+            newest_keys: set = set()
+            to_notify = []
+            first = 0
+            try:
+                while True:
+                    response = await self.client.admin_request(
+                        "GET", path, realm=self.realm, params={"first": first, "max": self.page_size}
+                    )
+                    response.raise_for_status()
+                    page = response.json()
+                    for event in page:
+                        if event["time"] < watermark:
+                            break
+                        row = to_row(event)
+                        if row[0] in boundary:
+                            continue
+                        if event["time"] > newest:
+                            newest, newest_keys = event["time"], set()
+                        if event["time"] == newest:
+                            newest_keys.add(row[0])
+                        if event["time"] >= self.notify_since:
+                            to_notify.append(event)
+                        # Blocks when the writer is behind: backpressure on the poller only
+                        await self.queue.put(row)
+                        queued += 1
+                    else:
+                        if len(page) == self.page_size:
+                            first += self.page_size
+                            continue
+                    break
+            except (httpx.HTTPError, ValueError, KeyError) as e:
+                EVENTS_POLL_ERRORS.labels(kind).inc()
+                logger.warning("Polling %s events failed: %s", kind, e)
+                continue
+            # Remember the events sharing the newest timestamp so the next
+            # poll, which starts at that timestamp, skips them
+            self._boundary[kind] = newest_keys | boundary if newest == watermark else newest_keys
+            self._watermarks[kind] = newest
+            EVENTS_QUEUE_DEPTH.set(self.queue.qsize())
+            self._notify(kind, to_notify)
+        return queued
+
+    def _notify(self, kind: str, events: List[Dict[str, Any]]):
+        for event in reversed(events):  # oldest first
+            for listener in self.listeners:
+                try:
+                    listener(kind, event)
+                except Exception:
+                    logger.exception("Event listener failed")
+
+    async def flush(self) -> int:
+        """Write everything currently queued"""
+        written = 0
+        while not self.queue.empty():
+            rows = [self.queue.get_nowait() for _ in range(min(self.batch_size, self.queue.qsize()))]
+            written += await self._write(rows)
+        return written
+
+    async def _write(self, rows: List[Row]) -> int:
+        with EVENTS_BATCH_SECONDS.time():
+            inserted = await self.store.write_batch(rows)
+        for kind, count in inserted.items():
+            if count:
+                EVENTS_INGESTED.labels(kind).inc(count)
+        EVENTS_QUEUE_DEPTH.set(self.queue.qsize())
+        return sum(inserted.values())
+
+    async def _poll_loop(self):
+        delay = self.poll_interval
+        while True:
+            try:
+                await self.poll_once()
+                delay = self.poll_interval
+            except Exception:
+                # Keep polling; back off while the failure persists
+                EVENTS_POLL_ERRORS.labels("all").inc()
+                logger.exception("Event poll failed; retrying in %.0fs", delay)
+                delay = min(delay * 2, self.poll_interval * 30)
+            await asyncio.sleep(delay)
+
+    async def _write_loop(self):
+        while True:
+            rows = []
+            try:
+                rows.append(await self.queue.get())
+                deadline = time.monotonic() + self.flush_interval
+                while len(rows) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        rows.append(await asyncio.wait_for(self.queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Don't lose a half-collected batch on shutdown
+                if rows:
+                    await self._write_logged(rows)
+                raise
+            await self._write_logged(rows)
+
+    async def _write_logged(self, rows: List[Row]):
+        # Any failure drops this batch only; the writer must outlive it or the queue fills up
+        try:
+            await self._write(rows)
+        except Exception:
+            logger.exception("Writing %d events failed", len(rows))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._poll_loop(), name="events-poller"),
+                asyncio.create_task(self._write_loop(), name="events-writer"),
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Flushing queued events on shutdown failed")
+
+
+event_store = EventStore(settings.events_db_path)
+
+event_ingestor = EventIngestor(
+    keycloak,
+    event_store,
+    poll_interval=settings.events_poll_interval,
+    queue_size=settings.events_queue_size,
+    batch_size=settings.events_batch_size,
+)
@@ -0,0 +1,194 @@
+"""
+Background dependency prober behind /health and /ready.
+
+HAProxy polls every backend, so probing Keycloak inline would multiply its
+load by replicas times check rate. Instead one task per worker runs the
+registered checks on its own schedule and keeps a snapshot, with the
+liveness and readiness bodies pre-encoded; the endpoints only pick them up.
+
+Checks return ``(status, details)`` for /api/admin/health and the
+metrics; none of them takes the worker out of rotation. A Keycloak outage
+hits every replica alike and is ridden out on the cached key set, and the
+load shedder already sheds excess load; with a single API server in the
+HAProxy backend a not-ready worker would turn either into a 503 for
+everyone. Readiness therefore only reports startup: 503 until the first
+probe and while warm-up holds it.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from . import metrics
+from .config import settings
+from .jobs import job_manager
+from .keycloak import KeycloakClient, keycloak
+from .load_shedding import AdaptiveLimiter, limiter
+from .resilience import OPEN
+from .tokens import TokenVerifier, token_verifier
+
+logger = logging.getLogger(__name__)
+
+OK, DEGRADED, FAILING = "ok", "degraded", "failing"
+STATUS_VALUES = {OK: 0, DEGRADED: 1, FAILING: 2}
+
+HEALTH_STATUS = metrics.gauge("health_check_status", "Last probe result per check (0 ok, 1 degraded, 2 failing)", ["check"])
+HEALTH_PROBE_SECONDS = metrics.histogram("health_check_seconds", "Duration of each dependency check", ["check"])
+
+Check = Callable[[], Awaitable[Tuple[str, Dict[str, Any]]]]
+
+
+def _encode(data: Dict[str, Any]) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+class HealthProber:
+    """
+    Runs checks every ``interval`` seconds (each bounded by ``timeout``).
+    Liveness fails only when the probe loop itself stops completing, which
+    means the worker is wedged; readiness fails until the first probe and
+    while a startup stage holds it (see ``hold``).
+    """
+
+    STARTING = (503, _encode({"status": "starting"}))
+    HEALTHY = (200, _encode({"status": "healthy"}))
+    UNHEALTHY = (503, _encode({"status": "unhealthy"}))
+    READY = (200, _encode({"status": "ready"}))
+
+    def __init__(self, interval: float = 5.0, timeout: float = 2.0, clock: Callable[[], float] = time.monotonic):
+        self.interval = interval
+        self.timeout = timeout
+        self.clock = clock
+        self.checks: Dict[str, Check] = {}
+        self.snapshot: Dict[str, Any] = {"status": "starting", "checks": {}}
+        self.ready = self.STARTING
+        self.holds: Set[str] = set()
+        self._probed_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add_check(self, name: str, check: Check):
+        self.checks[name] = check
+
+    def hold(self, name: str):
+        """Report not ready (``starting``) until ``release(name)``"""
+        self.holds.add(name)
+
+    def release(self, name: str):
+        self.holds.discard(name)
+
+    async def _run(self, name: str, check: Check) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            status, details = await asyncio.wait_for(check(), self.timeout)
+        except asyncio.TimeoutError:
+            status, details = FAILING, {"error": f"timed out after {self.timeout}s"}
+        except Exception as e:
+            status, details = FAILING, {"error": f"{type(e).__name__}: {e}"}
+        elapsed = time.perf_counter() - start
+        HEALTH_PROBE_SECONDS.labels(name).observe(elapsed)
+        HEALTH_STATUS.labels(name).set(STATUS_VALUES[status])
+        return {"status": status, "latency_ms": round(elapsed * 1000, 3), **details}
+
+    async def probe(self) -> Dict[str, Any]:
+        """Run every check once and publish the new snapshot"""
+        names = list(self.checks)
+        results = dict(zip(names, await asyncio.gather(*(self._run(n, self.checks[n]) for n in names))))
+        worst = max((r["status"] for r in results.values()), key=STATUS_VALUES.__getitem__, default=OK)
+        self.snapshot = {
+            "status": worst,
+            "ready": not self.holds,
+            "holds": sorted(self.holds),
+            "checked_at": time.time(),
+            "checks": results,
+        }
+        self.ready = self.READY
+        self._probed_at = self.clock()
+        return self.snapshot
+
+    def liveness(self) -> Tuple[int, bytes]:
+        if self._probed_at is not None and self.clock() - self._probed_at > 3 * self.interval + self.timeout:
+            return self.UNHEALTHY
+        return self.HEALTHY
+
+    def readiness(self) -> Tuple[int, bytes]:
+        if self.liveness() is self.UNHEALTHY:
+            return self.UNHEALTHY
+        return self.STARTING if self.holds else self.ready
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.probe()
+            except Exception:
+                logger.exception("Health probe failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="health-prober")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+# ----------------------------------------------------------------------
+# Checks
+# ----------------------------------------------------------------------
+
+def keycloak_check(client: KeycloakClient) -> Check:
+    """The realm's public endpoint answers (what HAProxy checks for the Keycloak backend)"""
+    async def check():
+        response = await client.ping()
+        details = {"http_status": response.status_code}
+        return (OK if response.status_code == 200 else FAILING), details
+    return check
+
+
+def jwks_check(verifier: TokenVerifier) -> Check:
+    """Age of the loaded key set against its TTL and stale allowance"""
+    async def check():
+        age = verifier.age
+        if age is None:
+            return OK, {"loaded": False}
+        details = {"loaded": True, "age_s": round(age, 1), "keys": len(verifier.key_set)}
+        if age < verifier.ttl:
+            return OK, details
+        return (DEGRADED if age < verifier.ttl + verifier.max_stale else FAILING), details
+    return check
+
+
+def keycloak_pool_check(client: KeycloakClient, saturation: float) -> Check:
+    """Breaker states and in-flight calls per Keycloak endpoint"""
+    async def check():
+        breakers = {name: breaker.snapshot() for name, breaker in client.breakers.items()}
+        busy = any(b["in_flight"] >= client.max_concurrency * saturation for b in breakers.values())
+        tripped = any(b["state"] == OPEN for b in breakers.values())
+        return (DEGRADED if busy or tripped else OK), {"max_concurrency": client.max_concurrency, "endpoints": breakers}
+    return check
+
+
+def console_jobs_check() -> Check:
+    async def check():
+        active, limit = job_manager.active, job_manager.max_pending
+        return (DEGRADED if active >= limit else OK), {"active": active, "max_pending": limit}
+    return check
+
+
+def requests_check(limiter: AdaptiveLimiter, saturation: float) -> Check:
+    """In-flight requests against the adaptive limit"""
+    async def check():
+        details = {"in_flight": limiter.in_flight, "limit": round(limiter.limit, 1)}
+        return (DEGRADED if limiter.in_flight >= limiter.limit * saturation else OK), details
+    return check
+
+
+health_prober = HealthProber(interval=settings.health_probe_interval, timeout=settings.health_probe_timeout)
+health_prober.add_check("keycloak", keycloak_check(keycloak))
+health_prober.add_check("jwks", jwks_check(token_verifier))
+health_prober.add_check("keycloak_pool", keycloak_pool_check(keycloak, settings.health_saturation))
+health_prober.add_check("console_jobs", console_jobs_check())
+health_prober.add_check("requests", requests_check(limiter, settings.health_saturation))
@@ -0,0 +1,363 @@
+"""
+Console job subsystem.
+
+POST /api/console enqueues a whitelisted console command on a bounded
+process pool and returns a job id at once. Workers stream output lines back
+through one multiprocessing queue; a reader thread hands them to the job on
+the event loop, where status polls and SSE streams pick them up. A job
+that is still queued when the deadline of the request that submitted it
+passes is cancelled instead of started.
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import platform
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from . import deadlines, metrics
+from .config import settings
+
+JOBS_SUBMITTED = metrics.counter("console_jobs_submitted", "Console jobs accepted", ["command"])
+JOBS_REJECTED = metrics.counter("console_jobs_rejected", "Console jobs refused", ["reason"])
+JOBS_FINISHED = metrics.counter("console_jobs_finished", "Console jobs finished", ["status"])
+JOBS_ACTIVE = metrics.gauge("console_jobs_active", "Console jobs queued or running")
+JOB_SECONDS = metrics.histogram(
+    "console_job_seconds", "Console job run time", ["command"], buckets=(0.1, 0.5, 1, 5, 15, 60, 300)
+)
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+TERMINAL = frozenset({SUCCEEDED, FAILED, CANCELLED})
+
+
+class JobRejected(Exception):
+    """Raised when a job cannot be accepted; ``status_code`` is the HTTP answer"""
+
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+        super().__init__(detail)
+
+
+# ----------------------------------------------------------------------
+# Commands (run inside worker processes)
+# ----------------------------------------------------------------------
+
+COMMANDS: Dict[str, Callable[[List[str], Callable[[str], None]], None]] = {}
+
+# Set in each worker process by _init_worker
+_output_queue: Any = None
+_current_job: Optional[str] = None
+
+
+def console_command(name: str):
+    """Register a module-level function as a console command"""
+    def decorator(func):
+        COMMANDS[name] = func
+        return func
+    return decorator
+
+
+@console_command("echo")
+def _echo(args: List[str], emit: Callable[[str], None]):
+    emit(" ".join(args))
+
+
+@console_command("sleep")
+def _sleep(args: List[str], emit: Callable[[str], None]):
+    seconds = min(float(args[0]) if args else 1.0, 60.0)
+    steps = max(int(seconds * 4), 1)
+    for i in range(steps):
+        time.sleep(seconds / steps)
+        emit(f"{(i + 1) * 100 // steps}%")
+
+
+@console_command("hash")
+def _hash(args: List[str], emit: Callable[[str], None]):
+    for arg in args:
+        emit(f"{hashlib.sha256(arg.encode('utf-8')).hexdigest()}  {arg}")
+
+
+@console_command("system-info")
+def _system_info(args: List[str], emit: Callable[[str], None]):
+    emit(f"hostname: {platform.node()}")
+    emit(f"platform: {platform.platform()}")
+    emit(f"cpus: {os.cpu_count()}")
+    if hasattr(os, "getloadavg"):
+        emit("load: " + " ".join(f"{v:.2f}" for v in os.getloadavg()))
+
+
+def _init_worker(output_queue):
+    global _output_queue
+    _output_queue = output_queue
+
+
+def _emit(line: str):
+    _output_queue.put((_current_job, "line", str(line)))
+
+
+def _run_command(job_id: str, command: str, args: List[str], start_by: Optional[float] = None):
+    """
+    Worker entry point. Completion travels on the output queue behind the
+    job's last line, so the parent never sees a job finish before its output.
+    """
+    global _current_job
+    if start_by is not None and time.time() > start_by:
+        _output_queue.put((job_id, "expired", None))
+        return
+    _current_job = job_id
+    _output_queue.put((job_id, "started", None))
+    error = None
+    try:
+        COMMANDS[command](args, _emit)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    finally:
+        _current_job = None
+    _output_queue.put((job_id, "finished", error))
+
+
+# ----------------------------------------------------------------------
+# Jobs (event loop side)
+# ----------------------------------------------------------------------
+
+class Job:
+    """State and buffered output of one console job"""
+
+    def __init__(self, owner: str, command: str, args: List[str], max_output_lines: int,
+                 start_by: Optional[float] = None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.command = command
+        self.args = args
+        self.status = QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        # Wall-clock time (it crosses into the worker) after which the job is not started
+        self.start_by = start_by
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.output: deque = deque(maxlen=max_output_lines)
+        # Total lines ever emitted; with ``output`` it locates a reader's position
+        self.lines_emitted = 0
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def append(self, line: str):
+        self.output.append(line)
+        self.lines_emitted += 1
+        self._notify()
+
+    def lines_since(self, position: int) -> List[str]:
+        """Lines emitted after ``position`` that are still buffered"""
+        first_buffered = self.lines_emitted - len(self.output)
+        start = max(position - first_buffered, 0)
+        return list(self.output)[start:]
+
+    async def wait_changed(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def to_dict(self, include_output: bool = True) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "owner": self.owner,
+            "command": self.command,
+            "args": self.args,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "start_by": self.start_by,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "lines": self.lines_emitted,
+        }
+        if include_output:
+            data["output"] = list(self.output)
+        return data
+
+
+class JobManager:
+    """
+    Accepts jobs within global and per-user limits and runs them on a
+    lazily created process pool.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 2,
+        max_pending: int = 32,
+        per_user_limit: int = 2,
+        max_output_lines: int = 1000,
+        max_jobs: int = 1000,
+    ):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.per_user_limit = per_user_limit
+        self.max_output_lines = max_output_lines
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active_by_user: Dict[str, int] = {}
+        self._active = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._output_queue: Any = None
+        self._reader: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def active(self) -> int:
+        """Jobs queued or running"""
+        return self._active
+
+    # --- pool ---------------------------------------------------------
+
+    def _ensure_pool(self) -> ProcessPoolExecutor:
+        if self._pool is not None:
+            if self._loop is asyncio.get_running_loop():
+                return self._pool
+            # Started under an event loop that has since gone away; its jobs
+            # can no longer report back
+            self.shutdown()
+            for job in list(self.jobs.values()):
+                self._complete(job, CANCELLED)
+        context = multiprocessing.get_context("spawn")
+        self._loop = asyncio.get_running_loop()
+        self._output_queue = context.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self._output_queue,),
+        )
+        self._reader = threading.Thread(target=self._read_output, name="console-output", daemon=True)
+        self._reader.start()
+        return self._pool
+
+    def _read_output(self):
+        while True:
+            message = self._output_queue.get()
+            if message is None:
+                return
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, *message)
+            except RuntimeError:  # loop closed
+                return
+
+    def _dispatch(self, job_id: str, kind: str, data: Optional[str]):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        if kind == "started":
+            job.status = RUNNING
+            job.started_at = time.time()
+            job._notify()
+        elif kind == "line":
+            job.append(data or "")
+        elif kind == "finished":
+            self._complete(job, FAILED if data else SUCCEEDED, data)
+        elif kind == "expired":
+            self._complete(job, CANCELLED, "Request deadline passed before the job started")
+
+    # --- jobs ---------------------------------------------------------
+
+    def submit(self, owner: str, command: str, args: List[str]) -> Job:
+        if command not in COMMANDS:
+            JOBS_REJECTED.labels("unknown_command").inc()
+            raise JobRejected(400, f"Unknown console command {command!r}; available: {sorted(COMMANDS)}")
+        if self._active_by_user.get(owner, 0) >= self.per_user_limit:
+            JOBS_REJECTED.labels("user_limit").inc()
+            raise JobRejected(429, f"At most {self.per_user_limit} console jobs may run per user")
+        if self._active >= self.max_pending:
+            JOBS_REJECTED.labels("queue_full").inc()
+            raise JobRejected(503, "Console job queue is full")
+
+        pool = self._ensure_pool()
+        left = deadlines.remaining()
+        start_by = time.time() + left if left is not None else None
+        job = Job(owner, command, list(args), self.max_output_lines, start_by)
+        self._remember(job)
+        self._active += 1
+        self._active_by_user[owner] = self._active_by_user.get(owner, 0) + 1
+        JOBS_ACTIVE.set(self._active)
+        JOBS_SUBMITTED.labels(command).inc()
+
+        future = pool.submit(_run_command, job.id, command, job.args, start_by)
+        asyncio.wrap_future(future).add_done_callback(lambda f: self._pool_done(job, f))
+        return job
+
+    def _pool_done(self, job: Job, future: "asyncio.Future"):
+        # Normal completion arrives as a "finished" message; only pool-level
+        # failures (cancelled at shutdown, crashed worker) end the job here
+        if future.cancelled():
+            self._complete(job, CANCELLED)
+        elif future.exception() is not None:
+            self._complete(job, FAILED, f"{type(future.exception()).__name__}: {future.exception()}")
+
+    def _complete(self, job: Job, status: str, error: Optional[str] = None):
+        if job.status in TERMINAL:
+            return
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        if job.started_at:
+            JOB_SECONDS.labels(job.command).observe(job.finished_at - job.started_at)
+        JOBS_FINISHED.labels(status).inc()
+
+        self._active -= 1
+        remaining = self._active_by_user.get(job.owner, 1) - 1
+        if remaining:
+            self._active_by_user[job.owner] = remaining
+        else:
+            self._active_by_user.pop(job.owner, None)
+        JOBS_ACTIVE.set(self._active)
+        job._notify()
+
+    def _remember(self, job: Job):
+        self.jobs[job.id] = job
+        if len(self.jobs) > self.max_jobs:
+            for job_id in [i for i, j in self.jobs.items() if j.status in TERMINAL][:len(self.jobs) - self.max_jobs]:
+                del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def stream(self, job: Job, heartbeat: float = 15.0):
+        """Yield server-sent events: every output line, then the final status"""
+        position = 0
+        while True:
+            lines = job.lines_since(position)
+            position = job.lines_emitted
+            for line in lines:
+                yield "event: output\ndata: " + line.replace("\n", "\ndata: ") + "\n\n"
+            if job.status in TERMINAL and position == job.lines_emitted:
+                yield f"event: status\ndata: {job.status}\n\n"
+                return
+            if not lines:
+                await job.wait_changed(heartbeat)
+                if position == job.lines_emitted and job.status not in TERMINAL:
+                    yield ": keep-alive\n\n"
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._output_queue.put(None)
+            self._reader.join(timeout=5)
+            self._pool = None
+            self._reader = None
+
+
+job_manager = JobManager(
+    max_workers=settings.console_workers,
+    max_pending=settings.console_max_pending,
+    per_user_limit=settings.console_jobs_per_user,
+)
@@ -0,0 +1,197 @@
+import asyncio
+import time
+import httpx
+from typing import Any, Dict, Optional
+
+from . import deadlines
+from .config import settings
+from .resilience import CircuitBreaker
+
+
+class KeycloakClient:
+    """
+    Shared HTTP client for the configured Keycloak realm.
+
+    One pooled httpx.AsyncClient is created lazily and reused by every caller,
+    so connections to Keycloak are kept alive across requests. Admin REST API
+    calls share one cached admin token that is refreshed shortly before it
+    expires (or after a 401).
+
+    Every call goes through a per-endpoint CircuitBreaker (``jwks``,
+    ``token``, ``admin``), so a stalled Keycloak fails calls fast
+    instead of tying up request handlers. Within a request, each call's
+    timeout is also capped by the time left before the request deadline.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        realm: str,
+        client_id: str,
+        timeout: float = 5.0,
+        max_connections: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        admin_realm: str = "master",
+        admin_client_id: str = "admin-cli",
+        admin_username: Optional[str] = None,
+        admin_password: Optional[str] = None,
+        admin_client_secret: Optional[str] = None,
+        breaker_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+        max_concurrency: Optional[int] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.realm = realm
+        self.client_id = client_id
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.transport = transport
+        self.admin_realm = admin_realm
+        self.admin_client_id = admin_client_id
+        self.admin_username = admin_username
+        self.admin_password = admin_password
+        self.admin_client_secret = admin_client_secret
+        self._client: Optional[httpx.AsyncClient] = None
+        self._admin_token: Optional[str] = None
+        self._admin_token_expires = 0.0
+        self._admin_lock = asyncio.Lock()
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.max_concurrency = max_concurrency or max_connections
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(
+                endpoint,
+                failure_threshold=self.breaker_threshold,
+                reset_timeout=self.breaker_reset_timeout,
+                max_concurrency=self.max_concurrency,
+                queue_timeout=self.timeout,
+            )
+        return breaker
+
+    @property
+    def realm_url(self) -> str:
+        return f"{self.base_url}/realms/{self.realm}"
+
+    @property
+    def jwks_url(self) -> str:
+        return f"{self.realm_url}/protocol/openid-connect/certs"
+
+    def admin_url(self, path: str = "", realm: Optional[str] = None) -> str:
+        url = f"{self.base_url}/admin/realms/{realm or self.realm}"
+        return f"{url}/{path.lstrip('/')}" if path else url
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def get_jwks(self) -> Dict:
+        """Fetch the realm's JSON Web Key Set"""
+        return await self.breaker("jwks").call(self._fetch_jwks)
+
+    async def _send(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Issue one request with the client timeout, capped by the request deadline"""
+        timeout = deadlines.timeout(self.timeout)
+        try:
+            return await self.http.request(method, url, timeout=timeout, **kwargs)
+        except httpx.TimeoutException as e:
+            if timeout < self.timeout:
+                # Our budget ran out, not Keycloak's patience; keep it off the breaker
+                raise deadlines.DeadlineExceeded() from e
+            raise
+
+    async def ping(self) -> httpx.Response:
+        """GET the realm's public endpoint, bypassing the breakers (for health probes)"""
+        return await self.http.get(self.realm_url)
+
+    async def _fetch_jwks(self) -> Dict:
+        response = await self._send("GET", self.jwks_url)
+        response.raise_for_status()
+        return response.json()
+
+    async def admin_token(self, force: bool = False) -> str:
+        """Return a cached admin access token, fetching a new one when needed"""
+        if not force and self._admin_token and time.monotonic() < self._admin_token_expires:
+            return self._admin_token
+
+        async with self._admin_lock:
+            if not force and self._admin_token and time.monotonic() < self._admin_token_expires:
+                return self._admin_token
+
+            data: Dict[str, Any] = {"client_id": self.admin_client_id}
+            if self.admin_client_secret:
+                data.update(grant_type="client_credentials", client_secret=self.admin_client_secret)
+            else:
+                data.update(grant_type="password", username=self.admin_username, password=self.admin_password)
+
+            response = await self.breaker("token").call(
+                self._send,
+                "POST",
+                f"{self.base_url}/realms/{self.admin_realm}/protocol/openid-connect/token",
+                data=data,
+            )
+            response.raise_for_status()
+            payload = response.json()
+            self._admin_token = payload["access_token"]
+            # Refresh a little early so in-flight calls never carry an expired token
+            self._admin_token_expires = time.monotonic() + max(payload.get("expires_in", 60) - 30, 5)
+            return self._admin_token
+
+    async def admin_request(self, method: str, path: str = "", realm: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        """
+        Call the Admin REST API for ``realm`` (the configured realm by default).
+
+        ``path`` is relative to ``/admin/realms/{realm}``. A 401 triggers one
+        retry with a fresh token. The response is returned as-is.
+        """
+        return await self.admin_call(method, self.admin_url(path, realm), **kwargs)
+
+    async def admin_call(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Call an Admin REST API ``url`` as :meth:`admin_request` does (for URLs outside one realm)"""
+        extra_headers = kwargs.pop("headers", {})
+        for attempt in range(2):
+            token = await self.admin_token(force=attempt > 0)
+            headers = {**extra_headers, "Authorization": f"Bearer {token}"}
+            response = await self.breaker("admin").call(self._send, method, url, headers=headers, **kwargs)
+            if response.status_code != 401:
+                break
+        return response
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def keycloak_client(base_url: Optional[str] = None) -> KeycloakClient:
+    """A client configured from settings, optionally for another Keycloak URL"""
+    return KeycloakClient(
+        base_url or settings.keycloak_url,
+        settings.keycloak_realm,
+        settings.client_id,
+        timeout=settings.keycloak_timeout,
+        max_connections=settings.keycloak_max_connections,
+        admin_realm=settings.keycloak_admin_realm,
+        admin_client_id=settings.keycloak_admin_client_id,
+        admin_username=settings.keycloak_admin_username,
+        admin_password=settings.keycloak_admin_password,
+        admin_client_secret=settings.keycloak_admin_client_secret,
+        breaker_threshold=settings.keycloak_breaker_threshold,
+        breaker_reset_timeout=settings.keycloak_breaker_reset_timeout,
+        max_concurrency=settings.keycloak_max_concurrency,
+    )
+
+
+keycloak = keycloak_client()
@@ -0,0 +1,184 @@
+"""
+Adaptive concurrency limit and priority-aware load shedding.
+
+The limiter follows AIMD: every completed request is a latency sample; the
+limit grows by about one for each limit's worth of fast completions while it
+is being used, and shrinks by ``backoff`` (at most once per cool-down) when
+latency climbs past ``tolerance`` times the no-load baseline observed for
+that kind of request (routes differ too much to share one baseline). Each
+priority class may fill a different share of the limit, so low-priority work
+is shed first and health checks keep answering until the worker is truly
+saturated. Shed requests get a pre-encoded 503 without touching the app.
+"""
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from . import metrics
+from .config import settings
+
+HIGH, NORMAL, LOW = "high", "normal", "low"
+
+CONCURRENCY_LIMIT = metrics.gauge("concurrency_limit", "Adaptive in-flight request limit")
+REQUESTS_IN_FLIGHT = metrics.gauge("requests_in_flight", "Requests being handled")
+REQUESTS_SHED = metrics.counter("requests_shed", "Requests rejected by load shedding", ["priority"])
+
+# Share of the limit each class may fill before it is shed
+DEFAULT_SHARES = {HIGH: 1.5, NORMAL: 1.0, LOW: 0.7}
+
+HIGH_PRIORITY_PREFIXES = ("/health", "/ready", "/api/admin")
+# Never counted nor shed: a scrape must see the worker as it is, not itself,
+# and a profile runs for as long as it was asked to (startup warm-up requests
+# are skipped too, so they seed no latency baselines)
+EXEMPT_PATHS = frozenset({"/metrics", "/debug/profile"})
+LOW_PRIORITY_ROUTES = (("POST", "/api/console"), ("POST", "/api/vpn"))
+
+
+def latency_key(method: str, path: str) -> str:
+    """Coarse request kind for latency baselines: method plus up to three path segments"""
+    return method + " " + "/".join(path.split("/", 4)[:4])
+
+
+def classify(method: str, path: str) -> str:
+    if path.startswith(HIGH_PRIORITY_PREFIXES):
+        return HIGH
+    if (method, path.rstrip("/") or "/") in LOW_PRIORITY_ROUTES:
+        return LOW
+    return NORMAL
+
+
+class AdaptiveLimiter:
+    """AIMD in-flight limit driven by request latency"""
+
+    def __init__(
+        self,
+        initial_limit: float = 100,
+        min_limit: float = 10,
+        max_limit: float = 1000,
+        tolerance: float = 2.0,
+        backoff: float = 0.9,
+        min_latency: float = 0.005,
+        max_keys: int = 256,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        # Latency below this never counts as congestion (timer noise on tiny handlers)
+        self.min_latency = min_latency
+        self.max_keys = max_keys
+        self.clock = clock
+        self.in_flight = 0
+        self.baselines: Dict[str, float] = {}
+        self._last_decrease = 0.0
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    def try_acquire(self, share: float = 1.0) -> bool:
+        if self.in_flight >= self.limit * share:
+            return False
+        self.in_flight += 1
+        REQUESTS_IN_FLIGHT.set(self.in_flight)
+        return True
+
+    def _baseline(self, key: str, latency: float) -> float:
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            if len(self.baselines) >= self.max_keys:
+                key = "other"
+                baseline = self.baselines.get(key)
+        if baseline is None or latency < baseline:
+            baseline = latency
+        else:
+            # Drift upwards slowly so a permanently slower route is not read as overload forever
+            baseline += (latency - baseline) * 0.001
+        self.baselines[key] = baseline
+        return baseline
+
+    def release(self, latency: float, failed: bool = False, key: str = ""):
+        """Give back a slot and adjust the limit from the request's latency"""
+        utilized = self.in_flight >= self.limit / 2
+        self.in_flight -= 1
+        REQUESTS_IN_FLIGHT.set(self.in_flight)
+
+        baseline = self._baseline(key, latency)
+        congested = latency > max(baseline * self.tolerance, self.min_latency)
+        if failed or congested:
+            now = self.clock()
+            # One decrease per round trip: a burst of slow completions is one signal
+            if now - self._last_decrease >= max(latency, 0.1):
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+        elif utilized:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        CONCURRENCY_LIMIT.set(self.limit)
+
+
+def _encode_headers(headers: Iterable[Tuple[str, str]]):
+    return [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+
+class LoadSheddingMiddleware:
+    """
+    Admits a request when its priority class has room under the limiter,
+    else answers 503 at once. A slot is held until the response starts, so
+    long-lived streams (SSE) do not pin the limit for their whole lifetime.
+    """
+
+    BODY = b'{"error":"Server is overloaded, retry later"}'
+
+    def __init__(self, app, limiter: AdaptiveLimiter, retry_after: int = 1,
+                 shares: Optional[dict] = None, classify: Callable[[str, str], str] = classify):
+        self.app = app
+        self.limiter = limiter
+        self.shares = {**DEFAULT_SHARES, **(shares or {})}
+        self.classify = classify
+        self._headers = _encode_headers([
+            ("content-type", "application/json"),
+            ("content-length", str(len(self.BODY))),
+            ("retry-after", str(retry_after)),
+            ("cache-control", "no-store"),
+        ])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope.get("state", {}).get("warmup"):
+            await self.app(scope, receive, send)
+            return
+
+        priority = self.classify(scope["method"], scope["path"])
+        if not self.limiter.try_acquire(self.shares[priority]):
+            REQUESTS_SHED.labels(priority).inc()
+            # Outer middleware (CORS) may append to the header list; hand out a copy
+            await send({"type": "http.response.start", "status": 503, "headers": list(self._headers)})
+            await send({"type": "http.response.body", "body": self.BODY})
+            return
+
+        key = latency_key(scope["method"], scope["path"])
+        start = time.perf_counter()
+        released = False
+
+        def release(failed: bool):
+            nonlocal released
+            if not released:
+                released = True
+                self.limiter.release(time.perf_counter() - start, failed, key)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                # Only latency steers the limit: a fast 503 from a Keycloak
+                # outage says nothing about this worker's capacity
+                release(False)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release(True)
+
+
+limiter = AdaptiveLimiter(
+    settings.concurrency_initial_limit,
+    min_limit=settings.concurrency_min_limit,
+    max_limit=settings.concurrency_max_limit,
+    tolerance=settings.concurrency_latency_tolerance,
+)
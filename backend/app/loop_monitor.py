@@ -0,0 +1,146 @@
+"""
+Event-loop health.
+
+A monitor task sleeps ``interval`` seconds at a time and records how late it
+wakes up: that lag is how long any ready callback had to wait for the loop,
+and is exported as a histogram. Each wake-up also stamps a heartbeat, which
+a watchdog thread checks. When the heartbeat falls more than
+``block_threshold`` behind, the loop is stuck in one callback; the watchdog
+captures the loop thread's stack while it is still blocking (the culprit,
+not whatever runs after it), logs it and keeps it for the admin endpoint.
+
+``lagging()`` tells whether the loop is congested past ``offload_lag``; the
+token verifier then moves signature checks to a worker thread.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from . import metrics
+from .config import settings
+from .profiling import frame_stack
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a scheduled callback",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = metrics.counter("event_loop_blocked", "Callbacks that blocked the event loop past the threshold")
+
+
+class LoopMonitor:
+    """Lag histogram, blocked-callback watchdog and the offload signal"""
+
+    def __init__(
+        self,
+        interval: float = 0.1,
+        block_threshold: float = 0.25,
+        offload_lag: Optional[float] = None,
+        keep: int = 20,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.offload_lag = offload_lag
+        self.clock = clock
+        # Rises at once with a lag spike and decays over a few intervals, so
+        # offloading does not flap on every other tick
+        self.lag = 0.0
+        self.slow_callbacks: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._beat: Optional[float] = None
+        self._open: Optional[Dict[str, Any]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def lagging(self) -> bool:
+        return self.offload_lag is not None and self.lag > self.offload_lag
+
+    def tick(self, lag: float):
+        """Record one measurement and stamp the heartbeat"""
+        LOOP_LAG.observe(lag)
+        self.lag = lag if lag > self.lag else self.lag * 0.8 + lag * 0.2
+        if self._open is not None:
+            # The blocking callback has returned; the lag is how long it ran
+            self._open["blocked_for"] = round(max(lag, self._open["blocked_for"]), 4)
+            self._open = None
+        self._beat = self.clock()
+
+    async def _run(self):
+        while True:
+            expected = self.clock() + self.interval
+            await asyncio.sleep(self.interval)
+            self.tick(max(0.0, self.clock() - expected))
+
+    def check(self):
+        """Watchdog step: capture the loop's stack if it is blocked past the threshold"""
+        beat = self._beat
+        if beat is None or self._open is not None:
+            return
+        blocked = self.clock() - beat - self.interval
+        if blocked < self.block_threshold:
+            return
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return
+        task = asyncio.current_task(self._loop)
+        record = {
+            "at": time.time(),
+            "blocked_for": round(blocked, 4),
+            "task": task.get_name() if task is not None else None,
+            "stack": frame_stack(frame),
+        }
+        self._open = record
+        self.slow_callbacks.appendleft(record)
+        LOOP_BLOCKED.inc()
+        logger.warning(
+            "Event loop blocked for %.3fs (task %s) in:\n  %s",
+            blocked, record["task"], "\n  ".join(record["stack"][-8:]),
+        )
+
+    def _watch(self):
+        while not self._stop.wait(self.block_threshold / 2):
+            self.check()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "lag": round(self.lag, 4),
+            "offloading": self.lagging(),
+            "block_threshold": self.block_threshold,
+            "slow_callbacks": list(self.slow_callbacks),
+        }
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = self.clock()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.to_thread(self._watchdog.join)
+        self._task = self._watchdog = None
+        self._beat = None
+
+
+loop_monitor = LoopMonitor(
+    interval=settings.loop_monitor_interval,
+    block_threshold=settings.loop_block_threshold,
+    offload_lag=settings.loop_offload_lag,
+)
@@ -1,61 +1,254 @@
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from typing import Dict
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from typing import Dict, Literal, Optional
 
-from .models import UserInfo, ErrorResponse
-from .auth import get_current_user, require_admin, require_role
+from .models import UserInfo, ErrorResponse, AuthzCheckRequest, AuthzCheckResponse, ConsoleCommandRequest, PackageCreate
+from .auth import ADMIN_POLICY, get_current_user, require_admin, require_role
 from .config import settings
+from . import authz, metrics
+from .cache import cached_response, conditional_response, if_none_match, invalidates, not_modified, principal_etag, response_cache
+from .access_log import AccessLogMiddleware, access_log
+from .compression import CompressionMiddleware
+from .cors import CORSMiddleware
+from .audit import audit_log
+from .deadlines import DeadlineMiddleware
+from .events import event_ingestor, event_store
+from .jobs import JobRejected, job_manager
+from .health import health_prober
+from .load_shedding import LoadSheddingMiddleware, limiter
+from .loop_monitor import loop_monitor
+from .memory import TracemallocNotRunning, memory_diagnostics
+from .packages import CatalogError, decode_cursor, match_expression, package_catalog, projection, visible_to
+from .profiling import ProfilerBusy, profiler
+from .push import push_hub
+from .tokens import token_verifier
+from .vpn import vpn_configs
+from .warmup import WarmUp, default_steps
+from .keycloak import keycloak
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background workers and release shared clients on shutdown"""
+    access_log.start()
+    audit_log.start()
+    if settings.events_enabled:
+        event_ingestor.start()
+    health_prober.start()
+    if settings.loop_monitor_enabled:
+        loop_monitor.start()
+    warm_up = None
+    if settings.warmup_enabled:
+        steps = default_steps(app, connections=settings.warmup_keycloak_connections)
+        warm_up = asyncio.create_task(WarmUp(steps, health_prober, settings.warmup_step_timeout).run())
+    try:
+        yield
+    finally:
+        if warm_up is not None:
+            warm_up.cancel()
+            await asyncio.gather(warm_up, return_exceptions=True)
+        await health_prober.stop()
+        await loop_monitor.stop()
+        # End open push streams so the server is not left waiting on them
+        push_hub.publish("shutdown", {}, close=True)
+        await event_ingestor.stop()
+        await asyncio.to_thread(event_store.close)
+        await asyncio.to_thread(package_catalog.close)
+        await asyncio.to_thread(job_manager.shutdown)
+        await asyncio.to_thread(vpn_configs.shutdown)
+        audit_log.stop()
+        access_log.stop()
+        await keycloak.aclose()
+
+
+# Logouts and role-mapping changes seen by the event ingestor reach push streams
+event_ingestor.add_listener(push_hub.on_keycloak_event)
+# ... and users granted a VPN role get their config generated ahead of time
+event_ingestor.add_listener(vpn_configs.on_keycloak_event)
+# While the event loop lags, token signature checks move to a worker thread
+if settings.loop_monitor_enabled and settings.loop_offload_lag is not None:
+    token_verifier.offload = loop_monitor.lagging
+
 
 app = FastAPI(
     title=settings.app_name,
     description="API with JWT authentication (validated by HAProxy)",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+# Load shedding (innermost, so CORS preflights are never shed and shed
+# responses still carry CORS headers and reach the access log)
+if settings.shed_enabled:
+    app.add_middleware(
+        LoadSheddingMiddleware,
+        limiter=limiter,
+        retry_after=settings.shed_retry_after,
+    )
+
+# Request deadlines (outside load shedding, which then never sees a request
+# whose client has gone; inside CORS, so a 504 still carries CORS headers)
+app.add_middleware(
+    DeadlineMiddleware,
+    default=settings.request_timeout,
+    routes=settings.request_timeouts,
+    header=settings.request_timeout_header,
 )
 
-# CORS middleware
+# Compression (inside the access log, so logged latency includes the time
+# spent compressing; cached bodies arrive precompressed and pass through)
+if settings.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        min_size=settings.compression_min_size,
+        flush_bytes=settings.compression_flush_bytes,
+    )
+
+# Access log (sees the final status and full latency of everything but preflights)
+app.add_middleware(AccessLogMiddleware, sample_rates=settings.access_log_sample_rates)
+
+# CORS (outermost, so preflights are answered before any other work)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=settings.cors_allow_origins,
+    allow_credentials=settings.cors_allow_credentials,
+    max_age=settings.cors_max_age,
 )
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
+    """Liveness: fails only when the background prober has stopped completing"""
+    status_code, body = health_prober.liveness()
+    return Response(content=body, status_code=status_code, media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness: 503 until the prober's first run and while startup warm-up holds it"""
+    status_code, body = health_prober.readiness()
+    return Response(content=body, status_code=status_code, media_type="application/json",
+                    headers={"Cache-Control": "no-store"})
+
+@app.get("/api/admin/health")
+async def health_details(current_user: Dict = Depends(require_admin)):
+    """
+    Last dependency snapshot with per-check details - requires admin role
+    """
+    return health_prober.snapshot
+
+@app.get("/api/admin/loop")
+async def loop_details(current_user: Dict = Depends(require_admin)):
+    """
+    Event-loop lag and the stacks of recent blocking callbacks - requires admin role
+    """
+    return loop_monitor.snapshot()
+
+@app.get("/api/admin/memory")
+async def memory_details(current_user: Dict = Depends(require_admin)):
+    """
+    This worker's RSS, GC generations, cache sizes and tracemalloc state - requires admin role
+    """
+    return memory_diagnostics.report()
+
+@app.post("/api/admin/memory/tracemalloc/start")
+async def start_tracemalloc(
+    frames: Optional[int] = Query(None, ge=1, le=100),
+    current_user: Dict = Depends(require_admin)
+):
+    """
+    Start tracing allocations on this worker - requires admin role
+    """
+    return {"started": memory_diagnostics.start_tracing(frames)}
+
+@app.post("/api/admin/memory/tracemalloc/stop")
+async def stop_tracemalloc(current_user: Dict = Depends(require_admin)):
+    """
+    Stop tracing allocations and free the traces - requires admin role
+    """
+    return {"stopped": memory_diagnostics.stop_tracing()}
+
+@app.get("/api/admin/memory/allocations")
+async def memory_allocations(
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+    limit: int = Query(20, ge=1, le=500),
+    diff: bool = False,
+    current_user: Dict = Depends(require_admin)
+):
+    """
+    Top allocation sites from a new tracemalloc snapshot - requires admin role
+
+    With ``diff`` the largest changes since the previous snapshot are listed
+    instead. 409 while tracemalloc is not running.
+    """
+    try:
+        return await memory_diagnostics.allocations(group_by, limit, diff)
+    except TracemallocNotRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics (not routed by HAProxy; scrape on the internal network)"""
+    memory_diagnostics.collect()
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/profile", include_in_schema=False)
+async def debug_profile(
+    seconds: float = Query(10.0, gt=0, le=settings.profile_max_seconds),
+    format: Literal["collapsed", "speedscope"] = "collapsed",
+    mode: Literal["cpu", "wall"] = "cpu",
+    current_user: Dict = Depends(require_admin)
+):
+    """
+    Sample this worker's event loop for ``seconds`` - requires admin role
+
+    Not routed by HAProxy: call the worker to be profiled directly. ``cpu``
+    records what the loop is running, ``wall`` adds where every suspended
+    task is awaiting. Only one profile runs at a time (409 otherwise).
+    """
+    try:
+        profile = await profiler.run(seconds, mode)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    headers = {"Cache-Control": "no-store"}
+    if format == "speedscope":
+        return JSONResponse(profile.speedscope(f"worker {os.getpid()}"), headers=headers)
+    return Response(content=profile.collapsed(), media_type="text/plain; charset=utf-8", headers=headers)
 
 @app.get("/api/user/me", response_model=UserInfo)
-async def get_user_info(current_user: Dict = Depends(get_current_user)):
+async def get_user_info(request: Request, current_user: Dict = Depends(get_current_user)):
     """
     Get current user information from HAProxy headers
     """
-    # Extract roles from realm_access field
-    realm_access = current_user.get("realm_access", {})
-    roles = realm_access.get("roles", [])
+    def build():
+        # Extract roles from realm_access field
+        realm_access = current_user.get("realm_access", {})
+        roles = realm_access.get("roles", [])
+        
+        return UserInfo(
+            username=current_user.get("preferred_username", ""),
+            email=current_user.get("email"),
+            roles=roles,
+            first_name=current_user.get("given_name"),
+            last_name=current_user.get("family_name")
+        )
     
-    return UserInfo(
-        username=current_user.get("preferred_username", ""),
-        email=current_user.get("email"),
-        roles=roles,
-        first_name=current_user.get("given_name"),
-        last_name=current_user.get("family_name")
-    )
+    return conditional_response(request, principal_etag(current_user, "user-me"), build)
 
 @app.get("/api/dashboard")
-async def dashboard(current_user: Dict = Depends(get_current_user)):
+async def dashboard(request: Request, current_user: Dict = Depends(get_current_user)):
     """
     Dashboard endpoint - requires authentication
     """
-    return {
+    return conditional_response(request, principal_etag(current_user, "dashboard"), lambda: {
         "message": f"Welcome to the dashboard, {current_user.get('preferred_username')}!",
         "user": current_user.get("preferred_username"),
         "roles": current_user.get("realm_access", {}).get("roles", []),
         "issuer": current_user.get("iss"),
         "email": current_user.get("email")
-    }
+    })
 
 @app.get("/api/admin")
 async def admin_endpoint(current_user: Dict = Depends(require_admin)):
@@ -68,31 +261,106 @@ async def admin_endpoint(current_user: Dict = Depends(require_admin)):
         "roles": current_user.get("realm_access", {}).get("roles", [])
     }
 
+# Push channel
+@app.get("/api/events/stream")
+async def event_stream(current_user: Dict = Depends(get_current_user)):
+    """
+    Server-sent events for the current user: role-change, logout,
+    token-expiring (when the token's expiry is known) and keep-alives
+    """
+    return StreamingResponse(
+        push_hub.stream(current_user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Keycloak event endpoints (times are epoch milliseconds)
+@app.get("/api/admin/events")
+async def list_events(
+    user_id: Optional[str] = None,
+    type: Optional[str] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: Dict = Depends(require_admin)
+):
+    """
+    Recent login and admin events, newest first - requires admin role
+    """
+    return {"events": await event_store.recent(user_id, type, since, until, limit)}
+
+@app.get("/api/admin/events/summary")
+async def events_summary(
+    group_by: Literal["type", "user", "client", "kind"] = "type",
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    type: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: Dict = Depends(require_admin)
+):
+    """
+    Event counts grouped by type, user, client or kind - requires admin role
+    """
+    return {"group_by": group_by, "counts": await event_store.summary(group_by, since, until, type, limit)}
+
 # Packages endpoints
 @app.get("/api/packages")
-async def get_packages(current_user: Dict = Depends(require_role("view_dashboard", "packages_viewer"))):
+async def get_packages(
+    q: Optional[str] = Query(None, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.packages_page_size, ge=1, le=settings.packages_max_page_size),
+    fields: Optional[str] = None,
+    current_user: Dict = Depends(require_role("view_dashboard", "packages_viewer", permission="packages:read"))
+):
     """
     Get packages - requires view_dashboard or packages_viewer role
+
+    Keyset-paginated: pass ``next_cursor`` from one page as ``cursor`` for
+    the next. ``q`` searches names and descriptions, ``fields`` selects
+    members. Only packages visible to the caller's roles are listed.
     """
-    return {
-        "message": "Packages retrieved successfully",
-        "user": current_user.get("preferred_username"),
-        "packages": []  # Add your packages logic here
-    }
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        if q:
+            match_expression(q)
+        columns = projection(fields)
+    except CatalogError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
-@app.post("/api/packages")
-async def create_package(current_user: Dict = Depends(require_role("packages_editor", "packages_admin"))):
+    head = {"message": "Packages retrieved successfully", "user": current_user.get("preferred_username")}
+    return StreamingResponse(
+        package_catalog.stream_page(head, visible_to(current_user), q or None, after, limit, columns),
+        media_type="application/json",
+        headers={"Cache-Control": "private, no-cache"},
+    )
+
+@app.post("/api/packages", status_code=status.HTTP_201_CREATED)
+async def create_package(
+    body: PackageCreate,
+    current_user: Dict = Depends(require_role("packages_editor", "packages_admin", permission="packages:write"))
+):
     """
     Create package - requires packages_editor or packages_admin role
+
+    Callers may only create packages at a visibility they can read.
     """
+    if body.visibility not in visible_to(current_user):
+        raise HTTPException(status_code=403, detail=f"Not allowed to create {body.visibility} packages")
+    try:
+        package = await package_catalog.add(body.model_dump(), created_by=current_user.get("preferred_username"))
+    except CatalogError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
     return {
         "message": "Package created successfully",
-        "user": current_user.get("preferred_username")
+        "user": current_user.get("preferred_username"),
+        "package": package,
     }
 
 # VPN endpoints
 @app.get("/api/vpn")
-async def get_vpn(current_user: Dict = Depends(require_role("vpn_user", "vpn_viewer"))):
+@cached_response(response_cache, "vpn")
+async def get_vpn(current_user: Dict = Depends(require_role("vpn_user", "vpn_viewer", permission="vpn:read"))):
     """
     Get VPN information - requires vpn_user or vpn_viewer role
     """
@@ -103,18 +371,48 @@ async def get_vpn(current_user: Dict = Depends(require_role("vpn_user", "vpn_vie
     }
 
 @app.post("/api/vpn")
-async def create_vpn_config(current_user: Dict = Depends(require_role("vpn_user", "vpn_admin"))):
+@invalidates(response_cache, "vpn")
+async def create_vpn_config(current_user: Dict = Depends(require_role("vpn_user", "vpn_admin", permission="vpn:write", audit=True))):
     """
     Create VPN configuration - requires vpn_user or vpn_admin role
+
+    Generation is idempotent: an unchanged user and role set maps to the
+    same cached file, which GET /api/vpn/config then serves.
     """
+    path = await vpn_configs.get(current_user)
     return {
         "message": "VPN configuration created successfully",
-        "user": current_user.get("preferred_username")
+        "user": current_user.get("preferred_username"),
+        "config_id": os.path.basename(path).removesuffix(".conf"),
     }
 
+@app.get("/api/vpn/config")
+async def download_vpn_config(
+    request: Request,
+    current_user: Dict = Depends(require_role("vpn_user", "vpn_admin", permission="vpn:write", audit=True)),
+):
+    """
+    Download the caller's WireGuard config - requires vpn_user or vpn_admin role
+    """
+    config_id, content = await vpn_configs.read(current_user)
+    etag = f'"{config_id}"'
+    if if_none_match(request, etag):
+        return not_modified(etag, "private, no-store")
+    filename = f"{current_user.get('preferred_username') or 'client'}.conf"
+    return Response(
+        content,
+        media_type="text/plain",
+        headers={
+            "ETag": etag,
+            "Cache-Control": "private, no-store",
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
+
 # Console endpoints
 @app.get("/api/console")
-async def get_console(current_user: Dict = Depends(require_role("console_accesser", "console_viewer"))):
+@cached_response(response_cache, "console")
+async def get_console(current_user: Dict = Depends(require_role("console_accesser", "console_viewer", permission="console:read"))):
     """
     Get console access - requires console_accesser or console_viewer role
     """
@@ -124,22 +422,87 @@ async def get_console(current_user: Dict = Depends(require_role("console_accesse
         "console": {}  # Add your console logic here
     }
 
-@app.post("/api/console")
-async def execute_console_command(current_user: Dict = Depends(require_role("console_accesser", "console_admin"))):
+@app.post("/api/console", status_code=status.HTTP_202_ACCEPTED)
+@invalidates(response_cache, "console")
+async def execute_console_command(
+    body: Optional[ConsoleCommandRequest] = None,
+    current_user: Dict = Depends(require_role("console_accesser", "console_admin", permission="console:execute", audit=True))
+):
     """
-    Execute console command - requires console_accesser or console_admin role
+    Execute console command - requires console_accesser or console_admin role.
+    The command is queued on the worker pool; poll or stream the returned job.
     """
+    body = body or ConsoleCommandRequest()
+    try:
+        job = job_manager.submit(current_user.get("sub") or "", body.command, body.args)
+    except JobRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
     return {
-        "message": "Console command executed successfully",
-        "user": current_user.get("preferred_username")
+        "message": "Console command queued",
+        "user": current_user.get("preferred_username"),
+        "job_id": job.id,
+        "status": job.status
     }
 
+def _console_job(job_id: str, current_user: Dict):
+    """Look up a job visible to the caller (its owner, or an admin)"""
+    job = job_manager.get(job_id)
+    if job is None or (job.owner != current_user.get("sub") and not ADMIN_POLICY.allows(current_user)):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/console/jobs/{job_id}")
+async def get_console_job(
+    job_id: str,
+    current_user: Dict = Depends(require_role("console_accesser", "console_admin"))
+):
+    """
+    Console job status and buffered output
+    """
+    return _console_job(job_id, current_user).to_dict()
+
+@app.get("/api/console/jobs/{job_id}/stream")
+async def stream_console_job(
+    job_id: str,
+    current_user: Dict = Depends(require_role("console_accesser", "console_admin"))
+):
+    """
+    Console job output as server-sent events, ending with the final status
+    """
+    job = _console_job(job_id, current_user)
+    return StreamingResponse(
+        job_manager.stream(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Authorization endpoints
+@app.post("/api/authz/check", response_model=AuthzCheckResponse)
+async def check_authorization(body: AuthzCheckRequest, current_user: Dict = Depends(get_current_user)):
+    """
+    Evaluate several (method, path) pairs and/or permission names at once
+    against the same policies the endpoints enforce
+    """
+    routes = []
+    permissions = []
+    for check in body.checks:
+        if check.permission:
+            permissions.append(check.permission)
+        elif check.method and check.path:
+            routes.append((check.method, check.path))
+        else:
+            raise HTTPException(status_code=400, detail="Each check needs a permission or a method and path")
+    
+    return AuthzCheckResponse(allowed=authz.evaluate(app, current_user, routes, permissions))
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     return JSONResponse(
         status_code=exc.status_code,
-        content={"error": exc.detail}
+        content={"error": exc.detail},
+        headers=getattr(exc, "headers", None)
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,254 @@
+"""
+Memory diagnostics for the serving worker.
+
+Process RSS and garbage-collector generation stats are exported as gauges,
+refreshed on each ``/metrics`` scrape. Every named in-process cache reports
+its entry count and an estimated size: exact where the cache keeps byte
+accounting, else the deep size of a sample of entries scaled to the count,
+so reporting stays cheap for large caches. tracemalloc is off unless an
+admin starts it (it slows allocation and holds a traceback per block);
+while on, snapshots give the top allocation sites and the difference
+from the previous snapshot.
+"""
+import asyncio
+import gc
+import itertools
+import os
+import sys
+import tracemalloc
+import types
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from . import authz, metrics
+from .cache import response_cache
+from .config import settings
+from .jobs import job_manager
+from .tokens import token_verifier
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None  # type: ignore[assignment]
+
+PROCESS_RSS = metrics.gauge("process_resident_memory_bytes", "Resident set size of this worker")
+PROCESS_PEAK_RSS = metrics.gauge("process_peak_resident_memory_bytes", "Peak resident set size of this worker")
+GC_COLLECTIONS = metrics.gauge("python_gc_collections", "Garbage collections run, by generation", ["generation"])
+GC_COLLECTED = metrics.gauge("python_gc_collected_objects", "Objects collected, by generation", ["generation"])
+GC_UNCOLLECTABLE = metrics.gauge("python_gc_uncollectable_objects", "Uncollectable objects found, by generation", ["generation"])
+GC_PENDING = metrics.gauge("python_gc_pending_objects", "Allocations counted towards the next collection, by generation", ["generation"])
+CACHE_ENTRIES = metrics.gauge("cache_entries", "Entries held by an in-process cache", ["cache"])
+CACHE_BYTES = metrics.gauge("cache_bytes", "Estimated bytes held by an in-process cache", ["cache"])
+
+# Sizer: returns (entries, estimated bytes)
+Sizer = Callable[[], Tuple[int, int]]
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+# Entries measured to estimate a cache without byte accounting
+SAMPLE_SIZE = 32
+
+
+class TracemallocNotRunning(Exception):
+    """Raised when allocation statistics are asked for while tracemalloc is off"""
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size (Linux), or ``None`` where it cannot be read"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def deep_size(obj: Any) -> int:
+    """Bytes of ``obj`` and everything reachable through containers and instance attributes"""
+    seen = set()
+    size = 0
+    pending = [obj]
+    while pending:
+        item = pending.pop()
+        if id(item) in seen or isinstance(item, (type, types.ModuleType)):
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item, 0)
+        if isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            pending.extend(item)
+        else:
+            attrs = getattr(item, "__dict__", None)
+            if attrs is not None:
+                pending.append(attrs)
+            for slot in getattr(type(item), "__slots__", ()):
+                value = getattr(item, slot, None)
+                if value is not None:
+                    pending.append(value)
+    return size
+
+
+def sampled_size(items: Iterable[Any], count: int, sample: int = SAMPLE_SIZE) -> int:
+    """Deep size of ``count`` items estimated from the first ``sample`` of them"""
+    measured = [deep_size(item) for item in itertools.islice(items, sample)]
+    if not measured:
+        return 0
+    return round(sum(measured) / len(measured) * count)
+
+
+class MemoryDiagnostics:
+    """Named cache sizers, process gauges and an admin-controlled tracemalloc session"""
+
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self.caches: Dict[str, Sizer] = {}
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def add_cache(self, name: str, sizer: Sizer):
+        self.caches[name] = sizer
+
+    def cache_sizes(self) -> Dict[str, Dict[str, int]]:
+        sizes = {}
+        for name, sizer in self.caches.items():
+            entries, size = sizer()
+            sizes[name] = {"entries": entries, "bytes": size}
+        return sizes
+
+    def collect(self):
+        """Refresh the gauges (called before /metrics renders)"""
+        rss = rss_bytes()
+        if rss is not None:
+            PROCESS_RSS.set(rss)
+        peak = peak_rss_bytes()
+        if peak is not None:
+            PROCESS_PEAK_RSS.set(peak)
+        for generation, (stats, pending) in enumerate(zip(gc.get_stats(), gc.get_count())):
+            GC_COLLECTIONS.labels(generation).set(stats["collections"])
+            GC_COLLECTED.labels(generation).set(stats["collected"])
+            GC_UNCOLLECTABLE.labels(generation).set(stats["uncollectable"])
+            GC_PENDING.labels(generation).set(pending)
+        for name, size in self.cache_sizes().items():
+            CACHE_ENTRIES.labels(name).set(size["entries"])
+            CACHE_BYTES.labels(name).set(size["bytes"])
+
+    def report(self) -> Dict[str, Any]:
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "pid": os.getpid(),
+            "rss_bytes": rss_bytes(),
+            "peak_rss_bytes": peak_rss_bytes(),
+            "gc": [
+                {"generation": generation, "pending": pending, **stats}
+                for generation, (stats, pending) in enumerate(zip(gc.get_stats(), gc.get_count()))
+            ],
+            "caches": self.cache_sizes(),
+            "tracemalloc": {
+                "tracing": tracemalloc.is_tracing(),
+                "frames": tracemalloc.get_traceback_limit(),
+                "traced_bytes": traced,
+                "peak_traced_bytes": peak,
+                "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+                "has_snapshot": self._snapshot is not None,
+            },
+        }
+
+    # --- tracemalloc --------------------------------------------------
+
+    def start_tracing(self, frames: Optional[int] = None) -> bool:
+        """Start tracemalloc; ``False`` when it was already running"""
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(frames or self.frames)
+        self._snapshot = None
+        return True
+
+    def stop_tracing(self) -> bool:
+        """Stop tracemalloc and free its traces; ``False`` when it was not running"""
+        self._snapshot = None
+        if not tracemalloc.is_tracing():
+            return False
+        tracemalloc.stop()
+        return True
+
+    def _take(self) -> tracemalloc.Snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def _allocations(self, group_by: str, limit: int, diff: bool) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            raise TracemallocNotRunning("tracemalloc is not running; start it first")
+        snapshot = self._take()
+        previous, self._snapshot = self._snapshot, snapshot
+        if diff and previous is not None:
+            changes = snapshot.compare_to(previous, group_by)
+            total = sum(change.size for change in changes)
+            sites = [
+                {**_site(change.traceback), "size": change.size, "size_diff": change.size_diff,
+                 "count": change.count, "count_diff": change.count_diff}
+                for change in changes[:limit]
+            ]
+        else:
+            stats = snapshot.statistics(group_by)
+            total = sum(stat.size for stat in stats)
+            sites = [{**_site(stat.traceback), "size": stat.size, "count": stat.count} for stat in stats[:limit]]
+        return {
+            "group_by": group_by,
+            "diff": diff and previous is not None,
+            "total_bytes": total,
+            "sites": sites,
+        }
+
+    async def allocations(self, group_by: str = "lineno", limit: int = 20, diff: bool = False) -> Dict[str, Any]:
+        """
+        Top allocation sites of a new snapshot, or with ``diff`` the largest
+        changes since the previous one; the snapshot replaces the previous.
+        Grouping runs in a worker thread, so the loop keeps serving.
+        """
+        return await asyncio.to_thread(self._allocations, group_by, limit, diff)
+
+
+def _site(traceback: tracemalloc.Traceback) -> Dict[str, Any]:
+    frame = traceback[0]
+    site = {"file": frame.filename, "line": frame.lineno}
+    if len(traceback) > 1:
+        site["traceback"] = [f"{f.filename}:{f.lineno}" for f in traceback]
+    return site
+
+
+def _response_cache() -> Tuple[int, int]:
+    return len(response_cache), response_cache.bytes
+
+
+def _jwks() -> Tuple[int, int]:
+    keys = token_verifier.key_set.keys
+    return len(keys), deep_size(keys)
+
+
+def _route_policies() -> Tuple[int, int]:
+    tables: List = list(authz.route_tables().values())
+    return sum(len(table) for table in tables), deep_size(tables)
+
+
+def _console_jobs() -> Tuple[int, int]:
+    count = len(job_manager.jobs)
+    return count, sampled_size(job_manager.jobs.values(), count)
+
+
+memory_diagnostics = MemoryDiagnostics(frames=settings.tracemalloc_frames)
+memory_diagnostics.add_cache("response", _response_cache)
+memory_diagnostics.add_cache("jwks", _jwks)
+memory_diagnostics.add_cache("route_policies", _route_policies)
+memory_diagnostics.add_cache("console_jobs", _console_jobs)
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Literal, Optional
 
 class LoginRequest(BaseModel):
     username: str
@@ -28,3 +28,25 @@ class UserInfo(BaseModel):
 class ErrorResponse(BaseModel):
     error: str
     detail: Optional[str] = None
+
+class AuthzCheck(BaseModel):
+    method: Optional[str] = None
+    path: Optional[str] = None
+    permission: Optional[str] = None
+
+class AuthzCheckRequest(BaseModel):
+    checks: List[AuthzCheck] = Field(..., max_length=100)
+
+class AuthzCheckResponse(BaseModel):
+    allowed: Dict[str, bool]
+
+class ConsoleCommandRequest(BaseModel):
+    command: str = "system-info"
+    args: List[str] = Field(default_factory=list, max_length=32)
+
+class PackageCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=214, pattern=r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+    version: str = Field(..., min_length=1, max_length=64)
+    description: str = Field("", max_length=4096)
+    maintainer: Optional[str] = Field(None, max_length=256)
+    visibility: Literal["public", "internal", "restricted"] = "public"
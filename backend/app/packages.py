@@ -0,0 +1,269 @@
+"""
+Package catalog.
+
+Packages live in SQLite with an FTS5 index over name and description.
+Listing uses keyset pagination on ``(name, id)``, so every page costs the
+same however deep the cursor; the caller's visibility levels are part of
+the WHERE clause rather than a filter over fetched rows. Rows are read in
+small chunks and encoded straight into the streamed response body.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from . import metrics
+from .config import settings
+
+CATALOG_QUERY_SECONDS = metrics.histogram("catalog_query_seconds", "Package catalog query time", ["op"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packages (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    version TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    maintainer TEXT,
+    visibility TEXT NOT NULL DEFAULT 'public',
+    created_by TEXT,
+    created_at REAL NOT NULL,
+    UNIQUE (name, version)
+);
+CREATE INDEX IF NOT EXISTS packages_name_id ON packages (name, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS packages_fts USING fts5(
+    name, description, content='packages', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS packages_ai AFTER INSERT ON packages BEGIN
+    INSERT INTO packages_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS packages_ad AFTER DELETE ON packages BEGIN
+    INSERT INTO packages_fts (packages_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS packages_au AFTER UPDATE ON packages BEGIN
+    INSERT INTO packages_fts (packages_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+    INSERT INTO packages_fts (rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+"""
+
+FIELDS = ("id", "name", "version", "description", "maintainer", "visibility", "created_by", "created_at")
+VISIBILITIES = ("public", "internal", "restricted")
+
+# Roles that may see each non-public visibility level
+VISIBILITY_ROLES: Dict[str, frozenset] = {
+    "internal": frozenset({"packages_editor", "packages_admin", "admin"}),
+    "restricted": frozenset({"packages_admin", "admin"}),
+}
+
+Key = Tuple[str, int]
+
+
+class CatalogError(Exception):
+    """Raised for requests the catalog refuses; ``status_code`` is the HTTP answer"""
+
+    def __init__(self, status_code: int, detail: str):
+        self.status_code = status_code
+        self.detail = detail
+        super().__init__(detail)
+
+
+def visible_to(current_user: Dict) -> Tuple[str, ...]:
+    """Visibility levels the principal may read"""
+    roles = frozenset(current_user.get("realm_access", {}).get("roles", []))
+    return ("public",) + tuple(v for v, allowed in VISIBILITY_ROLES.items() if not allowed.isdisjoint(roles))
+
+
+def projection(fields: Optional[str]) -> Tuple[str, ...]:
+    """Parse a comma-separated ``fields`` parameter (all fields when empty)"""
+    if not fields:
+        return FIELDS
+    selected = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in selected if f not in FIELDS]
+    if unknown:
+        raise CatalogError(400, f"Unknown fields {unknown}; available: {list(FIELDS)}")
+    return selected
+
+
+def encode_cursor(key: Key) -> str:
+    raw = json.dumps(key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Key:
+    try:
+        name, package_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return str(name), int(package_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise CatalogError(400, "Invalid cursor")
+
+
+def match_expression(q: str) -> str:
+    """Turn free text into an FTS5 query: every word, as a quoted prefix"""
+    terms = ['"' + word.replace('"', '""') + '"*' for word in q.split()]
+    if not terms:
+        raise CatalogError(400, "Empty search")
+    return " ".join(terms)
+
+
+class PackageCatalog:
+    """
+    SQLite-backed catalog with the same threading model as the event store:
+    one writer and one reader thread, each owning its connection.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 200):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+        self._open_executors()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    def _open_executors(self):
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-writer")
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="catalog-reader")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, executor: ThreadPoolExecutor, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    # --- writes -------------------------------------------------------
+
+    def _insert(self, packages: List[Dict[str, Any]], created_by: Optional[str]) -> List[Dict[str, Any]]:
+        now = time.time()
+        rows = [{
+            "name": p["name"], "version": p["version"], "description": p.get("description") or "",
+            "maintainer": p.get("maintainer"), "visibility": p.get("visibility") or "public",
+            "created_by": created_by, "created_at": now,
+        } for p in packages]
+        conn = self._connection()
+        try:
+            with conn:
+                for row in rows:
+                    row["id"] = conn.execute(
+                        "INSERT INTO packages (name, version, description, maintainer, visibility, created_by, created_at) "
+                        "VALUES (:name, :version, :description, :maintainer, :visibility, :created_by, :created_at)",
+                        row,
+                    ).lastrowid
+        except sqlite3.IntegrityError:
+            raise CatalogError(409, "Package version already exists")
+        return [{field: row[field] for field in FIELDS} for row in rows]
+
+    async def add(self, package: Dict[str, Any], created_by: Optional[str] = None) -> Dict[str, Any]:
+        """Insert one package version; 409 when it already exists"""
+        return (await self.add_many([package], created_by))[0]
+
+    async def add_many(self, packages: List[Dict[str, Any]], created_by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Insert package versions in one transaction (all or none)"""
+        with CATALOG_QUERY_SECONDS.labels("insert").time():
+            return await self._run(self._writer, self._insert, packages, created_by)
+
+    # --- reads --------------------------------------------------------
+
+    def _chunk(self, columns: Sequence[str], visible: Sequence[str], match: Optional[str],
+               after: Optional[Key], limit: int) -> List[Tuple]:
+        clauses = [f"visibility IN ({', '.join('?' * len(visible))})"]
+        params: List[Any] = list(visible)
+        if match is not None:
+            clauses.append("id IN (SELECT rowid FROM packages_fts WHERE packages_fts MATCH ?)")
+            params.append(match)
+        if after is not None:
+            clauses.append("(name, id) > (?, ?)")
+            params.extend(after)
+        sql = (f"SELECT name, id, {', '.join(columns)} FROM packages WHERE {' AND '.join(clauses)} "
+               f"ORDER BY name, id LIMIT ?")
+        try:
+            return self._connection().execute(sql, (*params, limit)).fetchall()
+        except sqlite3.OperationalError as e:
+            raise CatalogError(400, f"Invalid search: {e}")
+
+    async def iter_rows(
+        self,
+        visible: Sequence[str],
+        q: Optional[str] = None,
+        after: Optional[Key] = None,
+        limit: int = 100,
+        fields: Sequence[str] = FIELDS,
+    ) -> AsyncIterator[Tuple[Key, Dict[str, Any]]]:
+        """
+        Yield ``(key, package)`` in ``(name, id)`` order, at most ``limit``
+        of them, reading ``chunk_size`` rows per query.
+        """
+        match = match_expression(q) if q else None
+        remaining = limit
+        while remaining > 0:
+            size = min(self.chunk_size, remaining)
+            with CATALOG_QUERY_SECONDS.labels("list").time():
+                rows = await self._run(self._reader, self._chunk, fields, visible, match, after, size)
+            for row in rows:
+                after = (row[0], row[1])
+                yield after, dict(zip(fields, row[2:]))
+            remaining -= len(rows)
+            if len(rows) < size:
+                return
+
+    async def stream_page(
+        self,
+        head: Dict[str, Any],
+        visible: Sequence[str],
+        q: Optional[str] = None,
+        after: Optional[Key] = None,
+        limit: int = 100,
+        fields: Sequence[str] = FIELDS,
+    ) -> AsyncIterator[bytes]:
+        """
+        Encode one page as a JSON object: the ``head`` members, then
+        ``packages`` written row by row, then ``next_cursor`` (null on the
+        last page). One extra row is read to tell whether more follow.
+
+        Validate the cursor and search first: once the body has started,
+        errors can no longer become a 400.
+        """
+        prefix = json.dumps(head, separators=(",", ":"))[:-1]
+        yield f'{prefix}{"," if head else ""}"packages":['.encode("utf-8")
+        last: Optional[Key] = None
+        count = 0
+        more = False
+        async for key, package in self.iter_rows(visible, q, after, limit + 1, fields):
+            if count == limit:
+                more = True
+                break
+            yield (b"," if count else b"") + json.dumps(package, separators=(",", ":")).encode("utf-8")
+            last = key
+            count += 1
+        next_cursor = encode_cursor(last) if more and last is not None else None
+        yield f'],"count":{count},"next_cursor":{json.dumps(next_cursor)}}}'.encode("utf-8")
+
+    def close(self):
+        """Close both connections; the catalog reopens them on next use"""
+        for executor in (self._writer, self._reader):
+            executor.submit(self._close_connection).result()
+            executor.shutdown(wait=True)
+        self._open_executors()
+
+    def _close_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+package_catalog = PackageCatalog(settings.packages_db_path)
@@ -0,0 +1,184 @@
+"""
+On-demand sampling profiler for the serving worker.
+
+Nothing runs until a profile is requested: no trace or profile hooks are
+installed, and the sampler thread exists only for the length of a run. The
+thread reads the event loop thread's frame stack every ``interval`` seconds
+(``sys._current_frames``) and prefixes it with the asyncio task that was
+running, so samples group by task as well as by function. In ``wall`` mode
+each sample also records where every suspended task is awaiting, which
+shows time spent waiting on Keycloak or a pool as well as time on the CPU.
+
+Results are aggregated into collapsed stacks (``frame;frame;frame count``,
+the input of flamegraph.pl and most flame graph viewers) or a speedscope
+``sampled`` profile.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from . import metrics
+from .config import settings
+
+PROFILES_RUN = metrics.counter("profiles_run", "Sampling profiles taken", ["mode"])
+
+Stack = Tuple[str, ...]
+
+IDLE = "<idle>"
+# A loop thread stopped in its selector with no task running is idle
+_SELECTOR_FRAME = "(selectors.py:"
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another is running"""
+
+
+def _label(code) -> str:
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def frame_stack(frame) -> List[str]:
+    """Labels of a thread's frames, outermost call first"""
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_stack(coro) -> List[str]:
+    """Where a suspended coroutine is waiting, outermost call first"""
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+        if frame is None:  # a future (awaited through its FutureIter) or other awaitable
+            stack.append(f"<{type(coro).__name__.removesuffix('Iter')}>")
+            break
+        stack.append(_label(frame.f_code))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+def _task_name(task) -> str:
+    return f"task:{task.get_name()}"
+
+
+class SamplingProfiler:
+    """
+    Samples the event loop thread from a short-lived background thread.
+
+    One profile at a time: ``run`` raises :class:`ProfilerBusy` while another
+    is in progress, and ``ValueError`` beyond ``max_seconds``.
+    """
+
+    def __init__(self, interval: float = 0.005, max_seconds: float = 30.0):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _sample(self, loop, thread_id: int, wall: bool, samples: Counter):
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            return
+        stack = frame_stack(frame)
+        task = asyncio.current_task(loop)
+        if task is None and stack and _SELECTOR_FRAME in stack[-1]:
+            samples[(IDLE,)] += 1
+        else:
+            root = _task_name(task) if task is not None else "<loop>"
+            samples[(root, *stack)] += 1
+        if not wall:
+            return
+        try:
+            tasks = asyncio.all_tasks(loop)
+        except RuntimeError:  # the task set changed under us; skip this round
+            return
+        for other in tasks:
+            if other is not task:
+                samples[("<awaiting>", _task_name(other), *_await_stack(other.get_coro()))] += 1
+
+    def _sampler(self, loop, thread_id: int, wall: bool, samples: Counter, stop: threading.Event):
+        while not stop.wait(self.interval):
+            self._sample(loop, thread_id, wall, samples)
+
+    async def run(self, seconds: float, mode: str = "cpu") -> "Profile":
+        """Sample the calling event loop for ``seconds`` and return the profile"""
+        if seconds <= 0 or seconds > self.max_seconds:
+            raise ValueError(f"seconds must be in (0, {self.max_seconds}]")
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running on this worker")
+        try:
+            samples: Counter = Counter()
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=self._sampler,
+                args=(asyncio.get_running_loop(), threading.get_ident(), mode == "wall", samples, stop),
+                name="sampling-profiler",
+                daemon=True,
+            )
+            started = time.monotonic()
+            thread.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(thread.join)
+            PROFILES_RUN.labels(mode).inc()
+            return Profile(samples, self.interval, time.monotonic() - started, mode)
+        finally:
+            self._lock.release()
+
+
+class Profile:
+    """Aggregated samples: a count per distinct stack"""
+
+    def __init__(self, samples: Dict[Stack, int], interval: float, duration: float, mode: str):
+        self.samples = samples
+        self.interval = interval
+        self.duration = duration
+        self.mode = mode
+
+    def collapsed(self) -> str:
+        lines = [f"{';'.join(stack)} {count}" for stack, count in sorted(self.samples.items())]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def speedscope(self, name: str = "profile") -> Dict:
+        frames: List[Dict] = []
+        index: Dict[str, int] = {}
+        stacks, weights = [], []
+        for stack, count in self.samples.items():
+            ids = []
+            for label in stack:
+                if label not in index:
+                    index[label] = len(frames)
+                    frames.append({"name": label})
+                ids.append(index[label])
+            stacks.append(ids)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "keycloak-auth-demo",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{name} ({self.mode})",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.duration,
+                "samples": stacks,
+                "weights": weights,
+            }],
+        }
+
+
+profiler = SamplingProfiler(interval=settings.profile_interval, max_seconds=settings.profile_max_seconds)
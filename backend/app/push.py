@@ -0,0 +1,139 @@
+"""
+Server-sent event push channel.
+
+Clients authenticated through get_current_user hold one SSE stream each.
+Each event is encoded once into an immutable bytes frame and the same object
+is queued for every recipient, so fan-out costs one queue append per
+connection. Role changes and logouts come from the Keycloak event
+ingestor; token-expiry warnings are timed by each stream itself.
+"""
+import asyncio
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Optional, Set
+
+from . import metrics
+
+PUSH_SUBSCRIBERS = metrics.gauge("push_subscribers", "Open push streams")
+PUSH_EVENTS = metrics.counter("push_events", "Events published to push streams", ["event"])
+PUSH_DISCONNECTED = metrics.counter("push_slow_disconnects", "Push streams closed because they fell behind")
+
+KEEPALIVE = b": keep-alive\n\n"
+_CLOSE = object()
+
+# Admin events that change what a user may do
+ROLE_RESOURCES = frozenset({"REALM_ROLE_MAPPING", "CLIENT_ROLE_MAPPING", "GROUP_MEMBERSHIP"})
+_USER_PATH = re.compile(r"^users/([^/]+)/")
+
+
+def encode_event(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    __slots__ = ("sub", "queue", "closed")
+
+    def __init__(self, sub: str, max_queue: int):
+        self.sub = sub
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+
+
+class PushHub:
+    """Tracks open streams by principal ``sub`` and fans events out to them"""
+
+    def __init__(self, max_queue: int = 64, keepalive: float = 25.0, expiry_warning: float = 60.0):
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        self.expiry_warning = expiry_warning
+        self._by_sub: Dict[str, Set[Subscriber]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(subs) for subs in self._by_sub.values())
+
+    def subscribe(self, sub: str) -> Subscriber:
+        subscriber = Subscriber(sub, self.max_queue)
+        self._by_sub.setdefault(sub, set()).add(subscriber)
+        PUSH_SUBSCRIBERS.inc()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subs = self._by_sub.get(subscriber.sub)
+        if subs and subscriber in subs:
+            subs.discard(subscriber)
+            if not subs:
+                del self._by_sub[subscriber.sub]
+            PUSH_SUBSCRIBERS.dec()
+
+    def publish(self, event: str, data: Any, subs: Optional[Iterable[str]] = None, close: bool = False) -> int:
+        """
+        Send ``event`` to the streams of ``subs`` (everyone when omitted);
+        with ``close`` those streams end after it. Returns streams reached.
+        """
+        frame = encode_event(event, data)
+        if subs is None:
+            targets = [s for group in self._by_sub.values() for s in group]
+        else:
+            targets = [s for sub in subs for s in self._by_sub.get(sub, ())]
+        for subscriber in targets:
+            self._deliver(subscriber, frame)
+            if close:
+                self._deliver(subscriber, _CLOSE)
+        PUSH_EVENTS.labels(event).inc()
+        return len(targets)
+
+    def _deliver(self, subscriber: Subscriber, frame: object):
+        # frame is encoded bytes, or the _CLOSE marker
+        if subscriber.closed:
+            return
+        try:
+            subscriber.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # A client this far behind is gone or stuck; make it reconnect
+            subscriber.closed = True
+            PUSH_DISCONNECTED.inc()
+            self.unsubscribe(subscriber)
+
+    async def stream(self, principal: Dict) -> AsyncIterator[bytes]:
+        """SSE frames for one connection until it closes, logs out or falls behind"""
+        subscriber = self.subscribe(principal.get("sub") or "")
+        exp = principal.get("exp")
+        warn_at = exp - self.expiry_warning if exp else None
+        try:
+            yield encode_event("ready", {"sub": subscriber.sub, "expires_at": exp})
+            while not subscriber.closed:
+                timeout = self.keepalive
+                if warn_at is not None:
+                    timeout = max(min(timeout, warn_at - time.time()), 0)
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    if warn_at is not None and time.time() >= warn_at:
+                        expires_in = warn_at + self.expiry_warning - time.time()
+                        yield encode_event("token-expiring", {"expires_at": exp, "in": max(round(expires_in), 0)})
+                        warn_at = None
+                    else:
+                        yield KEEPALIVE
+                    continue
+                if frame is _CLOSE:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+    def on_keycloak_event(self, kind: str, event: Dict[str, Any]):
+        """EventIngestor listener: turn logouts and role-mapping changes into pushes"""
+        if kind == "login" and event.get("type") == "LOGOUT" and event.get("userId"):
+            self.publish("logout", {"time": event.get("time")}, [event["userId"]], close=True)
+        elif kind == "admin" and event.get("resourceType") in ROLE_RESOURCES:
+            match = _USER_PATH.match(event.get("resourcePath") or "")
+            if match:
+                self.publish("role-change", {
+                    "time": event.get("time"),
+                    "operation": event.get("operationType"),
+                    "resource": event.get("resourceType"),
+                }, [match.group(1)])
+
+
+push_hub = PushHub()
@@ -0,0 +1,685 @@
+"""
+Realm export/import over the Keycloak Admin REST API.
+
+Replaces the ``docker exec keycloak kcadm.sh ...`` pipelines in
+``setup-keycloak.sh`` / ``export-realm-simple.sh``: every call goes through
+the shared pooled KeycloakClient with one cached admin token, and
+independent calls run concurrently.
+
+Usage (from backend/):
+    python -m app.realm_sync export realm.json
+    python -m app.realm_sync export-users users.ndjson.gz [--restart]
+    python -m app.realm_sync import realm.json [--realm other-realm] [--prune] [--dry-run]
+
+Import is differential: every object is content-hashed and compared with the
+live realm, so re-applying an unchanged export issues no write calls.
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, IO, Iterable, List, Optional, Tuple
+
+import httpx
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .zst exports
+    zstandard = None  # type: ignore[assignment]
+
+from . import metrics
+from .keycloak import KeycloakClient, keycloak, keycloak_client
+
+logger = logging.getLogger(__name__)
+
+# Server-managed fields that never take part in comparisons or creates
+VOLATILE_FIELDS = frozenset({
+    "id", "createdTimestamp", "access", "containerId", "notBefore", "totp",
+    "disableableCredentialTypes", "federationLink", "subGroupCount",
+})
+
+
+def strip_volatile(representation: Any) -> Any:
+    """``representation`` without volatile fields, at any depth (protocolMappers[].id, subGroups[].id, ...)"""
+    if isinstance(representation, dict):
+        return {k: strip_volatile(v) for k, v in representation.items() if k not in VOLATILE_FIELDS}
+    if isinstance(representation, list):
+        return [strip_volatile(v) for v in representation]
+    return representation
+
+
+class AdminAPIError(Exception):
+    """Raised when the Admin API answers with an unexpected status"""
+
+    def __init__(self, response: httpx.Response):
+        self.status_code = response.status_code
+        super().__init__(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:200]}")
+
+
+async def gather_limited(coros: Iterable[Awaitable], limit: int) -> List[Any]:
+    """Run awaitables concurrently with at most ``limit`` in flight, keeping order"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+class RealmAdmin:
+    """Thin typed wrapper over the Admin REST API calls realm sync needs"""
+
+    def __init__(self, client: KeycloakClient, realm: Optional[str] = None, page_size: int = 100):
+        self.client = client
+        self.realm = realm or client.realm
+        self.page_size = page_size
+
+    async def request(self, method: str, path: str = "", expected=(200, 201, 204), **kwargs) -> httpx.Response:
+        response = await self.client.admin_request(method, path, realm=self.realm, **kwargs)
+        if response.status_code not in expected:
+            raise AdminAPIError(response)
+        return response
+
+    async def get_json(self, path: str = "", **params) -> Any:
+        return (await self.request("GET", path, params=params or None)).json()
+
+    async def paged(self, path: str, start: int = 0, **params) -> List[Dict[str, Any]]:
+        """Fetch every page of a list endpoint sequentially"""
+        items: List[Dict[str, Any]] = []
+        first = start
+        while True:
+            page = await self.get_json(path, first=first, max=self.page_size, **params)
+            items.extend(page)
+            if len(page) < self.page_size:
+                return items
+            first += self.page_size
+
+    async def realm_exists(self) -> bool:
+        response = await self.client.admin_request("GET", realm=self.realm)
+        if response.status_code == 404:
+            return False
+        if response.status_code != 200:
+            raise AdminAPIError(response)
+        return True
+
+    async def create_realm(self, representation: Dict[str, Any]):
+        response = await self.client.admin_call(
+            "POST",
+            f"{self.client.base_url}/admin/realms",
+            json={**strip_volatile(representation), "realm": self.realm},
+        )
+        if response.status_code not in (201, 409):
+            raise AdminAPIError(response)
+
+    async def user_count(self) -> int:
+        return int(await self.get_json("users/count"))
+
+    async def users_page(self, first: int) -> List[Dict[str, Any]]:
+        return await self.get_json("users", first=first, max=self.page_size, briefRepresentation="false")
+
+    async def all_users(self, concurrency: int = 10) -> List[Dict[str, Any]]:
+        """Fetch every user, requesting pages concurrently"""
+        count = await self.user_count()
+        pages = await gather_limited(
+            (self.users_page(first) for first in range(0, count, self.page_size)), concurrency
+        )
+        users = [user for page in pages for user in page]
+        # Users created after the count would be missed; pick up any tail
+        if pages and len(pages[-1]) == self.page_size:
+            users.extend(await self.paged("users", start=count, briefRepresentation="false"))
+        return users
+
+    async def role_members(self, role: str) -> List[str]:
+        """Usernames holding a realm role"""
+        return [user["username"] for user in await self.paged(f"roles/{role}/users", briefRepresentation="true")]
+
+    async def user_ids(self, usernames: List[str], concurrency: int = 10) -> Dict[str, str]:
+        async def lookup(username):
+            users = await self.get_json("users", username=username, exact="true")
+            return username, users[0]["id"] if users else None
+
+        found = await gather_limited((lookup(u) for u in usernames), concurrency)
+        return {username: user_id for username, user_id in found if user_id}
+
+    async def user_realm_roles(self, user_id: str) -> List[str]:
+        return sorted(role["name"] for role in await self.get_json(f"users/{user_id}/role-mappings/realm"))
+
+
+class JSONStreamWriter:
+    """
+    Writes one JSON object whose list members can be streamed item by item,
+    so an export never holds the whole document in memory.
+    """
+
+    def __init__(self, fp: IO[str]):
+        self.fp = fp
+        self._members = 0
+        self._items = 0
+        fp.write("{")
+
+    def member(self, name: str, value: Any):
+        self._key(name)
+        json.dump(value, self.fp, separators=(",", ":"))
+
+    def begin_list(self, name: str):
+        self._key(name)
+        self.fp.write("[")
+        self._items = 0
+
+    def item(self, value: Any):
+        if self._items:
+            self.fp.write(",")
+        self.fp.write("\n")
+        json.dump(value, self.fp, separators=(",", ":"))
+        self._items += 1
+
+    def end_list(self):
+        self.fp.write("\n]")
+
+    def close(self):
+        self.fp.write("}\n")
+
+    def _key(self, name: str):
+        if self._members:
+            self.fp.write(",\n")
+        self.fp.write(json.dumps(name) + ":")
+        self._members += 1
+
+
+class RealmExporter:
+    """Exports realm settings, roles, clients, groups and users concurrently"""
+
+    def __init__(self, admin: RealmAdmin, concurrency: int = 10):
+        self.admin = admin
+        self.concurrency = concurrency
+
+    async def _user_with_roles(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        user = dict(user)
+        user["realmRoles"] = await self.admin.user_realm_roles(user["id"])
+        return user
+
+    async def export(self, fp: IO[str]) -> Dict[str, int]:
+        """Stream the realm to ``fp`` and return per-section counts"""
+        realm, roles, clients, groups, user_count = await asyncio.gather(
+            self.admin.get_json(),
+            self.admin.paged("roles", briefRepresentation="false"),
+            self.admin.paged("clients"),
+            self.admin.paged("groups", briefRepresentation="false"),
+            self.admin.user_count(),
+        )
+
+        writer = JSONStreamWriter(fp)
+        writer.member("realm", realm)
+        writer.member("roles", roles)
+        writer.member("clients", clients)
+        writer.member("groups", groups)
+
+        # Fetch user pages a window at a time: pages and their role mappings
+        # load concurrently but are written in order and then released.
+        writer.begin_list("users")
+        exported = 0
+        page_size = self.admin.page_size
+        offsets = list(range(0, max(user_count, 1), page_size))
+        window = max(1, self.concurrency // 2)
+        for start in range(0, len(offsets), window):
+            pages = await gather_limited(
+                (self.admin.users_page(first) for first in offsets[start:start + window]), self.concurrency
+            )
+            for page in pages:
+                for user in await gather_limited((self._user_with_roles(u) for u in page), self.concurrency):
+                    writer.item(user)
+                    exported += 1
+        writer.end_list()
+        writer.close()
+
+        return {"roles": len(roles), "clients": len(clients), "groups": len(groups), "users": exported}
+
+
+EXPORT_PAGES = metrics.counter("realm_export_pages", "User pages written by the streaming exporter", ["realm"])
+EXPORT_USERS = metrics.counter("realm_export_users", "Users written by the streaming exporter", ["realm"])
+EXPORT_BYTES = metrics.counter("realm_export_bytes", "Bytes written by the streaming exporter", ["realm"])
+EXPORT_PROGRESS = metrics.gauge("realm_export_progress_ratio", "Fraction of users exported by the running export", ["realm"])
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+
+def compression_for(path: str) -> str:
+    if path.endswith(".gz"):
+        return "gzip"
+    if path.endswith(".zst"):
+        return "zstd"
+    return "none"
+
+
+def page_compressor(compression: str) -> Callable[[bytes], bytes]:
+    """
+    Compress one page into a self-contained gzip member or zstd frame.
+
+    Concatenated members/frames decode as a single stream, so the file stays
+    valid after every page and can be truncated back to any page boundary.
+    """
+    if compression == "none":
+        return lambda data: data
+    if compression == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd compression requires the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3).compress
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+class UserStreamExporter:
+    """
+    Streams a realm's users as NDJSON (one user per line, realm roles
+    embedded) in constant memory.
+
+    Pages are fetched a window at a time and each page is appended to the
+    file and released before the next window starts. A checkpoint file next
+    to the output records the offset and file size after every completed
+    page, so an interrupted export resumes from the last completed page.
+    """
+
+    def __init__(self, admin: RealmAdmin, concurrency: int = 10, compression: str = "none",
+                 progress_interval: float = 5.0):
+        self.admin = admin
+        self.concurrency = concurrency
+        self.compress = page_compressor(compression)
+        self.compression = compression
+        self.progress_interval = progress_interval
+
+    async def _user_with_roles(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        user = dict(user)
+        user["realmRoles"] = await self.admin.user_realm_roles(user["id"])
+        return user
+
+    async def _page(self, first: int) -> bytes:
+        users = await self.admin.users_page(first)
+        users = await gather_limited((self._user_with_roles(u) for u in users), self.concurrency)
+        return b"".join(json.dumps(u, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+                        for u in users)
+
+    @staticmethod
+    def checkpoint_path(path: str) -> str:
+        return path + ".progress"
+
+    def _load_checkpoint(self, path: str) -> Dict[str, Any]:
+        try:
+            with open(self.checkpoint_path(path), encoding="utf-8") as fp:
+                checkpoint = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        if checkpoint.get("realm") != self.admin.realm or checkpoint.get("compression") != self.compression:
+            return {}
+        return checkpoint
+
+    def _save_checkpoint(self, path: str, checkpoint: Dict[str, Any]):
+        tmp = self.checkpoint_path(path) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            json.dump(checkpoint, fp)
+        os.replace(tmp, self.checkpoint_path(path))
+
+    async def export(self, path: str, resume: bool = True) -> Dict[str, Any]:
+        realm = self.admin.realm
+        checkpoint = self._load_checkpoint(path) if resume and os.path.exists(path) else {}
+        first = checkpoint.get("next", 0)
+        exported = checkpoint.get("users", 0)
+        size = checkpoint.get("bytes", 0)
+        total = await self.admin.user_count()
+
+        page_size = self.admin.page_size
+        window = max(1, self.concurrency // 2)
+        last_report = time.monotonic()
+        started = last_report
+
+        with open(path, "r+b" if first else "wb") as fp:
+            # Drop anything written after the last completed page
+            fp.truncate(size)
+            fp.seek(size)
+            done = False
+            while not done:
+                offsets = [first + i * page_size for i in range(window)]
+                pages = await gather_limited((self._page(offset) for offset in offsets), self.concurrency)
+                for page in pages:
+                    count = page.count(b"\n")
+                    if count:
+                        data = self.compress(page)
+                        fp.write(data)
+                        fp.flush()
+                        size += len(data)
+                        exported += count
+                        EXPORT_USERS.labels(realm).inc(count)
+                        EXPORT_BYTES.labels(realm).inc(len(data))
+                    EXPORT_PAGES.labels(realm).inc()
+                    first += page_size
+                    self._save_checkpoint(path, {
+                        "realm": realm, "compression": self.compression,
+                        "next": first, "users": exported, "bytes": size,
+                    })
+                    if count < page_size:
+                        done = True
+                        break
+
+                EXPORT_PROGRESS.labels(realm).set(min(exported / total, 1.0) if total else 1.0)
+                now = time.monotonic()
+                if now - last_report >= self.progress_interval:
+                    rate = exported / max(now - started, 1e-9)
+                    logger.info("exported %d/%d users (%.0f users/s)", exported, total, rate)
+                    last_report = now
+
+        os.remove(self.checkpoint_path(path))
+        EXPORT_PROGRESS.labels(realm).set(1.0)
+        return {"users": exported, "bytes": size, "compression": self.compression}
+
+
+def content_hash(representation: Any) -> str:
+    """Stable digest of a representation (key order and volatile fields ignored)"""
+    canonical = json.dumps(strip_volatile(representation), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def projected_hash(desired: Dict[str, Any], live: Dict[str, Any]) -> str:
+    """Hash of ``live`` restricted to the fields ``desired`` specifies"""
+    return content_hash({k: strip_volatile(live.get(k)) for k in strip_volatile(desired)})
+
+
+def user_body(user: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in strip_volatile(user).items() if k not in ("realmRoles", "groups")}
+
+
+# Object kinds in dependency order, with the field that identifies them
+KINDS = (("roles", "name"), ("clients", "clientId"), ("groups", "name"), ("users", "username"))
+
+
+class Change:
+    __slots__ = ("kind", "key", "desired", "live")
+
+    def __init__(self, kind: str, key: str, desired: Optional[Dict[str, Any]], live: Optional[Dict[str, Any]]):
+        self.kind = kind
+        self.key = key
+        self.desired = desired
+        self.live = live
+
+    @property
+    def target(self) -> Dict[str, Any]:
+        """The live object an update or delete applies to"""
+        if self.live is None:
+            raise ValueError(f"No live {self.kind} {self.key!r} to change")
+        return self.live
+
+    def body(self) -> Dict[str, Any]:
+        """Request body of a create or update"""
+        if self.desired is None:
+            raise ValueError(f"No desired {self.kind} {self.key!r} to write")
+        return user_body(self.desired) if self.kind == "users" else strip_volatile(self.desired)
+
+
+class SyncPlan:
+    """Minimal set of calls that turns the live realm into the desired one"""
+
+    def __init__(self):
+        self.realm_update: Optional[Dict[str, Any]] = None
+        self.creates: Dict[str, List[Change]] = {kind: [] for kind, _ in KINDS}
+        self.updates: Dict[str, List[Change]] = {kind: [] for kind, _ in KINDS}
+        self.deletes: Dict[str, List[Change]] = {kind: [] for kind, _ in KINDS}
+        # username -> (roles to add, roles to remove)
+        self.role_changes: Dict[str, Tuple[List[str], List[str]]] = {}
+        # role name -> {"id", "name"}; the role-mapping endpoints look roles up by id
+        self.role_refs: Dict[str, Dict[str, str]] = {}
+        self.unchanged = 0
+
+    @property
+    def empty(self) -> bool:
+        return not (self.realm_update or self.role_changes or any(
+            changes for group in (self.creates, self.updates, self.deletes) for changes in group.values()
+        ))
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "created": sum(len(c) for c in self.creates.values()),
+            "updated": sum(len(c) for c in self.updates.values()) + (1 if self.realm_update else 0),
+            "deleted": sum(len(c) for c in self.deletes.values()),
+            "role_mappings": len(self.role_changes),
+            "unchanged": self.unchanged,
+        }
+
+
+def plan_sync(desired: Dict[str, Any], live: Dict[str, Any], prune: bool = False) -> SyncPlan:
+    """
+    Compare content hashes of every desired object with its live counterpart.
+
+    ``live`` holds the same sections as an export plus ``role_mappings``
+    (username -> realm role names). Objects only present live are deleted
+    when ``prune`` is set.
+    """
+    plan = SyncPlan()
+
+    if desired.get("realm") and live.get("realm"):
+        if content_hash(desired["realm"]) != projected_hash(desired["realm"], live["realm"]):
+            plan.realm_update = desired["realm"]
+
+    for kind, key in KINDS:
+        live_by_key = {item[key]: item for item in live.get(kind, [])}
+        seen = set()
+        for item in desired.get(kind, []):
+            seen.add(item[key])
+            body = user_body(item) if kind == "users" else strip_volatile(item)
+            current = live_by_key.get(item[key])
+            if current is None:
+                plan.creates[kind].append(Change(kind, item[key], item, None))
+            elif content_hash(body) != projected_hash(body, current):
+                plan.updates[kind].append(Change(kind, item[key], item, current))
+            else:
+                plan.unchanged += 1
+        if prune:
+            plan.deletes[kind] = [
+                Change(kind, k, None, item) for k, item in live_by_key.items() if k not in seen
+            ]
+
+    plan.role_refs = {role["name"]: {"id": role["id"], "name": role["name"]} for role in live.get("roles", [])}
+    live_mappings = live.get("role_mappings", {})
+    for user in desired.get("users", []):
+        if "realmRoles" not in user:
+            continue
+        wanted = set(user["realmRoles"])
+        current = set(live_mappings.get(user["username"], []))
+        if wanted != current:
+            plan.role_changes[user["username"]] = (sorted(wanted - current), sorted(current - wanted))
+
+    return plan
+
+
+class RealmImporter:
+    """
+    Differential realm sync.
+
+    Fetches the live realm, plans only the calls whose content hash differs
+    and applies them in dependency order (roles, clients and groups in
+    parallel, then users, then role mappings; deletes in reverse), with
+    every phase running concurrent batches.
+    """
+
+    def __init__(self, admin: RealmAdmin, concurrency: int = 10, batch_size: int = 50, prune: bool = False):
+        self.admin = admin
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.prune = prune
+
+    async def _batched(self, coros: List[Awaitable]):
+        for start in range(0, len(coros), self.batch_size):
+            await gather_limited(coros[start:start + self.batch_size], self.concurrency)
+
+    async def fetch_live(self) -> Dict[str, Any]:
+        admin = self.admin
+        realm, roles, clients, groups, users = await asyncio.gather(
+            admin.get_json(),
+            admin.paged("roles", briefRepresentation="false"),
+            admin.paged("clients"),
+            admin.paged("groups", briefRepresentation="false"),
+            admin.all_users(self.concurrency),
+        )
+        # One paged call per role instead of one call per user
+        role_mappings: Dict[str, List[str]] = {}
+        members = await gather_limited((admin.role_members(r["name"]) for r in roles), self.concurrency)
+        for role, usernames in zip(roles, members):
+            for username in usernames:
+                role_mappings.setdefault(username, []).append(role["name"])
+        return {
+            "realm": realm, "roles": roles, "clients": clients, "groups": groups,
+            "users": users, "role_mappings": role_mappings,
+        }
+
+    async def plan(self, data: Dict[str, Any]) -> SyncPlan:
+        if not await self.admin.realm_exists():
+            await self.admin.create_realm(data.get("realm", {}))
+        return plan_sync(data, await self.fetch_live(), prune=self.prune)
+
+    async def import_data(self, data: Dict[str, Any], dry_run: bool = False) -> Dict[str, int]:
+        plan = await self.plan(data)
+        if not dry_run:
+            await self.apply(plan)
+        return plan.summary()
+
+    async def apply(self, plan: SyncPlan):
+        admin = self.admin
+
+        if plan.realm_update:
+            await admin.request("PUT", json={**strip_volatile(plan.realm_update), "realm": admin.realm})
+
+        # Roles, clients and groups are independent of each other
+        await self._batched(
+            [self._create(c) for kind in ("roles", "clients", "groups") for c in plan.creates[kind]] +
+            [self._update(c) for kind in ("roles", "clients", "groups") for c in plan.updates[kind]]
+        )
+
+        # Users depend on nothing but must exist before their role mappings
+        user_ids = {c.key: c.target["id"] for c in plan.updates["users"]}
+        created = await gather_limited((self._create(c) for c in plan.creates["users"]), self.concurrency)
+        user_ids.update((c.key, user_id) for c, user_id in zip(plan.creates["users"], created) if user_id)
+        await self._batched([self._update(c) for c in plan.updates["users"]])
+
+        missing = [username for username in plan.role_changes if username not in user_ids]
+        if missing:
+            user_ids.update(await admin.user_ids(missing, self.concurrency))
+        role_refs = await self._role_refs(plan)
+        await self._batched([
+            self._set_roles(user_ids[username], [role_refs[name] for name in to_add],
+                            [role_refs[name] for name in to_remove])
+            for username, (to_add, to_remove) in plan.role_changes.items()
+            if username in user_ids
+        ])
+
+        # Deletes run in reverse dependency order
+        await self._batched([self._delete(c) for c in plan.deletes["users"]])
+        await self._batched([self._delete(c) for kind in ("groups", "clients", "roles") for c in plan.deletes[kind]])
+
+    def _path(self, change: Change) -> str:
+        if change.kind == "roles":
+            return f"roles/{change.target['name']}"
+        return f"{change.kind}/{change.target['id']}"
+
+    async def _create(self, change: Change) -> Optional[str]:
+        response = await self.admin.request("POST", change.kind, json=change.body(), expected=(201, 409))
+        location = response.headers.get("Location")
+        return location.rstrip("/").rsplit("/", 1)[-1] if location else None
+
+    async def _update(self, change: Change):
+        await self.admin.request("PUT", self._path(change), json=change.body())
+
+    async def _delete(self, change: Change):
+        await self.admin.request("DELETE", self._path(change), expected=(204, 404))
+
+    async def _role_refs(self, plan: SyncPlan) -> Dict[str, Dict[str, str]]:
+        """Live role references, plus the ids of roles created by this import"""
+        refs = dict(plan.role_refs)
+        wanted = {name for to_add, _ in plan.role_changes.values() for name in to_add if name not in refs}
+        created = await gather_limited((self.admin.get_json(f"roles/{name}") for name in sorted(wanted)),
+                                       self.concurrency)
+        refs.update((role["name"], {"id": role["id"], "name": role["name"]}) for role in created)
+        return refs
+
+    async def _set_roles(self, user_id: str, to_add: List[Dict[str, str]], to_remove: List[Dict[str, str]]):
+        path = f"users/{user_id}/role-mappings/realm"
+        if to_add:
+            await self.admin.request("POST", path, json=to_add)
+        if to_remove:
+            await self.admin.request("DELETE", path, json=to_remove)
+
+
+async def export_realm(path: str, client: KeycloakClient = keycloak, realm: Optional[str] = None,
+                       concurrency: int = 10) -> Dict[str, int]:
+    admin = RealmAdmin(client, realm)
+    with open(path, "w", encoding="utf-8") as fp:
+        return await RealmExporter(admin, concurrency).export(fp)
+
+
+async def export_users(path: str, client: KeycloakClient = keycloak, realm: Optional[str] = None,
+                       concurrency: int = 10, compression: Optional[str] = None, resume: bool = True,
+                       page_size: int = 500) -> Dict[str, Any]:
+    admin = RealmAdmin(client, realm, page_size=page_size)
+    exporter = UserStreamExporter(admin, concurrency, compression or compression_for(path))
+    return await exporter.export(path, resume=resume)
+
+
+async def import_realm(path: str, client: KeycloakClient = keycloak, realm: Optional[str] = None,
+                       concurrency: int = 10, prune: bool = False, dry_run: bool = False) -> Dict[str, int]:
+    with open(path, encoding="utf-8") as fp:
+        data = json.load(fp)
+    admin = RealmAdmin(client, realm or data.get("realm", {}).get("realm"))
+    return await RealmImporter(admin, concurrency, prune=prune).import_data(data, dry_run=dry_run)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="realm-sync", description="Export or import a Keycloak realm")
+    parser.add_argument("--url", help="Keycloak base URL (default: KEYCLOAK_URL)")
+    parser.add_argument("--realm", help="Realm name (default: KEYCLOAK_REALM, or the file's realm on import)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Maximum concurrent Admin API calls")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("export", help="Export a realm to a JSON file").add_argument("path")
+    users_parser = commands.add_parser("export-users", help="Stream users to an NDJSON file (.gz/.zst compress)")
+    users_parser.add_argument("path")
+    users_parser.add_argument("--compression", choices=COMPRESSIONS, help="Default: from the file suffix")
+    users_parser.add_argument("--page-size", type=int, default=500)
+    users_parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    import_parser = commands.add_parser("import", help="Apply a JSON export to a realm, changing only what differs")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--prune", action="store_true", help="Delete objects missing from the file")
+    import_parser.add_argument("--dry-run", action="store_true", help="Only print the planned changes")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # A client of its own: --url must not repoint the app-wide one
+    client = keycloak_client(args.url)
+
+    async def run():
+        try:
+            if args.command == "export":
+                return await export_realm(args.path, client, args.realm, args.concurrency)
+            if args.command == "export-users":
+                return await export_users(
+                    args.path, client, args.realm, args.concurrency, compression=args.compression,
+                    resume=not args.restart, page_size=args.page_size,
+                )
+            return await import_realm(
+                args.path, client, args.realm, args.concurrency, prune=args.prune, dry_run=args.dry_run
+            )
+        finally:
+            await client.aclose()
+
+    try:
+        result = asyncio.run(run())
+    except (AdminAPIError, httpx.HTTPError, RuntimeError) as e:
+        logger.error("realm-sync failed: %s", e)
+        return 1
+    logger.info(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
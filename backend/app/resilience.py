@@ -0,0 +1,193 @@
+"""
+Resilience primitives for calls to Keycloak.
+
+Each Keycloak endpoint gets a CircuitBreaker that caps in-flight calls and,
+after consecutive failures, rejects calls outright for a cool-down period
+instead of letting coroutines pile up behind a stalled server (the token
+verifier keeps serving its last good JWKS meanwhile, see tokens.py).
+Rejections are raised as httpx.TransportError subclasses, so existing
+``except httpx.HTTPError`` handlers treat them like any outage.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from . import deadlines, metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = metrics.gauge(
+    "keycloak_breaker_state", "Circuit breaker state per endpoint (0 closed, 1 half-open, 2 open)", ["endpoint"]
+)
+BREAKER_TRANSITIONS = metrics.counter("keycloak_breaker_transitions", "Circuit breaker state changes", ["endpoint", "state"])
+BREAKER_REJECTED = metrics.counter("keycloak_breaker_rejected", "Calls refused without reaching Keycloak", ["endpoint", "reason"])
+BREAKER_FAILURES = metrics.counter("keycloak_call_failures", "Keycloak calls counted as failures", ["endpoint"])
+KEYCLOAK_INFLIGHT = metrics.gauge("keycloak_inflight", "Keycloak calls in flight", ["endpoint"])
+STALE_SERVED = metrics.counter("keycloak_stale_served", "Cached Keycloak data served past its TTL", ["resource"])
+
+
+class KeycloakUnavailable(httpx.TransportError):
+    """A call was refused locally; ``retry_after`` is a hint in seconds"""
+
+    def __init__(self, message: str, endpoint: str, retry_after: float):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(KeycloakUnavailable):
+    """The endpoint's breaker is open"""
+
+
+class ConcurrencyLimitError(KeycloakUnavailable):
+    """Too many calls to the endpoint are already in flight"""
+
+
+def is_failure(result: Any = None, error: Optional[BaseException] = None) -> bool:
+    """Transport errors, timeouts and 5xx answers count against a breaker; 4xx do not"""
+    if error is not None:
+        if isinstance(error, (KeycloakUnavailable, deadlines.DeadlineExceeded)):
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+    return isinstance(result, httpx.Response) and result.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after ``failure_threshold`` consecutive failures; open ->
+    half-open after ``reset_timeout`` seconds, admitting ``half_open_max``
+    trial calls; a successful trial closes it, a failed one reopens it.
+    At most ``max_concurrency`` calls run at once in any state; others
+    wait up to ``queue_timeout`` seconds for a slot and are then refused.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_concurrency: int = 20,
+        queue_timeout: float = 5.0,
+        half_open_max: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.half_open_max = half_open_max
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.in_flight = 0
+        self._trials = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        BREAKER_STATE.labels(name).set(0)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        if state == OPEN:
+            self.opened_at = self.clock()
+        elif state == CLOSED:
+            self.failures = 0
+        BREAKER_STATE.labels(self.name).set(STATE_VALUES[state])
+        BREAKER_TRANSITIONS.labels(self.name, state).inc()
+        logger.log(logging.WARNING if state == OPEN else logging.INFO,
+                   "Keycloak breaker %s is now %s", self.name, state)
+
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 1.0
+        return max(self.reset_timeout - (self.clock() - self.opened_at), 1.0)
+
+    def _check_state(self) -> bool:
+        """Raise when the circuit refuses calls; returns whether this call is a half-open trial"""
+        if self.state == OPEN:
+            if self.clock() - self.opened_at < self.reset_timeout:
+                BREAKER_REJECTED.labels(self.name, "open").inc()
+                raise CircuitOpenError(f"Keycloak {self.name} circuit is open", self.name, self.retry_after())
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._trials >= self.half_open_max:
+                BREAKER_REJECTED.labels(self.name, "open").inc()
+                raise CircuitOpenError(f"Keycloak {self.name} circuit is half-open", self.name, self.retry_after())
+            return True
+        return False
+
+    def _slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore
+        if self._loop is not loop or semaphore is None:
+            # Slots held under a previous event loop can never be released
+            self._loop = loop
+            semaphore = self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.in_flight = 0
+            self._trials = 0
+        return semaphore
+
+    async def _acquire(self):
+        slots = self._slots()
+        if slots.locked():
+            wait = deadlines.timeout(self.queue_timeout)
+            try:
+                await asyncio.wait_for(slots.acquire(), wait)
+            except asyncio.TimeoutError:
+                if wait < self.queue_timeout:
+                    raise deadlines.DeadlineExceeded()
+                BREAKER_REJECTED.labels(self.name, "saturated").inc()
+                raise ConcurrencyLimitError(f"Too many concurrent Keycloak {self.name} calls", self.name, 1.0)
+        else:
+            await slots.acquire()
+        self.in_flight += 1
+        KEYCLOAK_INFLIGHT.labels(self.name).set(self.in_flight)
+
+    def _record(self, failed: bool, trial: bool):
+        self.in_flight -= 1
+        self._slots().release()
+        KEYCLOAK_INFLIGHT.labels(self.name).set(self.in_flight)
+        if trial:
+            self._trials -= 1
+        if failed:
+            BREAKER_FAILURES.labels(self.name).inc()
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._transition(OPEN)
+        elif self.state == HALF_OPEN or self.failures:
+            self.failures = 0
+            self._transition(CLOSED)
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """Run ``func`` under the breaker; failed responses are returned, but counted"""
+        self._slots()
+        trial = self._check_state()
+        if trial:
+            self._trials += 1
+        try:
+            await self._acquire()
+        except BaseException:
+            if trial:
+                self._trials -= 1
+            raise
+        try:
+            result = await func(*args, **kwargs)
+        except BaseException as e:
+            self._record(is_failure(error=e), trial)
+            raise
+        self._record(is_failure(result), trial)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "in_flight": self.in_flight}
@@ -0,0 +1,360 @@
+"""
+In-process JWT verification.
+
+Every JWKS key is parsed once into a ready-to-use ``cryptography`` public key
+object, and each token is verified by a function picked from its ``alg``
+header, so the hot path is one dict lookup plus one native signature check.
+``python-jose`` is only used as a fallback for algorithms the fast path does
+not handle (e.g. HMAC).
+"""
+import asyncio
+import base64
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, TypeGuard
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from jose import jwt as jose_jwt
+from jose.exceptions import JOSEError
+
+from . import deadlines, metrics
+from .config import settings
+from .keycloak import keycloak
+from .resilience import STALE_SERVED
+
+logger = logging.getLogger(__name__)
+
+VERIFICATIONS_OFFLOADED = metrics.counter(
+    "token_verifications_offloaded", "Token signature checks run in a worker thread"
+)
+
+
+class TokenError(Exception):
+    """Raised when a token cannot be verified"""
+
+
+class UnknownKeyError(TokenError):
+    """Raised when no loaded key matches the token's kid"""
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _is_number(value: Any) -> TypeGuard[float]:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _b64int(segment: str) -> int:
+    return int.from_bytes(_b64decode(segment), "big")
+
+
+_HASHES: Dict[str, hashes.HashAlgorithm] = {"256": hashes.SHA256(), "384": hashes.SHA384(), "512": hashes.SHA512()}
+_CURVES = {"P-256": ec.SECP256R1, "P-384": ec.SECP384R1, "P-521": ec.SECP521R1}
+_CURVE_BYTES = {"P-256": 32, "P-384": 48, "P-521": 66}
+
+
+def _rsa_pkcs1_verifier(public_key: rsa.RSAPublicKey, alg: str) -> Callable[[bytes, bytes], None]:
+    pad = padding.PKCS1v15()
+    algorithm = _HASHES[alg[2:]]
+
+    def verify(signature: bytes, data: bytes):
+        public_key.verify(signature, data, pad, algorithm)
+
+    return verify
+
+
+def _rsa_pss_verifier(public_key: rsa.RSAPublicKey, alg: str) -> Callable[[bytes, bytes], None]:
+    algorithm = _HASHES[alg[2:]]
+    pad = padding.PSS(mgf=padding.MGF1(algorithm), salt_length=algorithm.digest_size)
+
+    def verify(signature: bytes, data: bytes):
+        public_key.verify(signature, data, pad, algorithm)
+
+    return verify
+
+
+def _ec_verifier(public_key: ec.EllipticCurvePublicKey, alg: str, crv: str) -> Callable[[bytes, bytes], None]:
+    size = _CURVE_BYTES[crv]
+    algorithm = ec.ECDSA(_HASHES[alg[2:]])
+
+    def verify(signature: bytes, data: bytes):
+        # JWS carries ECDSA signatures as raw r || s, cryptography wants DER
+        if len(signature) != 2 * size:
+            raise InvalidSignature()
+        r = int.from_bytes(signature[:size], "big")
+        s = int.from_bytes(signature[size:], "big")
+        public_key.verify(encode_dss_signature(r, s), data, algorithm)
+
+    return verify
+
+
+def _eddsa_verifier(public_key) -> Callable[[bytes, bytes], None]:
+    def verify(signature: bytes, data: bytes):
+        public_key.verify(signature, data)
+
+    return verify
+
+
+class VerificationKey:
+    """A JWK parsed into a cryptography public key and a bound verify function"""
+
+    def __init__(self, jwk: Dict[str, Any]):
+        self.jwk = jwk
+        self.kid = jwk.get("kid")
+        self.kty = jwk.get("kty")
+        self.alg = jwk.get("alg") or self._default_alg()
+        self.public_key = self._load_public_key()
+        self._verifiers: Dict[str, Callable[[bytes, bytes], None]] = {}
+
+    def _default_alg(self) -> Optional[str]:
+        if self.kty == "RSA":
+            return "RS256"
+        if self.kty == "EC":
+            return {"P-256": "ES256", "P-384": "ES384", "P-521": "ES512"}.get(self.jwk.get("crv") or "")
+        if self.kty == "OKP":
+            return "EdDSA"
+        return None
+
+    def _load_public_key(self):
+        jwk = self.jwk
+        if self.kty == "RSA":
+            return rsa.RSAPublicNumbers(_b64int(jwk["e"]), _b64int(jwk["n"])).public_key()
+        if self.kty == "EC":
+            curve = _CURVES[jwk["crv"]]()
+            return ec.EllipticCurvePublicNumbers(_b64int(jwk["x"]), _b64int(jwk["y"]), curve).public_key()
+        if self.kty == "OKP":
+            raw = _b64decode(jwk["x"])
+            if jwk.get("crv") == "Ed25519":
+                return ed25519.Ed25519PublicKey.from_public_bytes(raw)
+            if jwk.get("crv") == "Ed448":
+                return ed448.Ed448PublicKey.from_public_bytes(raw)
+        return None
+
+    def verifier(self, alg: str) -> Optional[Callable[[bytes, bytes], None]]:
+        """Return the native verify function for ``alg``, or None if unsupported"""
+        verify = self._verifiers.get(alg)
+        if verify is not None or self.public_key is None:
+            return verify
+
+        if alg in ("RS256", "RS384", "RS512") and self.kty == "RSA":
+            verify = _rsa_pkcs1_verifier(self.public_key, alg)
+        elif alg in ("PS256", "PS384", "PS512") and self.kty == "RSA":
+            verify = _rsa_pss_verifier(self.public_key, alg)
+        elif alg in ("ES256", "ES384", "ES512") and self.kty == "EC":
+            verify = _ec_verifier(self.public_key, alg, self.jwk["crv"])
+        elif alg == "EdDSA" and self.kty == "OKP":
+            verify = _eddsa_verifier(self.public_key)
+
+        if verify is not None:
+            self._verifiers[alg] = verify
+        return verify
+
+
+class KeySet:
+    """Parsed JWKS indexed by key id"""
+
+    def __init__(self, keys: Optional[List[VerificationKey]] = None):
+        self.keys: Dict[Optional[str], VerificationKey] = {key.kid: key for key in keys or []}
+
+    @classmethod
+    def from_jwks(cls, jwks: Dict[str, Any]) -> "KeySet":
+        keys = []
+        for jwk in jwks.get("keys", []):
+            if jwk.get("use", "sig") != "sig":
+                continue
+            try:
+                key = VerificationKey(jwk)
+            except (KeyError, ValueError):
+                continue
+            # Pre-build the verifier for the advertised algorithm
+            if key.alg:
+                key.verifier(key.alg)
+            keys.append(key)
+        return cls(keys)
+
+    def get(self, kid: Optional[str]) -> Optional[VerificationKey]:
+        key = self.keys.get(kid)
+        if key is None and kid is None and len(self.keys) == 1:
+            key = next(iter(self.keys.values()))
+        return key
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class TokenVerifier:
+    """
+    Verifies bearer tokens against the realm JWKS.
+
+    The key set is fetched lazily, refreshed after ``ttl`` seconds, and
+    re-fetched early (at most once per ``min_refresh_interval``) when a token
+    references an unknown ``kid`` so key rotation is picked up. For
+    ``max_stale`` seconds past ``ttl`` the old key set keeps verifying while
+    one background task refreshes it, so a Keycloak outage does not fail
+    tokens signed with keys we already hold.
+
+    When ``offload`` returns true (the event loop is congested), the
+    signature check runs in a worker thread instead of on the loop.
+    """
+
+    def __init__(
+        self,
+        fetch_jwks: Callable[[], Any],
+        issuer: Optional[str] = None,
+        audience: Optional[str] = None,
+        algorithms: Optional[List[str]] = None,
+        ttl: float = 300.0,
+        min_refresh_interval: float = 30.0,
+        leeway: int = 0,
+        max_stale: float = 0.0,
+        offload: Optional[Callable[[], bool]] = None,
+    ):
+        self.fetch_jwks = fetch_jwks
+        self.issuer = issuer
+        self.audience = audience
+        self.algorithms = set(algorithms) if algorithms else None
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.leeway = leeway
+        self.max_stale = max_stale
+        self.offload = offload
+        self.key_set = KeySet()
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._revalidation: Optional[asyncio.Task] = None
+
+    @property
+    def age(self) -> Optional[float]:
+        """Seconds since the key set was fetched, or ``None`` before the first fetch"""
+        return time.monotonic() - self._fetched_at if self._fetched_at else None
+
+    def load(self, jwks: Dict[str, Any]):
+        """Install an already fetched JWKS"""
+        self.key_set = KeySet.from_jwks(jwks)
+        self._fetched_at = time.monotonic()
+
+    async def refresh(self, force: bool = False):
+        """Fetch and parse the JWKS unless a fresh enough copy is loaded"""
+        async with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if self._fetched_at and age < (self.min_refresh_interval if force else self.ttl):
+                return
+            self.load(await self.fetch_jwks())
+
+    def _revalidate(self):
+        """Refresh in the background unless a refresh is already running"""
+        task = self._revalidation
+        if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+            self._revalidation = asyncio.get_running_loop().create_task(self._background_refresh())
+
+    async def _background_refresh(self):
+        deadlines.detach()
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning("JWKS refresh failed, still serving the cached key set: %s", e)
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """Verify a token, refreshing the key set when needed"""
+        age = time.monotonic() - self._fetched_at
+        if not self._fetched_at or age >= self.ttl + self.max_stale:
+            await self.refresh()
+        elif age >= self.ttl:
+            STALE_SERVED.labels("jwks").inc()
+            self._revalidate()
+        try:
+            return await self._verify_sync(token)
+        except UnknownKeyError:
+            await self.refresh(force=True)
+            return await self._verify_sync(token)
+
+    async def _verify_sync(self, token: str) -> Dict[str, Any]:
+        if self.offload is not None and self.offload():
+            VERIFICATIONS_OFFLOADED.inc()
+            return await asyncio.to_thread(self.verify_sync, token)
+        return self.verify_sync(token)
+
+    def verify_sync(self, token: str) -> Dict[str, Any]:
+        """Verify a token against the currently loaded key set (no I/O)"""
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+        except (ValueError, TypeError):
+            raise TokenError("Malformed token")
+        if not isinstance(header, dict):
+            raise TokenError("Malformed token")
+
+        alg = header.get("alg")
+        if not isinstance(alg, str) or not alg or alg == "none" or (self.algorithms and alg not in self.algorithms):
+            raise TokenError(f"Algorithm not allowed: {alg}")
+        kid = header.get("kid")
+        if not isinstance(kid, (str, type(None))):
+            raise TokenError("Malformed token")
+
+        key = self.key_set.get(kid)
+        if key is None:
+            raise UnknownKeyError("Unknown signing key")
+        if key.alg and key.alg != alg:
+            raise TokenError(f"Algorithm {alg} does not match signing key")
+
+        verify = key.verifier(alg)
+        if verify is None:
+            claims = self._verify_with_jose(token, key, alg)
+        else:
+            try:
+                verify(_b64decode(signature_b64), f"{header_b64}.{payload_b64}".encode("ascii"))
+                claims = json.loads(_b64decode(payload_b64))
+            except (InvalidSignature, ValueError):
+                raise TokenError("Invalid token signature")
+
+        if not isinstance(claims, dict):
+            raise TokenError("Malformed token")
+        self._validate_claims(claims)
+        return claims
+
+    @staticmethod
+    def _verify_with_jose(token: str, key: VerificationKey, alg: str) -> Dict[str, Any]:
+        try:
+            return jose_jwt.decode(
+                token,
+                key.jwk,
+                algorithms=[alg],
+                options={"verify_aud": False, "verify_exp": False, "verify_iss": False},
+            )
+        except JOSEError:
+            raise TokenError("Invalid token signature")
+
+    def _validate_claims(self, claims: Dict[str, Any]):
+        now = time.time()
+        exp = claims.get("exp")
+        if not _is_number(exp):
+            raise TokenError("Token expired" if exp is None else "Invalid exp claim")
+        if now > exp + self.leeway:
+            raise TokenError("Token expired")
+        nbf = claims.get("nbf")
+        if nbf is not None and not _is_number(nbf):
+            raise TokenError("Invalid nbf claim")
+        if nbf is not None and now < nbf - self.leeway:
+            raise TokenError("Token not yet valid")
+        if self.issuer and claims.get("iss") != self.issuer:
+            raise TokenError("Invalid token issuer")
+        if self.audience:
+            aud = claims.get("aud")
+            audiences = aud if isinstance(aud, list) else [aud]
+            if self.audience not in audiences and claims.get("azp") != self.audience:
+                raise TokenError("Invalid token audience")
+
+
+token_verifier = TokenVerifier(
+    keycloak.get_jwks,
+    issuer=settings.token_issuer,
+    audience=settings.token_audience,
+    ttl=settings.jwks_ttl,
+    min_refresh_interval=settings.jwks_min_refresh_interval,
+    max_stale=settings.jwks_max_stale,
+)
@@ -0,0 +1,380 @@
+"""
+WireGuard client configuration generation.
+
+Configs are rendered on a small process pool and stored on disk under a
+content address derived from everything that goes into them (principal,
+VPN roles, server settings, template version), so an unchanged user is
+served straight from the file and a role change naturally yields a new
+file. Tunnel addresses come from a persistent SQLite table, so no two users
+ever share one. Users who gain a VPN role are pre-warmed from Keycloak admin
+events.
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import ipaddress
+import logging
+import multiprocessing
+import os
+import secrets
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+from . import metrics
+from .config import settings
+from .keycloak import KeycloakClient, keycloak
+
+logger = logging.getLogger(__name__)
+
+VPN_CONFIGS = metrics.counter("vpn_configs", "VPN config requests by cache outcome", ["outcome"])
+VPN_RENDER_SECONDS = metrics.histogram("vpn_render_seconds", "VPN config generation time (incl. pool wait)")
+
+TEMPLATE_VERSION = "1"
+
+# Networks each VPN role may reach; the union applies to users with several
+ROLE_NETWORKS: Dict[str, List[str]] = {
+    "vpn_admin": ["10.0.0.0/16"],
+    "vpn_user": ["10.0.10.0/24"],
+}
+VPN_ROLES = frozenset(ROLE_NETWORKS)
+CLIENT_NETWORK = ipaddress.IPv4Network("10.8.0.0/16")
+
+ADDRESS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS addresses (
+    sub TEXT PRIMARY KEY,
+    host INTEGER NOT NULL UNIQUE
+) WITHOUT ROWID;
+"""
+
+
+def vpn_roles(principal: Dict) -> List[str]:
+    return sorted(VPN_ROLES.intersection(principal.get("realm_access", {}).get("roles", [])))
+
+
+def render_config(secret: bytes, sub: str, username: str, roles: List[str], address: str,
+                  endpoint: str, server_public_key: str, dns: str) -> str:
+    """
+    Build one client config (runs in a worker process).
+
+    The client key is derived from the secret and ``sub`` so a re-render
+    after a cache loss yields the same key the server already knows.
+    """
+    seed = hmac.new(secret, f"wg-key:{sub}".encode("utf-8"), hashlib.sha256).digest()
+    private_key = X25519PrivateKey.from_private_bytes(seed)
+    public_key = private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+    allowed = sorted({net for role in roles for net in ROLE_NETWORKS[role]})
+
+    return "\n".join([
+        f"# {username} ({', '.join(roles)})",
+        f"# client public key: {base64.b64encode(public_key).decode('ascii')}",
+        "[Interface]",
+        f"PrivateKey = {base64.b64encode(seed).decode('ascii')}",
+        f"Address = {address}/32",
+        f"DNS = {dns}",
+        "",
+        "[Peer]",
+        f"PublicKey = {server_public_key}",
+        f"Endpoint = {endpoint}",
+        f"AllowedIPs = {', '.join(allowed)}",
+        "PersistentKeepalive = 25",
+        "",
+    ])
+
+
+class AddressTable:
+    """
+    Persistent ``sub`` -> client address allocations.
+
+    Every allocation runs on one thread owning the connection, and the
+    unique ``host`` column turns a collision into a probe of the next free
+    address. A user's first choice is still derived from ``sub``, so most
+    keep the address they would have had without the table.
+    """
+
+    def __init__(self, path: str, network: ipaddress.IPv4Network = CLIENT_NETWORK):
+        self.path = path
+        self.network = network
+        self.hosts = network.num_addresses - 2
+        self._local = threading.local()
+        self._thread: Optional[ThreadPoolExecutor] = None
+        self._known: Dict[str, str] = {}
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._thread is None:
+            self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vpn-addresses")
+        return self._thread
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ADDRESS_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _preferred(self, sub: str) -> int:
+        host_bits = int.from_bytes(hashlib.blake2b(sub.encode("utf-8"), digest_size=4).digest(), "big")
+        return host_bits % self.hosts
+
+    def _allocate(self, sub: str) -> str:
+        conn = self._connection()
+        row = conn.execute("SELECT host FROM addresses WHERE sub = ?", (sub,)).fetchone()
+        if row is None:
+            start = self._preferred(sub)
+            for offset in range(self.hosts):
+                host = (start + offset) % self.hosts + 1
+                try:
+                    with conn:
+                        conn.execute("INSERT INTO addresses (sub, host) VALUES (?, ?)", (sub, host))
+                except sqlite3.IntegrityError:
+                    continue
+                row = (host,)
+                break
+            else:
+                raise RuntimeError(f"VPN client network {self.network} is exhausted")
+        return str(self.network.network_address + row[0])
+
+    async def address(self, sub: str) -> str:
+        """The user's tunnel address, allocated on first use"""
+        address = self._known.get(sub)
+        if address is None:
+            address = await asyncio.get_running_loop().run_in_executor(self._executor(), self._allocate, sub)
+            self._known[sub] = address
+        return address
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.submit(self._close_connection).result()
+            self._thread.shutdown(wait=True)
+            self._thread = None
+
+    def _close_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as fp:
+        return fp.read()
+
+
+class VPNConfigStore:
+    """Content-addressed config files with pooled generation and in-flight dedupe"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        endpoint: str,
+        server_public_key: str,
+        dns: str = "10.0.0.2",
+        secret: Optional[str] = None,
+        max_workers: int = 1,
+        max_files: int = 10000,
+        address_db_path: Optional[str] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.addresses = AddressTable(address_db_path or os.path.join(cache_dir, "addresses.db"))
+        self.endpoint = endpoint
+        self.server_public_key = server_public_key
+        self.dns = dns
+        self._secret = secret.encode("utf-8") if secret else None
+        self.max_workers = max_workers
+        self.max_files = max_files
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._prewarm_tasks: set = set()
+        self._writes = 0
+
+    @property
+    def secret(self) -> bytes:
+        """Key-derivation secret (see ``load_secret``)"""
+        if self._secret is None:
+            raise RuntimeError("VPN key secret is not loaded")
+        return self._secret
+
+    def _read_secret(self) -> bytes:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, ".secret")
+        try:
+            with open(path, "rb") as fp:
+                return fp.read()
+        except FileNotFoundError:
+            value = secrets.token_bytes(32)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(value)
+            return value
+
+    async def load_secret(self) -> bytes:
+        """Read (or generate) the secret kept in the cache dir when none is configured, off the loop"""
+        if self._secret is None:
+            self._secret = await asyncio.to_thread(self._read_secret)
+        return self._secret
+
+    def digest(self, principal: Dict, address: str) -> str:
+        parts = [
+            TEMPLATE_VERSION, principal.get("sub") or "", principal.get("preferred_username") or "",
+            ",".join(vpn_roles(principal)), address, self.endpoint, self.server_public_key, self.dns,
+        ]
+        return hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=16,
+                               key=self.secret[:64]).hexdigest()
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.conf")
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def get(self, principal: Dict) -> str:
+        """Path of the principal's config file, generating it when missing"""
+        await self.load_secret()
+        address = await self.addresses.address(principal.get("sub") or "")
+        digest = self.digest(principal, address)
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            VPN_CONFIGS.labels("hit").inc()
+            return path
+
+        future = self._inflight.get(digest)
+        if future is not None:
+            VPN_CONFIGS.labels("joined").inc()
+            return await asyncio.shield(future)
+
+        VPN_CONFIGS.labels("miss").inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[digest] = future
+        try:
+            with VPN_RENDER_SECONDS.time():
+                text = await asyncio.get_running_loop().run_in_executor(
+                    self._executor(), render_config, self.secret, principal.get("sub") or "",
+                    principal.get("preferred_username") or "", vpn_roles(principal), address,
+                    self.endpoint, self.server_public_key, self.dns,
+                )
+            await asyncio.to_thread(self._write, path, text)
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody joined
+            raise
+        finally:
+            del self._inflight[digest]
+
+    async def read(self, principal: Dict) -> Tuple[str, bytes]:
+        """
+        Config id and contents of the principal's config. Served as bytes,
+        not a path: pruning may remove a file between lookup and send, in
+        which case it is generated again.
+        """
+        path = await self.get(principal)
+        try:
+            data = await asyncio.to_thread(_read_bytes, path)
+        except FileNotFoundError:
+            path = await self.get(principal)
+            data = await asyncio.to_thread(_read_bytes, path)
+        return os.path.basename(path).removesuffix(".conf"), data
+
+    def _write(self, path: str, text: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fp:
+            fp.write(text)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, path)
+        self._writes += 1
+        if self.max_files and self._writes % 100 == 0:
+            self._prune()
+
+    def _prune(self):
+        """Drop the least recently modified files beyond ``max_files``"""
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            files.extend(os.path.join(root, n) for n in names if n.endswith(".conf"))
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    # --- pre-warming ---------------------------------------------------
+
+    async def prewarm_user(self, client: KeycloakClient, user_id: str) -> Optional[str]:
+        """Generate the config of a Keycloak user (by id) if they hold a VPN role"""
+        user_response, roles_response = await asyncio.gather(
+            client.admin_request("GET", f"users/{user_id}"),
+            client.admin_request("GET", f"users/{user_id}/role-mappings/realm"),
+        )
+        if user_response.status_code != 200 or roles_response.status_code != 200:
+            return None
+        user = user_response.json()
+        principal = {
+            "sub": user["id"],
+            "preferred_username": user.get("username"),
+            "realm_access": {"roles": [role["name"] for role in roles_response.json()]},
+        }
+        if not vpn_roles(principal):
+            return None
+        return await self.get(principal)
+
+    def on_keycloak_event(self, kind: str, event: Dict[str, Any], client: KeycloakClient = keycloak):
+        """EventIngestor listener: pre-warm users who were just granted a VPN role"""
+        if kind != "admin" or event.get("resourceType") != "REALM_ROLE_MAPPING":
+            return
+        if event.get("operationType") != "CREATE":
+            return
+        representation = event.get("representation")
+        if representation and not any(role in representation for role in VPN_ROLES):
+            return
+        path = event.get("resourcePath") or ""
+        if not path.startswith("users/"):
+            return
+        task = asyncio.get_running_loop().create_task(self._prewarm(client, path.split("/")[1]))
+        self._prewarm_tasks.add(task)
+        task.add_done_callback(self._prewarm_tasks.discard)
+
+    async def _prewarm(self, client: KeycloakClient, user_id: str):
+        try:
+            if await self.prewarm_user(client, user_id):
+                VPN_CONFIGS.labels("prewarmed").inc()
+        except Exception as e:
+            logger.warning("Pre-warming VPN config for %s failed: %s", user_id, e)
+
+    def shutdown(self):
+        for task in list(self._prewarm_tasks):
+            task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        self.addresses.close()
+
+
+vpn_configs = VPNConfigStore(
+    settings.vpn_cache_dir,
+    settings.vpn_endpoint,
+    settings.vpn_server_public_key,
+    dns=settings.vpn_dns,
+    secret=settings.vpn_key_secret,
+    max_workers=settings.vpn_workers,
+    max_files=settings.vpn_cache_max_files,
+    address_db_path=settings.vpn_address_db_path,
+)
@@ -0,0 +1,134 @@
+"""
+Startup warm-up.
+
+After a deploy the first requests to a worker used to pay for the route
+policy table, the JWKS fetch, Keycloak connection setup and first-call
+costs along each route (dependency resolution, model validation, JSON
+encoding). The lifespan runs these steps in the background instead, while
+/ready keeps answering 503 until they are done. Steps are best effort: one
+that fails (Keycloak down during a deploy) is logged and counted, and does
+not keep the worker out of rotation for good.
+"""
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+
+from . import authz, metrics
+from .health import HealthProber, health_prober
+from .keycloak import KeycloakClient, keycloak
+from .tokens import TokenVerifier, token_verifier
+
+logger = logging.getLogger(__name__)
+
+WARMUP_STEP_SECONDS = metrics.gauge("warmup_step_seconds", "Duration of each startup warm-up step", ["step"])
+WARMUP_STEP_FAILURES = metrics.counter("warmup_step_failures", "Startup warm-up steps that failed", ["step"])
+WARMUP_COMPLETE = metrics.gauge("warmup_complete", "1 once startup warm-up has finished")
+
+_PATH_PARAM = re.compile(r"{[^}]+}")
+
+
+def synthetic_routes(app: FastAPI) -> List[Tuple[str, str]]:
+    """(method, path) for every API route, path parameters filled with a placeholder"""
+    return [
+        (method, _PATH_PARAM.sub("warmup", route.path))
+        for route in app.routes
+        if isinstance(route, APIRoute)
+        for method in sorted((route.methods or set()) - {"HEAD"})
+    ]
+
+
+async def synthetic_request(app, method: str, path: str) -> int:
+    """
+    Send one unauthenticated request through the whole middleware stack.
+    Protected routes stop at authentication with a 401, so nothing is
+    changed; the access log and load shedder skip requests marked warm-up.
+    """
+    done = asyncio.Event()
+    status = 0
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body", False):
+            done.set()
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "scheme": "http",
+        "method": method, "path": path, "raw_path": path.encode("utf-8"), "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"warmup")], "client": None, "server": ("warmup", 80),
+        "state": {"warmup": True},
+    }
+    await app(scope, receive, send)
+    return status
+
+
+class WarmUp:
+    """Runs named steps in order, each bounded by ``timeout``, timing each one"""
+
+    def __init__(self, steps: List[Tuple[str, Callable[[], Awaitable[Any]]]], prober: HealthProber,
+                 timeout: float = 10.0):
+        self.steps = steps
+        self.prober = prober
+        self.timeout = timeout
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    async def run(self) -> Dict[str, Dict[str, Any]]:
+        self.prober.hold("warmup")
+        WARMUP_COMPLETE.set(0)
+        try:
+            for name, step in self.steps:
+                start = time.perf_counter()
+                error = None
+                try:
+                    await asyncio.wait_for(step(), self.timeout)
+                except asyncio.TimeoutError:
+                    error = f"timed out after {self.timeout}s"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                elapsed = time.perf_counter() - start
+                WARMUP_STEP_SECONDS.labels(name).set(elapsed)
+                if error:
+                    WARMUP_STEP_FAILURES.labels(name).inc()
+                    logger.warning("Warm-up step %s failed after %.3fs: %s", name, elapsed, error)
+                self.results[name] = {"seconds": round(elapsed, 6), "error": error}
+        finally:
+            WARMUP_COMPLETE.set(1)
+            self.prober.release("warmup")
+        logger.info("Warm-up finished: %s", {n: r["seconds"] for n, r in self.results.items()})
+        return self.results
+
+
+def default_steps(app: FastAPI, client: KeycloakClient = keycloak, verifier: TokenVerifier = token_verifier,
+                  connections: int = 2) -> List[Tuple[str, Callable[[], Awaitable[Any]]]]:
+    async def policies():
+        authz.compile_route_policies(app)
+
+    async def jwks():
+        await verifier.refresh()
+
+    async def keycloak_pool():
+        # Concurrent requests each open a connection, which the pool keeps alive
+        responses = await asyncio.gather(*(client.ping() for _ in range(connections)))
+        for response in responses:
+            response.raise_for_status()
+
+    async def routes():
+        for method, path in synthetic_routes(app):
+            await synthetic_request(app, method, path)
+
+    return [("policies", policies), ("jwks", jwks), ("keycloak_pool", keycloak_pool), ("routes", routes)]
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Token verification throughput per core, by signing algorithm.
+
+Compares the app's pre-parsed ``cryptography`` fast path (app.tokens) with
+``python-jose`` decoding for RS256 (2048/4096), PS256, ES256 and EdDSA, so a
+realm signing algorithm can be picked from measured numbers.
+
+Usage (from backend/):
+    python -m benchmarks.bench_verify [--seconds 1.0]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from jose import jwt as jose_jwt
+
+from app.tokens import TokenVerifier
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def b64int(value: int, length: int = 0) -> str:
+    return b64(value.to_bytes(length or (value.bit_length() + 7) // 8, "big"))
+
+
+def make_key(alg: str, bits: int = 2048):
+    """Return (sign function, public JWK) for an algorithm"""
+    if alg in ("RS256", "PS256"):
+        private = rsa.generate_private_key(public_exponent=65537, key_size=bits)
+        numbers = private.public_key().public_numbers()
+        jwk = {"kty": "RSA", "n": b64int(numbers.n), "e": b64int(numbers.e)}
+        if alg == "RS256":
+            sign = lambda data: private.sign(data, padding.PKCS1v15(), hashes.SHA256())
+        else:
+            pss = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=32)
+            sign = lambda data: private.sign(data, pss, hashes.SHA256())
+    elif alg == "ES256":
+        private = ec.generate_private_key(ec.SECP256R1())
+        numbers = private.public_key().public_numbers()
+        jwk = {"kty": "EC", "crv": "P-256", "x": b64int(numbers.x, 32), "y": b64int(numbers.y, 32)}
+
+        def sign(data):
+            r, s = decode_dss_signature(private.sign(data, ec.ECDSA(hashes.SHA256())))
+            return r.to_bytes(32, "big") + s.to_bytes(32, "big")
+    elif alg == "EdDSA":
+        private = ed25519.Ed25519PrivateKey.generate()
+        raw = private.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        jwk = {"kty": "OKP", "crv": "Ed25519", "x": b64(raw)}
+        sign = private.sign
+    else:
+        raise ValueError(alg)
+
+    jwk.update({"kid": f"bench-{alg}", "alg": alg, "use": "sig"})
+    return sign, jwk
+
+
+def make_token(sign, jwk) -> str:
+    header = {"alg": jwk["alg"], "typ": "JWT", "kid": jwk["kid"]}
+    claims = {
+        "sub": "bench-user",
+        "preferred_username": "bench",
+        "exp": int(time.time()) + 3600,
+        "realm_access": {"roles": ["view_dashboard", "packages_viewer", "vpn_user"]},
+    }
+    signing_input = f"{b64(json.dumps(header).encode())}.{b64(json.dumps(claims).encode())}"
+    return f"{signing_input}.{b64(sign(signing_input.encode('ascii')))}"
+
+
+def measure(func, seconds: float) -> float:
+    """Calls per second of func over roughly ``seconds``"""
+    for _ in range(10):
+        func()
+    calls = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while True:
+        for _ in range(50):
+            func()
+        calls += 50
+        now = time.perf_counter()
+        if now >= deadline:
+            return calls / (now - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=1.0, help="Measurement time per case")
+    args = parser.parse_args()
+
+    cases = [("RS256", 2048), ("RS256", 4096), ("PS256", 2048), ("PS256", 4096), ("ES256", 0), ("EdDSA", 0)]
+    print(f"{'algorithm':<14}{'fast path ops/s':>18}{'jose ops/s':>14}{'us/verify':>12}")
+
+    for alg, bits in cases:
+        sign, jwk = make_key(alg, bits or 2048)
+        token = make_token(sign, jwk)
+
+        verifier = TokenVerifier(fetch_jwks=None)
+        verifier.load({"keys": [jwk]})
+        assert verifier.verify_sync(token)["sub"] == "bench-user"
+        fast = measure(lambda: verifier.verify_sync(token), args.seconds)
+
+        try:
+            jose_jwt.decode(token, jwk, algorithms=[alg])
+            jose = f"{measure(lambda: jose_jwt.decode(token, jwk, algorithms=[alg]), args.seconds):>14,.0f}"
+        except Exception:
+            jose = f"{'n/a':>14}"
+
+        label = f"{alg}/{bits}" if bits else alg
+        print(f"{label:<14}{fast:>18,.0f}{jose}{1e6 / fast:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
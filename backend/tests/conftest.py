@@ -2,6 +2,7 @@
 Test configuration and conftest.py for pytest
 """
 import pytest
+import pytest_asyncio
 import asyncio
 from unittest.mock import patch, Mock
 import os
@@ -22,6 +23,28 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(scope="session", autouse=True)
+def audit_log_in_tmp(tmp_path_factory):
+    """Keep the audit log's file sink out of the working tree"""
+    from app.audit import RotatingFileSink, audit_log
+    audit_log.sinks = [RotatingFileSink(str(tmp_path_factory.mktemp("audit") / "audit.log"))]
+
+
+@pytest.fixture(scope="session", autouse=True)
+def vpn_cache_in_tmp(tmp_path_factory):
+    """Keep generated VPN configs and address allocations out of the working tree"""
+    from app.vpn import vpn_configs
+    vpn_configs.cache_dir = str(tmp_path_factory.mktemp("vpn-cache"))
+    vpn_configs.addresses.path = os.path.join(vpn_configs.cache_dir, "addresses.db")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def package_catalog_in_tmp(tmp_path_factory):
+    """Keep the package catalog database out of the working tree"""
+    from app.packages import package_catalog
+    package_catalog.path = str(tmp_path_factory.mktemp("packages") / "packages.db")
+
+
 @pytest.fixture
 def test_settings():
     """Test settings configuration"""
@@ -163,3 +186,66 @@ def setup_test_environment():
 pytest.mark.unit = pytest.mark.unit
 pytest.mark.integration = pytest.mark.integration
 pytest.mark.slow = pytest.mark.slow
+
+
+class Clock:
+    """Manually advanced time source for components that take a ``clock``"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A Clock starting at 1000.0; advance it with ``clock.now += seconds``"""
+    return Clock()
+
+
+@pytest.fixture
+def headers():
+    """Builds trusted-proxy identity headers: ``headers(username, roles)``"""
+    def build(username, roles):
+        return {"X-User": username, "X-Preferred-Username": username, "X-Roles": roles}
+    return build
+
+
+@pytest.fixture
+def oidc_provider():
+    """Local OIDC provider stand-in with an admin and a regular user"""
+    from tests.fixtures.oidc_provider import OIDCProvider
+
+    provider = OIDCProvider(realm="test-realm")
+    provider.add_user("admin", "admin", roles=["admin", "user"])
+    provider.add_user("testuser", "password", roles=["user", "view_dashboard"])
+    return provider
+
+
+@pytest_asyncio.fixture
+async def oidc_client(oidc_provider):
+    """httpx.AsyncClient routed in-process to the OIDC provider stand-in"""
+    import httpx
+
+    transport = httpx.ASGITransport(app=oidc_provider.build_app())
+    async with httpx.AsyncClient(transport=transport, base_url=oidc_provider.base_url) as client:
+        yield client
+
+
+@pytest_asyncio.fixture
+async def stub_keycloak(oidc_provider):
+    """KeycloakClient wired in-process to the OIDC provider stand-in"""
+    import httpx
+    from app.keycloak import KeycloakClient
+
+    client = KeycloakClient(
+        oidc_provider.keycloak_url,
+        oidc_provider.realm,
+        oidc_provider.client_id,
+        transport=httpx.ASGITransport(app=oidc_provider.build_app()),
+        admin_username="admin",
+        admin_password="admin",
+    )
+    yield client
+    await client.aclose()
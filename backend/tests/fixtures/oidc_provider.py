@@ -0,0 +1,757 @@
+"""
+Local OIDC provider stand-in for tests and benchmarks.
+
+Serves the subset of the Keycloak HTTP surface the backend talks to
+(discovery, JWKS, token, introspection and the admin realm, role, client,
+group, user, role-mapping and event endpoints) and mints real
+RS256/ES256 signed tokens, so signature verification, key rotation and
+token-endpoint latency can be exercised fully offline.
+
+Use it in-process through the ``oidc_provider`` / ``oidc_client`` fixtures
+from ``conftest.py``, or run it as a process:
+
+    python -m tests.fixtures.oidc_provider --port 8081 --realm lab-test2
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from fastapi import APIRouter, FastAPI, Form, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from jose import JWTError, jwt
+
+
+def _b64url_uint(value: int) -> str:
+    """Encode an unsigned integer as unpadded base64url (JWK style)"""
+    raw = value.to_bytes((value.bit_length() + 7) // 8 or 1, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+class SigningKey:
+    """A generated signing key pair together with its public JWK"""
+
+    def __init__(self, alg: str = "RS256", kid: Optional[str] = None, rsa_bits: int = 2048):
+        self.alg = alg
+        self.kid = kid or uuid.uuid4().hex[:16]
+
+        if alg in ("RS256", "RS384", "RS512", "PS256"):
+            self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=rsa_bits)
+            numbers = self.private_key.public_key().public_numbers()
+            self.jwk = {"kty": "RSA", "n": _b64url_uint(numbers.n), "e": _b64url_uint(numbers.e)}
+        elif alg == "ES256":
+            self.private_key = ec.generate_private_key(ec.SECP256R1())
+            numbers = self.private_key.public_key().public_numbers()
+            self.jwk = {
+                "kty": "EC",
+                "crv": "P-256",
+                "x": base64.urlsafe_b64encode(numbers.x.to_bytes(32, "big")).rstrip(b"=").decode("ascii"),
+                "y": base64.urlsafe_b64encode(numbers.y.to_bytes(32, "big")).rstrip(b"=").decode("ascii"),
+            }
+        else:
+            raise ValueError(f"Unsupported signing algorithm: {alg}")
+
+        self.jwk.update({"kid": self.kid, "use": "sig", "alg": alg})
+        self.private_pem = self.private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+
+    def sign(self, claims: Dict[str, Any]) -> str:
+        """Sign claims into a compact JWT"""
+        return jwt.encode(claims, self.private_pem, algorithm=self.alg, headers={"kid": self.kid})
+
+
+class Fault:
+    """Latency and error injection settings for one endpoint"""
+
+    def __init__(self, latency: float = 0.0, status: Optional[int] = None, rate: float = 1.0):
+        self.latency = latency
+        self.status = status
+        self.rate = rate
+
+
+class OIDCProvider:
+    """
+    In-memory Keycloak stand-in.
+
+    Holds signing keys, realm users and fault settings, and builds a FastAPI
+    app exposing them under ``base_path`` (``/auth`` like our Keycloak).
+    """
+
+    ENDPOINTS = ("discovery", "jwks", "token", "introspect", "admin")
+
+    def __init__(
+        self,
+        realm: str = "test-realm",
+        base_url: str = "http://oidc-stub",
+        base_path: str = "/auth",
+        algorithms: Optional[List[str]] = None,
+        client_id: str = "test-client",
+    ):
+        self.realm = realm
+        self.base_url = base_url.rstrip("/")
+        self.base_path = base_path.rstrip("/")
+        self.client_id = client_id
+        self.keys: List[SigningKey] = [SigningKey(alg) for alg in (algorithms or ["RS256"])]
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.passwords: Dict[str, str] = {}
+        self.faults: Dict[str, Fault] = {}
+        self.request_counts: Dict[str, int] = {name: 0 for name in self.ENDPOINTS}
+        self._revoked: set = set()
+        # Admin API state; a single store is shared by every realm name
+        self.realms: Dict[str, Dict[str, Any]] = {realm: {"id": realm, "realm": realm, "enabled": True}}
+        self.roles: Dict[str, Dict[str, Any]] = {}
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        # Login and admin events, oldest first (the API serves newest first)
+        self.events: List[Dict[str, Any]] = []
+        self.admin_events: List[Dict[str, Any]] = []
+
+    # ------------------------------------------------------------------
+    # Keys and tokens
+    # ------------------------------------------------------------------
+
+    @property
+    def keycloak_url(self) -> str:
+        """Value to use for ``settings.keycloak_url`` when pointing at the stub"""
+        return self.base_url + self.base_path
+
+    def issuer(self, realm: Optional[str] = None) -> str:
+        return f"{self.keycloak_url}/realms/{realm or self.realm}"
+
+    def jwks(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {"keys": [key.jwk for key in self.keys]}
+
+    def rotate_keys(self, alg: Optional[str] = None, keep_previous: bool = True) -> SigningKey:
+        """Add a new active signing key, optionally dropping the old ones"""
+        key = SigningKey(alg or self.keys[0].alg)
+        self.keys = [key] + (self.keys if keep_previous else [])
+        return key
+
+    def mint_token(
+        self,
+        claims: Optional[Dict[str, Any]] = None,
+        alg: Optional[str] = None,
+        expires_in: int = 300,
+        realm: Optional[str] = None,
+    ) -> str:
+        """
+        Mint a signed access token.
+
+        Arbitrary ``claims`` override the defaults; ``alg`` selects the
+        first key of that algorithm (the active key when omitted).
+        """
+        key = self.keys[0]
+        if alg:
+            key = next((k for k in self.keys if k.alg == alg), None) or self.rotate_keys(alg)
+
+        now = int(time.time())
+        payload = {
+            "iss": self.issuer(realm),
+            "aud": "account",
+            "azp": self.client_id,
+            "typ": "Bearer",
+            "iat": now,
+            "exp": now + expires_in,
+            "jti": uuid.uuid4().hex,
+            "sub": uuid.uuid4().hex,
+            "realm_access": {"roles": []},
+        }
+        payload.update(claims or {})
+        return key.sign(payload)
+
+    def token_for_user(self, username: str, expires_in: int = 300, realm: Optional[str] = None) -> str:
+        """Mint a token carrying the claims of a stored user"""
+        user = self._find_by_username(username)
+        if user is None:
+            raise KeyError(username)
+        return self.mint_token(self._user_claims(user), expires_in=expires_in, realm=realm)
+
+    def decode(self, token: str) -> Dict[str, Any]:
+        """Verify a token against the current key set"""
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = next((k for k in self.keys if k.kid == kid), None)
+        if key is None:
+            raise JWTError("Unknown signing key")
+        return jwt.decode(token, key.jwk, algorithms=[key.alg], options={"verify_aud": False})
+
+    def revoke(self, token: str):
+        """Make introspection report a token as inactive"""
+        self._revoked.add(jwt.get_unverified_claims(token).get("jti"))
+
+    # ------------------------------------------------------------------
+    # Users
+    # ------------------------------------------------------------------
+
+    def add_user(
+        self,
+        username: str,
+        password: str = "password",
+        roles: Optional[List[str]] = None,
+        groups: Optional[List[str]] = None,
+        **attributes: Any,
+    ) -> Dict[str, Any]:
+        """Create a realm user; extra keyword arguments become representation fields"""
+        user = {
+            "id": str(uuid.uuid4()),
+            "username": username,
+            "email": attributes.pop("email", f"{username}@example.com"),
+            "firstName": attributes.pop("firstName", username.capitalize()),
+            "lastName": attributes.pop("lastName", "User"),
+            "enabled": attributes.pop("enabled", True),
+            "emailVerified": attributes.pop("emailVerified", True),
+            "requiredActions": attributes.pop("requiredActions", []),
+            "createdTimestamp": int(time.time() * 1000),
+            "realmRoles": list(roles or []),
+            "groups": list(groups or []),
+        }
+        user.update(attributes)
+        for role in user["realmRoles"]:
+            if role not in self.roles:
+                self.add_role(role)
+        self.users[user["id"]] = user
+        self.passwords[user["id"]] = password
+        return user
+
+    def add_role(self, name: str, description: str = "", **attributes: Any) -> Dict[str, Any]:
+        role = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "description": description,
+            "composite": False,
+            "clientRole": False,
+            "containerId": self.realm,
+        }
+        role.update(attributes)
+        self.roles[name] = role
+        return role
+
+    def add_client(self, client_id: str, **attributes: Any) -> Dict[str, Any]:
+        client = {"id": str(uuid.uuid4()), "clientId": client_id, "enabled": True, "publicClient": True}
+        client.update(attributes)
+        self.clients[client["id"]] = client
+        return client
+
+    def add_group(self, name: str, **attributes: Any) -> Dict[str, Any]:
+        group = {"id": str(uuid.uuid4()), "name": name, "path": f"/{name}", "subGroups": [], "attributes": {}}
+        group.update(attributes)
+        self.groups[group["id"]] = group
+        return group
+
+    def add_event(self, type: str, user_id: Optional[str] = None, client_id: Optional[str] = None,
+                  ip_address: str = "127.0.0.1", time_ms: Optional[int] = None, **details: Any) -> Dict[str, Any]:
+        """Record a login event (LOGIN, LOGIN_ERROR, LOGOUT, ...)"""
+        event = {
+            "id": str(uuid.uuid4()),
+            "time": time_ms if time_ms is not None else int(time.time() * 1000),
+            "type": type,
+            "realmId": self.realm,
+            "clientId": client_id or self.client_id,
+            "userId": user_id,
+            "ipAddress": ip_address,
+            "details": details,
+        }
+        self.events.append(event)
+        return event
+
+    def add_admin_event(self, operation: str, resource_type: str, resource_path: str,
+                        user_id: Optional[str] = None, time_ms: Optional[int] = None,
+                        representation: Optional[str] = None) -> Dict[str, Any]:
+        """Record an admin event (CREATE/UPDATE/DELETE/ACTION on a resource)"""
+        event = {
+            "id": str(uuid.uuid4()),
+            "time": time_ms if time_ms is not None else int(time.time() * 1000),
+            "realmId": self.realm,
+            "authDetails": {"realmId": "master", "clientId": "admin-cli", "userId": user_id, "ipAddress": "127.0.0.1"},
+            "operationType": operation,
+            "resourceType": resource_type,
+            "resourcePath": resource_path,
+        }
+        if representation is not None:
+            event["representation"] = representation
+        self.admin_events.append(event)
+        return event
+
+    def _find_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        return next((u for u in self.users.values() if u["username"] == username), None)
+
+    def _user_claims(self, user: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "sub": user["id"],
+            "preferred_username": user["username"],
+            "email": user.get("email"),
+            "given_name": user.get("firstName"),
+            "family_name": user.get("lastName"),
+            "realm_access": {"roles": list(user.get("realmRoles", []))},
+            "groups": list(user.get("groups", [])),
+        }
+
+    @staticmethod
+    def _representation(user: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in user.items() if k not in ("realmRoles", "groups")}
+
+    # ------------------------------------------------------------------
+    # Fault injection
+    # ------------------------------------------------------------------
+
+    def inject(self, endpoint: str, latency: float = 0.0, status: Optional[int] = None, rate: float = 1.0):
+        """
+        Add latency (seconds) to every call of an endpoint and/or answer a
+        fraction ``rate`` of its calls with error ``status``.
+        """
+        if endpoint not in self.ENDPOINTS:
+            raise ValueError(f"Unknown endpoint {endpoint!r}, expected one of {self.ENDPOINTS}")
+        self.faults[endpoint] = Fault(latency=latency, status=status, rate=rate)
+
+    def clear_faults(self):
+        self.faults.clear()
+
+    async def _enter(self, endpoint: str):
+        self.request_counts[endpoint] += 1
+        fault = self.faults.get(endpoint)
+        if fault is None:
+            return
+        if fault.latency:
+            await asyncio.sleep(fault.latency)
+        if fault.status and random.random() < fault.rate:
+            raise HTTPException(status_code=fault.status, detail="Injected fault")
+
+    # ------------------------------------------------------------------
+    # HTTP surface
+    # ------------------------------------------------------------------
+
+    def _require_admin_token(self, request: Request):
+        auth = request.headers.get("authorization", "")
+        if not auth.startswith("Bearer "):
+            raise HTTPException(status_code=401, detail="HTTP 401 Unauthorized")
+        try:
+            self.decode(auth[7:])
+        except JWTError:
+            raise HTTPException(status_code=401, detail="HTTP 401 Unauthorized")
+
+    def _get_user(self, user_id: str) -> Dict[str, Any]:
+        user = self.users.get(user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return user
+
+    def _role_name_by_id(self, role: Dict[str, Any]) -> str:
+        # Keycloak's RoleMapperResource resolves each representation by id only
+        for candidate in self.roles.values():
+            if candidate["id"] == role.get("id"):
+                return candidate["name"]
+        raise HTTPException(status_code=404, detail="Role not found")
+
+    def build_app(self) -> FastAPI:
+        """Build the ASGI app serving this provider"""
+        app = FastAPI(title="OIDC stand-in")
+        router = APIRouter(prefix=self.base_path)
+        provider = self
+
+        @router.get("/realms/{realm}/.well-known/openid-configuration")
+        async def discovery(realm: str):
+            await provider._enter("discovery")
+            issuer = provider.issuer(realm)
+            return {
+                "issuer": issuer,
+                "authorization_endpoint": f"{issuer}/protocol/openid-connect/auth",
+                "token_endpoint": f"{issuer}/protocol/openid-connect/token",
+                "introspection_endpoint": f"{issuer}/protocol/openid-connect/token/introspect",
+                "userinfo_endpoint": f"{issuer}/protocol/openid-connect/userinfo",
+                "end_session_endpoint": f"{issuer}/protocol/openid-connect/logout",
+                "jwks_uri": f"{issuer}/protocol/openid-connect/certs",
+                "grant_types_supported": ["password", "client_credentials", "refresh_token"],
+                "id_token_signing_alg_values_supported": sorted({k.alg for k in provider.keys}),
+            }
+
+        @router.get("/realms/{realm}/protocol/openid-connect/certs")
+        async def certs(realm: str):
+            await provider._enter("jwks")
+            return provider.jwks()
+
+        @router.post("/realms/{realm}/protocol/openid-connect/token")
+        async def token(
+            realm: str,
+            grant_type: str = Form(...),
+            client_id: Optional[str] = Form(None),
+            username: Optional[str] = Form(None),
+            password: Optional[str] = Form(None),
+            refresh_token: Optional[str] = Form(None),
+        ):
+            await provider._enter("token")
+
+            if grant_type == "password":
+                user = provider._find_by_username(username or "")
+                if user is None or provider.passwords.get(user["id"]) != password:
+                    provider.add_event("LOGIN_ERROR", user["id"] if user else None, client_id,
+                                       error="invalid_user_credentials", username=username)
+                    return JSONResponse(
+                        status_code=401,
+                        content={"error": "invalid_grant", "error_description": "Invalid user credentials"},
+                    )
+                if user.get("requiredActions"):
+                    return JSONResponse(
+                        status_code=400,
+                        content={"error": "invalid_grant", "error_description": "Account is not fully set up"},
+                    )
+                claims = provider._user_claims(user)
+                provider.add_event("LOGIN", user["id"], client_id, username=username)
+            elif grant_type == "client_credentials":
+                claims = {"sub": f"service-account-{client_id}", "preferred_username": f"service-account-{client_id}"}
+            elif grant_type == "refresh_token":
+                try:
+                    claims = provider.decode(refresh_token or "")
+                    # Like Keycloak, only a refresh token is accepted here (not an access token)
+                    if claims.get("typ") != "Refresh":
+                        raise JWTError("Not a refresh token")
+                except JWTError:
+                    return JSONResponse(
+                        status_code=400,
+                        content={"error": "invalid_grant", "error_description": "Invalid refresh token"},
+                    )
+                claims = {k: v for k, v in claims.items() if k not in ("iat", "exp", "jti", "typ")}
+            else:
+                return JSONResponse(status_code=400, content={"error": "unsupported_grant_type"})
+
+            return {
+                "access_token": provider.mint_token(claims, realm=realm),
+                "refresh_token": provider.mint_token({**claims, "typ": "Refresh"}, expires_in=1800, realm=realm),
+                "expires_in": 300,
+                "refresh_expires_in": 1800,
+                "token_type": "Bearer",
+            }
+
+        @router.post("/realms/{realm}/protocol/openid-connect/token/introspect")
+        async def introspect(realm: str, token: str = Form(...)):
+            await provider._enter("introspect")
+            try:
+                claims = provider.decode(token)
+            except JWTError:
+                return {"active": False}
+            if claims.get("jti") in provider._revoked:
+                return {"active": False}
+            return {"active": True, **claims}
+
+        @router.get("/admin/realms/{realm}/users")
+        async def list_users(
+            realm: str,
+            request: Request,
+            first: int = 0,
+            max: int = 100,
+            search: Optional[str] = None,
+            username: Optional[str] = None,
+            exact: bool = False,
+        ):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            users = list(provider.users.values())
+            if username is not None:
+                users = [
+                    u for u in users
+                    if (u["username"] == username if exact else username.lower() in u["username"].lower())
+                ]
+            if search:
+                needle = search.lower()
+                users = [u for u in users if needle in u["username"].lower() or needle in (u.get("email") or "")]
+            return [provider._representation(u) for u in users[first:first + max]]
+
+        @router.get("/admin/realms/{realm}/events")
+        async def list_events(realm: str, request: Request, first: int = 0, max: int = 100,
+                              type: Optional[List[str]] = Query(None), user: Optional[str] = None):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            events = [
+                e for e in sorted(provider.events, key=lambda e: e["time"], reverse=True)
+                if (not type or e["type"] in type) and (user is None or e["userId"] == user)
+            ]
+            return events[first:first + max]
+
+        @router.get("/admin/realms/{realm}/admin-events")
+        async def list_admin_events(realm: str, request: Request, first: int = 0, max: int = 100):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            events = sorted(provider.admin_events, key=lambda e: e["time"], reverse=True)
+            return events[first:first + max]
+
+        @router.get("/admin/realms/{realm}/users/count")
+        async def count_users(realm: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            return len(provider.users)
+
+        @router.post("/admin/realms/{realm}/users", status_code=201)
+        async def create_user(realm: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            body = await request.json()
+            if provider._find_by_username(body.get("username", "")):
+                raise HTTPException(status_code=409, detail="User exists with same username")
+            credentials = body.pop("credentials", None) or [{}]
+            user = provider.add_user(
+                body.pop("username"),
+                password=credentials[0].get("value", "password"),
+                **{k: v for k, v in body.items() if k != "id"},
+            )
+            location = f"{provider.keycloak_url}/admin/realms/{realm}/users/{user['id']}"
+            return JSONResponse(status_code=201, content=None, headers={"Location": location})
+
+        @router.get("/admin/realms/{realm}/users/{user_id}")
+        async def get_user(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            return provider._representation(provider._get_user(user_id))
+
+        @router.put("/admin/realms/{realm}/users/{user_id}", status_code=204)
+        async def update_user(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            user = provider._get_user(user_id)
+            body = await request.json()
+            user.update({k: v for k, v in body.items() if k not in ("id", "credentials")})
+
+        @router.put("/admin/realms/{realm}/users/{user_id}/reset-password", status_code=204)
+        async def reset_password(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            provider._get_user(user_id)
+            body = await request.json()
+            provider.passwords[user_id] = body.get("value", "")
+
+        @router.delete("/admin/realms/{realm}/users/{user_id}", status_code=204)
+        async def delete_user(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            provider._get_user(user_id)
+            del provider.users[user_id]
+            provider.passwords.pop(user_id, None)
+
+        @router.post("/admin/realms", status_code=201)
+        async def create_realm(request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            body = await request.json()
+            if body["realm"] in provider.realms:
+                raise HTTPException(status_code=409, detail="Conflict detected. See logs for details")
+            provider.realms[body["realm"]] = {"id": body["realm"], **body}
+
+        @router.get("/admin/realms/{realm}")
+        async def get_realm(realm: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if realm not in provider.realms:
+                raise HTTPException(status_code=404, detail="Realm not found.")
+            return provider.realms[realm]
+
+        @router.put("/admin/realms/{realm}", status_code=204)
+        async def update_realm(realm: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if realm not in provider.realms:
+                raise HTTPException(status_code=404, detail="Realm not found.")
+            provider.realms[realm].update(await request.json())
+
+        @router.get("/admin/realms/{realm}/roles")
+        async def list_roles(realm: str, request: Request, first: int = 0, max: int = 100):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            return list(provider.roles.values())[first:first + max]
+
+        @router.post("/admin/realms/{realm}/roles", status_code=201)
+        async def create_role(realm: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            body = await request.json()
+            if body["name"] in provider.roles:
+                raise HTTPException(status_code=409, detail=f"Role with name {body['name']} already exists")
+            provider.add_role(**{k: v for k, v in body.items() if k != "id"})
+
+        @router.get("/admin/realms/{realm}/roles/{name}")
+        async def get_role(realm: str, name: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if name not in provider.roles:
+                raise HTTPException(status_code=404, detail="Could not find role")
+            return provider.roles[name]
+
+        @router.put("/admin/realms/{realm}/roles/{name}", status_code=204)
+        async def update_role(realm: str, name: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if name not in provider.roles:
+                raise HTTPException(status_code=404, detail="Could not find role")
+            body = await request.json()
+            provider.roles[name].update({k: v for k, v in body.items() if k not in ("id", "name")})
+
+        @router.delete("/admin/realms/{realm}/roles/{name}", status_code=204)
+        async def delete_role(realm: str, name: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if provider.roles.pop(name, None) is None:
+                raise HTTPException(status_code=404, detail="Could not find role")
+            for user in provider.users.values():
+                if name in user["realmRoles"]:
+                    user["realmRoles"].remove(name)
+
+        @router.get("/admin/realms/{realm}/roles/{name}/users")
+        async def list_role_users(realm: str, name: str, request: Request, first: int = 0, max: int = 100):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if name not in provider.roles:
+                raise HTTPException(status_code=404, detail="Could not find role")
+            users = [u for u in provider.users.values() if name in u["realmRoles"]]
+            return [provider._representation(u) for u in users[first:first + max]]
+
+        @router.get("/admin/realms/{realm}/clients")
+        async def list_clients(realm: str, request: Request, clientId: Optional[str] = None,
+                               first: int = 0, max: int = 100):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            clients = [c for c in provider.clients.values() if clientId is None or c["clientId"] == clientId]
+            return clients[first:first + max]
+
+        @router.post("/admin/realms/{realm}/clients", status_code=201)
+        async def create_client(realm: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            body = await request.json()
+            if any(c["clientId"] == body["clientId"] for c in provider.clients.values()):
+                raise HTTPException(status_code=409, detail=f"Client {body['clientId']} already exists")
+            provider.add_client(body.pop("clientId"), **{k: v for k, v in body.items() if k != "id"})
+
+        @router.put("/admin/realms/{realm}/clients/{client_id}", status_code=204)
+        async def update_client(realm: str, client_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if client_id not in provider.clients:
+                raise HTTPException(status_code=404, detail="Could not find client")
+            body = await request.json()
+            provider.clients[client_id].update({k: v for k, v in body.items() if k != "id"})
+
+        @router.delete("/admin/realms/{realm}/clients/{client_id}", status_code=204)
+        async def delete_client(realm: str, client_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if provider.clients.pop(client_id, None) is None:
+                raise HTTPException(status_code=404, detail="Could not find client")
+
+        @router.get("/admin/realms/{realm}/groups")
+        async def list_groups(realm: str, request: Request, first: int = 0, max: int = 100):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            return list(provider.groups.values())[first:first + max]
+
+        @router.post("/admin/realms/{realm}/groups", status_code=201)
+        async def create_group(realm: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            body = await request.json()
+            if any(g["name"] == body["name"] for g in provider.groups.values()):
+                raise HTTPException(status_code=409, detail=f"Top level group named '{body['name']}' already exists.")
+            provider.add_group(body.pop("name"), **{k: v for k, v in body.items() if k != "id"})
+
+        @router.put("/admin/realms/{realm}/groups/{group_id}", status_code=204)
+        async def update_group(realm: str, group_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if group_id not in provider.groups:
+                raise HTTPException(status_code=404, detail="Could not find group by id")
+            body = await request.json()
+            provider.groups[group_id].update({k: v for k, v in body.items() if k != "id"})
+
+        @router.delete("/admin/realms/{realm}/groups/{group_id}", status_code=204)
+        async def delete_group(realm: str, group_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            if provider.groups.pop(group_id, None) is None:
+                raise HTTPException(status_code=404, detail="Could not find group by id")
+
+        @router.get("/admin/realms/{realm}/users/{user_id}/role-mappings/realm")
+        async def get_role_mappings(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            user = provider._get_user(user_id)
+            return [provider.roles[name] for name in user["realmRoles"] if name in provider.roles]
+
+        @router.get("/admin/realms/{realm}/users/{user_id}/groups")
+        async def get_user_groups(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            user = provider._get_user(user_id)
+            by_name = {g["name"]: g for g in provider.groups.values()}
+            return [by_name.get(name, {"id": name, "name": name, "path": f"/{name}"}) for name in user["groups"]]
+
+        @router.post("/admin/realms/{realm}/users/{user_id}/role-mappings/realm", status_code=204)
+        async def add_role_mappings(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            user = provider._get_user(user_id)
+            roles = await request.json()
+            for role in roles:
+                name = provider._role_name_by_id(role)
+                if name not in user["realmRoles"]:
+                    user["realmRoles"].append(name)
+            provider.add_admin_event("CREATE", "REALM_ROLE_MAPPING", f"users/{user_id}/role-mappings/realm",
+                                     representation=json.dumps(roles))
+
+        @router.delete("/admin/realms/{realm}/users/{user_id}/role-mappings/realm", status_code=204)
+        async def remove_role_mappings(realm: str, user_id: str, request: Request):
+            await provider._enter("admin")
+            provider._require_admin_token(request)
+            user = provider._get_user(user_id)
+            for role in await request.json():
+                name = provider._role_name_by_id(role)
+                if name in user["realmRoles"]:
+                    user["realmRoles"].remove(name)
+
+        app.include_router(router)
+
+        @app.exception_handler(HTTPException)
+        async def http_exception_handler(request, exc):
+            return JSONResponse(status_code=exc.status_code, content={"error": exc.detail})
+
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local OIDC provider stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--realm", default="lab-test2")
+    parser.add_argument("--alg", action="append", dest="algorithms", help="Signing algorithm (repeatable)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latency in seconds added to every endpoint")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--user", action="append", default=[], help="username:password[:role,role]")
+    args = parser.parse_args()
+
+    provider = OIDCProvider(
+        realm=args.realm,
+        base_url=f"http://{args.host}:{args.port}",
+        algorithms=args.algorithms,
+    )
+    for spec in args.user or ["admin:admin:admin", "user:user:view_dashboard"]:
+        username, password, *rest = spec.split(":")
+        provider.add_user(username, password, roles=rest[0].split(",") if rest else [])
+    if args.latency or args.error_rate:
+        for endpoint in provider.ENDPOINTS:
+            provider.inject(
+                endpoint,
+                latency=args.latency,
+                status=503 if args.error_rate else None,
+                rate=args.error_rate or 1.0,
+            )
+
+    import uvicorn
+    print(f"Issuer: {provider.issuer()}")
+    uvicorn.run(provider.build_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Integration tests for console jobs running on the worker process pool
+"""
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.jobs import Job, JobManager, job_manager
+from app.main import app
+
+
+def headers(username, roles="console_accesser"):
+    return {"X-User": username, "X-Preferred-Username": username, "X-Roles": roles}
+
+
+@pytest.fixture(scope="module")
+def client():
+    """One event loop for the whole module, so the pool and jobs share it"""
+    with TestClient(app) as client:
+        yield client
+
+
+def wait_for(client, job_id, user="alice", timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/console/jobs/{job_id}", headers=headers(user)).json()
+        if job["status"] in ("succeeded", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+class TestConsoleJobs:
+    """Test submitting, polling and streaming console jobs"""
+
+    @pytest.mark.integration
+    def test_submit_and_poll(self, client):
+        response = client.post("/api/console", json={"command": "echo", "args": ["hello", "world"]},
+                               headers=headers("alice"))
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        job = wait_for(client, job_id)
+        assert job["status"] == "succeeded"
+        assert job["output"] == ["hello world"]
+        assert job["owner"] == "alice"
+
+    @pytest.mark.integration
+    def test_stream_sse(self, client):
+        job_id = client.post("/api/console", json={"command": "sleep", "args": ["0.5"]},
+                             headers=headers("alice")).json()["job_id"]
+        with client.stream("GET", f"/api/console/jobs/{job_id}/stream", headers=headers("alice")) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            body = "".join(response.iter_text())
+
+        events = [block for block in body.split("\n\n") if block.startswith("event:")]
+        assert events[0] == "event: output\ndata: 50%"
+        assert events[-2] == "event: output\ndata: 100%"
+        assert events[-1] == "event: status\ndata: succeeded"
+
+    @pytest.mark.integration
+    def test_failures_and_visibility(self, client):
+        response = client.post("/api/console", json={"command": "sleep", "args": ["soon"]}, headers=headers("alice"))
+        job = wait_for(client, response.json()["job_id"])
+        assert job["status"] == "failed"
+        assert job["error"].startswith("ValueError")
+
+        # Other users cannot see the job; admins can
+        assert client.get(f"/api/console/jobs/{job['job_id']}", headers=headers("bob")).status_code == 404
+        admin = client.get(f"/api/console/jobs/{job['job_id']}", headers=headers("root", "admin,console_admin"))
+        assert admin.status_code == 200
+
+        response = client.post("/api/console", json={"command": "rm"}, headers=headers("alice"))
+        assert response.status_code == 400
+
+    @pytest.mark.integration
+    def test_per_user_limit(self, client, monkeypatch):
+        monkeypatch.setattr(job_manager, "per_user_limit", 1)
+        first = client.post("/api/console", json={"command": "sleep", "args": ["1"]}, headers=headers("carol"))
+        second = client.post("/api/console", json={"command": "echo"}, headers=headers("carol"))
+        other = client.post("/api/console", json={"command": "echo"}, headers=headers("dave"))
+
+        assert first.status_code == 202
+        assert second.status_code == 429
+        assert other.status_code == 202
+        wait_for(client, first.json()["job_id"], user="carol")
+        assert client.post("/api/console", json={"command": "echo"}, headers=headers("carol")).status_code == 202
+
+    @pytest.mark.integration
+    def test_queued_job_expires_with_request_deadline(self, client):
+        busy = [
+            client.post("/api/console", json={"command": "sleep", "args": ["1"]}, headers=headers(user)).json()["job_id"]
+            for user in ("erin", "frank")
+        ]
+        response = client.post("/api/console", json={"command": "echo", "args": ["late"]},
+                               headers={**headers("grace"), "X-Request-Timeout": "0.2"})
+        assert response.status_code == 202
+
+        job = wait_for(client, response.json()["job_id"], user="grace")
+        assert job["status"] == "cancelled"
+        assert job["output"] == []
+        assert "deadline" in job["error"]
+        for job_id, user in zip(busy, ("erin", "frank")):
+            assert wait_for(client, job_id, user=user)["status"] == "succeeded"
+
+
+class TestJobBuffer:
+    """Test output buffering without a pool"""
+
+    @pytest.mark.unit
+    def test_lines_since_skips_evicted_output(self):
+        manager = JobManager(max_output_lines=3)
+        job = Job("alice", "echo", [], manager.max_output_lines)
+        for i in range(5):
+            job.append(str(i))
+        assert job.lines_since(0) == ["2", "3", "4"]
+        assert job.lines_since(4) == ["4"]
+        assert job.lines_since(5) == []
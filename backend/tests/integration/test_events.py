@@ -0,0 +1,194 @@
+"""
+Integration tests for Keycloak event ingestion against the local Admin API stand-in
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.events import EventIngestor, EventStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def ingestor(stub_keycloak, store):
+    return EventIngestor(stub_keycloak, store, page_size=25, batch_size=40)
+
+
+class TestEventIngestion:
+    """Test polling, batching and querying events"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_poll_and_aggregate(self, oidc_provider, ingestor, store):
+        """Events across several pages land once each and can be aggregated"""
+        user_id = next(u["id"] for u in oidc_provider.users.values() if u["username"] == "testuser")
+        base = int(time.time() * 1000) - 60_000
+        for i in range(60):
+            oidc_provider.add_event("LOGIN" if i % 3 else "LOGIN_ERROR", user_id, time_ms=base + i)
+        oidc_provider.add_admin_event("CREATE", "USER", "users/1", time_ms=base + 100)
+
+        await ingestor.poll_once()
+        written = await ingestor.flush()
+
+        # The admin client's own token request is logged as a LOGIN event too
+        assert written == len(oidc_provider.events) + 1 == 62
+        counts = {row["key"]: row["count"] for row in await store.summary("type", until=base + 1000)}
+        assert counts == {"LOGIN": 40, "LOGIN_ERROR": 20, "CREATE:USER": 1}
+
+        recent = await store.recent(user_id=user_id, type="LOGIN_ERROR", limit=5)
+        assert len(recent) == 5
+        assert [e["time"] for e in recent] == sorted((e["time"] for e in recent), reverse=True)
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_repoll_only_fetches_new_events(self, oidc_provider, ingestor, store):
+        base = int(time.time() * 1000) - 60_000
+        for i in range(30):
+            oidc_provider.add_event("LOGIN", time_ms=base + i)
+        await ingestor.poll_once()
+        await ingestor.flush()
+
+        oidc_provider.add_event("LOGOUT", time_ms=base + 120_000)
+        queued = await ingestor.poll_once()
+        await ingestor.flush()
+
+        # Only the boundary event and the new one come back; the store keeps one copy
+        assert queued <= 3
+        counts = {row["key"]: row["count"] for row in await store.summary("type")}
+        assert counts["LOGOUT"] == 1
+        assert counts["LOGIN"] == len([e for e in oidc_provider.events if e["type"] == "LOGIN"])
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_listeners_see_each_event_once(self, oidc_provider, ingestor):
+        seen = []
+        ingestor.add_listener(lambda kind, event: seen.append(event["id"]))
+        base = int(time.time() * 1000) + 60_000
+        for i in range(3):
+            oidc_provider.add_event("LOGIN", time_ms=base)
+        await ingestor.poll_once()
+        oidc_provider.add_event("LOGOUT", time_ms=base)
+        await ingestor.poll_once()
+        await ingestor.poll_once()
+
+        assert sorted(seen) == sorted(e["id"] for e in oidc_provider.events)
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_history_is_not_replayed_to_listeners(self, oidc_provider, ingestor, store):
+        """Events older than the ingestor are stored but not announced"""
+        seen = []
+        ingestor.add_listener(lambda kind, event: seen.append(event["id"]))
+        base = int(time.time() * 1000) - 60_000
+        for i in range(5):
+            oidc_provider.add_admin_event("CREATE", "REALM_ROLE_MAPPING", f"users/{i}/role-mappings/realm", time_ms=base + i)
+        await ingestor.poll_once()
+        await ingestor.flush()
+
+        assert seen == [event["id"] for event in oidc_provider.events]  # only the admin client's own login
+        counts = {row["key"]: row["count"] for row in await store.summary("type")}
+        assert counts["CREATE:REALM_ROLE_MAPPING"] == 5
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_poll_loop_survives_errors(self, ingestor, monkeypatch):
+        """An unexpected poll failure is logged and the loop keeps polling"""
+        calls = []
+
+        async def flaky_poll():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return 0
+
+        monkeypatch.setattr(ingestor, "poll_once", flaky_poll)
+        ingestor.poll_interval = 0.01
+        task = asyncio.create_task(ingestor._poll_loop())
+        for _ in range(100):
+            if len(calls) >= 3:
+                break
+            await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert len(calls) >= 3
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_write_loop_survives_errors(self, ingestor, store, monkeypatch):
+        """A batch that fails for any reason is logged and the writer keeps draining the queue"""
+        from app.events import login_event_row
+        write_batch = store.write_batch
+        calls = []
+
+        async def flaky_write(rows):
+            calls.append(rows)
+            if len(calls) == 1:
+                raise ValueError("boom")
+            return await write_batch(rows)
+
+        monkeypatch.setattr(store, "write_batch", flaky_write)
+        ingestor.flush_interval = 0.01
+        task = asyncio.create_task(ingestor._write_loop())
+        for i in range(2):
+            await ingestor.queue.put(login_event_row({"id": f"e{i}", "time": 1000 + i, "type": "LOGIN"}))
+            for _ in range(100):
+                if len(calls) > i:
+                    break
+                await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert [e["time"] for e in await store.recent()] == [1001]
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_ingested_counts_stored_rows(self, ingestor):
+        """Rows the store already holds are not counted as ingested"""
+        from app.events import EVENTS_INGESTED, login_event_row
+        rows = [login_event_row({"id": f"d{i}", "time": 2000 + i, "type": "LOGIN"}) for i in range(3)]
+        before = EVENTS_INGESTED.value("login")
+        assert await ingestor._write(rows[:2]) == 2
+        assert await ingestor._write(rows) == 1
+        assert EVENTS_INGESTED.value("login") - before == 3
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_poll_failure_is_contained(self, oidc_provider, ingestor):
+        oidc_provider.add_event("LOGIN")
+        await ingestor.client.admin_token()
+        oidc_provider.inject("admin", status=503)
+        assert await ingestor.poll_once() == 0
+
+
+class TestEventEndpoints:
+    """Test the admin query endpoints"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_admin_only(self, store, monkeypatch):
+        from app.events import login_event_row
+        await store.write_batch([
+            login_event_row({"id": str(i), "time": i, "type": "LOGIN", "userId": "u1"}) for i in range(3)
+        ])
+        monkeypatch.setattr(main, "event_store", store)
+        client = TestClient(main.app)
+
+        admin = {"X-User": "root", "X-Roles": "admin"}
+        response = client.get("/api/admin/events/summary", params={"group_by": "user"}, headers=admin)
+        assert response.status_code == 200
+        assert response.json()["counts"][0]["key"] == "u1"
+        assert response.json()["counts"][0]["count"] == 3
+
+        response = client.get("/api/admin/events", params={"limit": 2}, headers=admin)
+        assert [e["time"] for e in response.json()["events"]] == [2, 1]
+
+        response = client.get("/api/admin/events", headers={"X-User": "bob", "X-Roles": "user"})
+        assert response.status_code == 403
@@ -0,0 +1,84 @@
+"""
+Integration tests for breakers and stale serving against the Keycloak stand-in
+with injected latency and errors
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from app.keycloak import KeycloakClient
+from app.resilience import OPEN, STALE_SERVED, CircuitOpenError, ConcurrencyLimitError
+from app.tokens import TokenVerifier
+
+
+@pytest_asyncio.fixture
+async def client(oidc_provider):
+    client = KeycloakClient(
+        oidc_provider.keycloak_url,
+        oidc_provider.realm,
+        oidc_provider.client_id,
+        timeout=0.1,
+        transport=httpx.ASGITransport(app=oidc_provider.build_app()),
+        admin_username="admin",
+        admin_password="admin",
+        breaker_threshold=3,
+        breaker_reset_timeout=60,
+        max_concurrency=2,
+    )
+    yield client
+    await client.aclose()
+
+
+class TestKeycloakBreakers:
+    """Test failing fast once an endpoint keeps failing"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_jwks_errors_open_the_circuit(self, oidc_provider, client):
+        oidc_provider.inject("jwks", status=503)
+        for _ in range(3):
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.get_jwks()
+        assert client.breaker("jwks").state == OPEN
+
+        calls = oidc_provider.request_counts["jwks"]
+        with pytest.raises(CircuitOpenError):
+            await client.get_jwks()
+        assert oidc_provider.request_counts["jwks"] == calls
+
+        # Other endpoints have their own breaker
+        assert (await client.admin_request("GET", "users")).status_code == 200
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_slow_endpoint_is_bounded(self, oidc_provider, client):
+        await client.admin_token()
+        oidc_provider.inject("admin", latency=0.3)
+
+        results = await asyncio.gather(
+            *(client.admin_request("GET", "users") for _ in range(3)), return_exceptions=True
+        )
+        assert sum(isinstance(r, ConcurrencyLimitError) for r in results) == 1
+        assert sum(isinstance(r, httpx.Response) and r.status_code == 200 for r in results) == 2
+
+
+class TestStaleWhileRevalidate:
+    """Test serving the last good JWKS during an outage"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_tokens_verify_with_stale_jwks(self, oidc_provider, client):
+        verifier = TokenVerifier(client.get_jwks, issuer=oidc_provider.issuer(), ttl=0.01, max_stale=60)
+        token = oidc_provider.mint_token({"preferred_username": "alice"})
+        assert (await verifier.verify(token))["preferred_username"] == "alice"
+
+        oidc_provider.inject("jwks", status=503)
+        time.sleep(0.02)
+        before = STALE_SERVED.value("jwks")
+        for _ in range(5):
+            assert (await verifier.verify(token))["preferred_username"] == "alice"
+            await asyncio.sleep(0)
+        assert STALE_SERVED.value("jwks") - before == 5
@@ -0,0 +1,133 @@
+"""
+Integration tests for the package catalog and its endpoints
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.packages import CatalogError, PackageCatalog, decode_cursor, encode_cursor, visible_to
+
+
+def headers(username, roles="packages_viewer"):
+    return {"X-User": username, "X-Preferred-Username": username, "X-Roles": roles}
+
+
+def principal(*roles):
+    return {"realm_access": {"roles": list(roles)}}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = PackageCatalog(str(tmp_path / "packages.db"), chunk_size=7)
+    yield catalog
+    catalog.close()
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+async def collect(catalog, visible, **kwargs):
+    return [package async for _, package in catalog.iter_rows(visible, **kwargs)]
+
+
+class TestPackageCatalog:
+    """Test storage, search, visibility and keyset pagination"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_keyset_pages_cover_everything_once(self, catalog):
+        await catalog.add_many([{"name": f"pkg-{i:03d}", "version": "1.0"} for i in range(50)])
+        seen, after = [], None
+        while True:
+            page = [item async for item in catalog.iter_rows(("public",), after=after, limit=20)]
+            seen.extend(p["name"] for _, p in page)
+            if len(page) < 20:
+                break
+            after = page[-1][0]
+        assert seen == [f"pkg-{i:03d}" for i in range(50)]
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_visibility_is_filtered_in_the_query(self, catalog):
+        await catalog.add_many([
+            {"name": "open", "version": "1", "visibility": "public"},
+            {"name": "team", "version": "1", "visibility": "internal"},
+            {"name": "secret", "version": "1", "visibility": "restricted"},
+        ])
+        names = lambda rows: sorted(p["name"] for p in rows)
+        assert names(await collect(catalog, visible_to(principal("packages_viewer")))) == ["open"]
+        assert names(await collect(catalog, visible_to(principal("packages_editor")))) == ["open", "team"]
+        assert names(await collect(catalog, visible_to(principal("packages_admin")))) == ["open", "secret", "team"]
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_search_and_projection(self, catalog):
+        await catalog.add_many([
+            {"name": "requests", "version": "2.31", "description": "HTTP for humans"},
+            {"name": "httpx", "version": "0.27", "description": "A next-generation HTTP client"},
+            {"name": "numpy", "version": "1.26", "description": "Array computing"},
+        ])
+        found = await collect(catalog, ("public",), q="http", fields=("name",))
+        assert found == [{"name": "httpx"}, {"name": "requests"}]
+        assert await collect(catalog, ("public",), q='"unbalanced', fields=("name",)) == []
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_duplicate_version_conflicts(self, catalog):
+        await catalog.add({"name": "dup", "version": "1.0"})
+        with pytest.raises(CatalogError) as excinfo:
+            await catalog.add({"name": "dup", "version": "1.0"})
+        assert excinfo.value.status_code == 409
+
+    @pytest.mark.unit
+    def test_cursor_round_trip(self):
+        assert decode_cursor(encode_cursor(("pkg/ü", 42))) == ("pkg/ü", 42)
+        with pytest.raises(CatalogError):
+            decode_cursor("not-a-cursor")
+
+
+class TestPackageEndpoints:
+    """Test creating and listing packages over HTTP"""
+
+    @pytest.mark.integration
+    def test_create_and_page_through(self, client):
+        for i in range(5):
+            response = client.post("/api/packages", json={"name": f"web-{i}", "version": "1.0"},
+                                   headers=headers("erin", "packages_editor"))
+            assert response.status_code == 201
+        assert response.json()["package"]["created_by"] == "erin"
+
+        first = client.get("/api/packages?q=web&limit=3&fields=name,version", headers=headers("frank"))
+        assert first.status_code == 200
+        body = first.json()
+        assert body["user"] == "frank"
+        assert body["packages"] == [{"name": f"web-{i}", "version": "1.0"} for i in range(3)]
+        assert body["count"] == 3
+
+        second = client.get(f"/api/packages?q=web&limit=3&fields=name&cursor={body['next_cursor']}",
+                            headers=headers("frank")).json()
+        assert [p["name"] for p in second["packages"]] == ["web-3", "web-4"]
+        assert second["next_cursor"] is None
+
+    @pytest.mark.integration
+    def test_restricted_packages(self, client):
+        response = client.post("/api/packages", json={"name": "vault", "version": "1", "visibility": "restricted"},
+                               headers=headers("erin", "packages_editor"))
+        assert response.status_code == 403
+
+        response = client.post("/api/packages", json={"name": "vault", "version": "1", "visibility": "restricted"},
+                               headers=headers("root", "packages_admin"))
+        assert response.status_code == 201
+        assert client.post("/api/packages", json={"name": "vault", "version": "1"},
+                           headers=headers("root", "packages_admin")).status_code == 409
+
+        listed = client.get("/api/packages?q=vault", headers=headers("frank")).json()
+        assert listed["packages"] == []
+
+    @pytest.mark.integration
+    @pytest.mark.parametrize("query", ["fields=name,password", "cursor=%25%25"])
+    def test_bad_parameters(self, client, query):
+        assert client.get(f"/api/packages?{query}", headers=headers("frank")).status_code == 400
@@ -0,0 +1,311 @@
+"""
+Integration tests for realm export/import against the local Admin API stand-in
+"""
+import gzip
+import io
+import json
+
+import pytest
+
+from app.realm_sync import (
+    EXPORT_USERS, AdminAPIError, RealmAdmin, RealmExporter, RealmImporter, UserStreamExporter, content_hash,
+    export_realm, export_users, import_realm, plan_sync,
+)
+
+
+class RecordingAdmin(RealmAdmin):
+    """RealmAdmin that remembers every call it makes"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+
+    async def request(self, method, path="", expected=(200, 201, 204), **kwargs):
+        self.calls.append((method, path))
+        return await super().request(method, path, expected, **kwargs)
+
+    @property
+    def writes(self):
+        return [call for call in self.calls if call[0] != "GET"]
+
+
+@pytest.fixture
+def seeded_provider(oidc_provider):
+    """Stand-in realm with roles, a client, a group and a few hundred users"""
+    oidc_provider.add_role("vpn_user", description="VPN access")
+    oidc_provider.add_client("myapp", redirectUris=["https://localhost/callback"])
+    oidc_provider.add_group("operators")
+    for i in range(250):
+        oidc_provider.add_user(f"user{i:03d}", roles=["vpn_user"] if i % 2 else ["user"])
+    return oidc_provider
+
+
+class TestRealmExport:
+    """Test exporting a realm"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_export_streams_everything(self, seeded_provider, stub_keycloak):
+        """All sections are exported, with users across several pages"""
+        buffer = io.StringIO()
+        admin = RealmAdmin(stub_keycloak, page_size=40)
+        counts = await RealmExporter(admin, concurrency=4).export(buffer)
+
+        data = json.loads(buffer.getvalue())
+        assert counts == {"roles": len(seeded_provider.roles), "clients": 1, "groups": 1, "users": 252}
+        assert data["realm"]["realm"] == "test-realm"
+        assert [c["clientId"] for c in data["clients"]] == ["myapp"]
+        assert len({u["username"] for u in data["users"]}) == 252
+
+        by_name = {u["username"]: u for u in data["users"]}
+        assert by_name["user001"]["realmRoles"] == ["vpn_user"]
+        assert by_name["admin"]["realmRoles"] == ["admin", "user"]
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_export_reuses_admin_token(self, seeded_provider, stub_keycloak):
+        """One admin token serves every Admin API call"""
+        await RealmExporter(RealmAdmin(stub_keycloak), concurrency=8).export(io.StringIO())
+        assert seeded_provider.request_counts["token"] == 1
+
+
+class TestRealmImport:
+    """Test importing into a realm"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_round_trip_into_empty_realm(self, seeded_provider, stub_keycloak, tmp_path):
+        """Export, wipe, import: the realm is restored"""
+        path = tmp_path / "realm.json"
+        await export_realm(str(path), stub_keycloak)
+        snapshot = {u["username"]: sorted(u["realmRoles"]) for u in seeded_provider.users.values()}
+
+        # Keep only the admin account so the importer can authenticate
+        admin_id = next(i for i, u in seeded_provider.users.items() if u["username"] == "admin")
+        seeded_provider.users = {admin_id: seeded_provider.users[admin_id]}
+        seeded_provider.clients.clear()
+        seeded_provider.groups.clear()
+        del seeded_provider.roles["vpn_user"]
+
+        stats = await import_realm(str(path), stub_keycloak, concurrency=8)
+
+        restored = {u["username"]: sorted(u["realmRoles"]) for u in seeded_provider.users.values()}
+        assert restored == snapshot
+        assert [c["clientId"] for c in seeded_provider.clients.values()] == ["myapp"]
+        assert [g["name"] for g in seeded_provider.groups.values()] == ["operators"]
+        assert stats["created"] >= 251 + 3
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_reimport_only_touches_changes(self, seeded_provider, stub_keycloak):
+        """Unchanged objects are not written; changed fields and roles are patched"""
+        buffer = io.StringIO()
+        admin = RealmAdmin(stub_keycloak)
+        await RealmExporter(admin).export(buffer)
+        data = json.loads(buffer.getvalue())
+
+        user = next(u for u in data["users"] if u["username"] == "user002")
+        user["email"] = "changed@example.com"
+        user["realmRoles"] = ["vpn_user"]
+
+        stats = await RealmImporter(admin).import_data(data)
+
+        live = next(u for u in seeded_provider.users.values() if u["username"] == "user002")
+        assert live["email"] == "changed@example.com"
+        assert live["realmRoles"] == ["vpn_user"]
+        assert stats["created"] == 0
+        assert stats["updated"] == 1
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_role_mappings_reference_roles_by_id(self, seeded_provider, stub_keycloak):
+        """Role-mapping writes carry role ids, as Keycloak resolves them by id, not name"""
+        user = next(u for u in seeded_provider.users.values() if u["username"] == "user002")
+        admin = RealmAdmin(stub_keycloak)
+        with pytest.raises(AdminAPIError, match="Role not found"):
+            await admin.request("POST", f"users/{user['id']}/role-mappings/realm", json=[{"name": "vpn_user"}])
+
+        seeded_provider.roles.pop("vpn_user")
+        await RealmImporter(admin).import_data({
+            "roles": [{"name": "vpn_user"}],
+            "users": [{"username": "user002", "realmRoles": ["vpn_user"]}],
+        })
+        assert user["realmRoles"] == ["vpn_user"]
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_creates_missing_realm(self, seeded_provider, stub_keycloak):
+        """Importing into an unknown realm creates it first"""
+        admin = RealmAdmin(stub_keycloak, realm="new-realm")
+        await RealmImporter(admin).import_data({"realm": {"realm": "new-realm", "enabled": True}})
+        assert "new-realm" in seeded_provider.realms
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_create_realm_retries_with_fresh_token(self, seeded_provider, stub_keycloak):
+        """Creating a realm goes through the admin path: a rejected token is renewed once"""
+        stub_keycloak._admin_token, stub_keycloak._admin_token_expires = "stale", float("inf")
+        await RealmAdmin(stub_keycloak, realm="new-realm").create_realm({"enabled": True})
+        assert "new-realm" in seeded_provider.realms
+        assert stub_keycloak._admin_token != "stale"
+
+    @pytest.mark.unit
+    def test_cli_url_does_not_repoint_shared_client(self, monkeypatch):
+        """--url builds a client of its own"""
+        from app import realm_sync
+        from app.keycloak import keycloak
+
+        used = []
+
+        async def fake_export(path, client, realm, concurrency):
+            used.append(client)
+            return {}
+
+        monkeypatch.setattr(realm_sync, "export_realm", fake_export)
+        base_url = keycloak.base_url
+        assert realm_sync.main(["--url", "http://other:8080/", "export", "out.json"]) == 0
+        assert used[0] is not keycloak and used[0].base_url == "http://other:8080"
+        assert keycloak.base_url == base_url
+
+
+class TestIncrementalSync:
+    """Test hash-based planning and minimal apply"""
+
+    @pytest.mark.unit
+    def test_content_hash_ignores_order_and_volatile_fields(self):
+        a = {"name": "r", "description": "d", "id": "1"}
+        b = {"description": "d", "name": "r", "id": "2"}
+        assert content_hash(a) == content_hash(b)
+        assert content_hash(a) != content_hash({**a, "description": "other"})
+
+    @pytest.mark.unit
+    def test_nested_server_ids_are_not_differences(self):
+        """Ids Keycloak assigns below the top level do not make an object look changed"""
+        desired = {
+            "realm": {"realm": "r", "defaultRole": {"name": "default-roles-r", "id": "a1"}},
+            "clients": [{"clientId": "app", "protocolMappers": [{"name": "email", "id": "m1"}]}],
+            "groups": [{"name": "ops", "subGroups": [{"name": "oncall", "id": "g1", "subGroups": []}]}],
+        }
+        live = {
+            "realm": {"realm": "r", "id": "r", "defaultRole": {"name": "default-roles-r", "id": "a2"}},
+            "clients": [{"clientId": "app", "id": "c", "protocolMappers": [{"name": "email", "id": "m2"}]}],
+            "groups": [{"name": "ops", "id": "g", "subGroups": [{"name": "oncall", "id": "g2", "subGroups": []}]}],
+        }
+        plan = plan_sync(desired, live)
+        assert plan.realm_update is None
+        assert plan.updates["clients"] == [] and plan.updates["groups"] == []
+        assert plan.summary()["unchanged"] == 2
+
+    @pytest.mark.unit
+    def test_plan_only_lists_differences(self):
+        desired = {
+            "roles": [{"name": "a"}, {"name": "b", "description": "new"}],
+            "users": [{"username": "u", "enabled": True, "realmRoles": ["a"]}],
+        }
+        live = {
+            "roles": [{"name": "b", "description": "old", "id": "1"}, {"name": "stale", "id": "2"}],
+            "users": [{"username": "u", "enabled": True, "email": "x@example.com", "id": "3"}],
+            "role_mappings": {"u": ["b"]},
+        }
+        plan = plan_sync(desired, live, prune=True)
+        assert [c.key for c in plan.creates["roles"]] == ["a"]
+        assert [c.key for c in plan.updates["roles"]] == ["b"]
+        assert [c.key for c in plan.deletes["roles"]] == ["stale"]
+        assert plan.updates["users"] == []
+        assert plan.role_changes == {"u": (["a"], ["b"])}
+        assert plan.summary()["unchanged"] == 1
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_unchanged_realm_issues_no_writes(self, seeded_provider, stub_keycloak):
+        """Re-applying a fresh export is read-only, with no per-user reads"""
+        buffer = io.StringIO()
+        await RealmExporter(RealmAdmin(stub_keycloak)).export(buffer)
+
+        admin = RecordingAdmin(stub_keycloak)
+        stats = await RealmImporter(admin, concurrency=8).import_data(json.loads(buffer.getvalue()))
+
+        assert admin.writes == []
+        assert stats["created"] == stats["updated"] == stats["deleted"] == stats["role_mappings"] == 0
+        assert len(admin.calls) < 30
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_prune_and_dry_run(self, seeded_provider, stub_keycloak):
+        """Objects missing from the file are deleted only with prune, never on a dry run"""
+        buffer = io.StringIO()
+        await RealmExporter(RealmAdmin(stub_keycloak)).export(buffer)
+        data = json.loads(buffer.getvalue())
+        data["users"] = [u for u in data["users"] if u["username"] != "user010"]
+        data["groups"] = []
+
+        admin = RecordingAdmin(stub_keycloak)
+        stats = await RealmImporter(admin, prune=True).import_data(data, dry_run=True)
+        assert stats["deleted"] == 2
+        assert admin.writes == []
+
+        await RealmImporter(admin, prune=True).import_data(data)
+        assert "user010" not in {u["username"] for u in seeded_provider.users.values()}
+        assert not seeded_provider.groups
+        assert sorted(method for method, _ in admin.writes) == ["DELETE", "DELETE"]
+
+
+class FailingExporter(UserStreamExporter):
+    """Exporter whose page at ``fail_at`` raises once"""
+
+    def __init__(self, *args, fail_at, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_at = fail_at
+        self.fetched = []
+
+    async def _page(self, first):
+        self.fetched.append(first)
+        if first == self.fail_at:
+            self.fail_at = None
+            raise ConnectionError("connection reset")
+        return await super()._page(first)
+
+
+class TestStreamingUserExport:
+    """Test the NDJSON user exporter"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("suffix", ["ndjson", "ndjson.gz", "ndjson.zst"])
+    async def test_every_user_once(self, seeded_provider, stub_keycloak, tmp_path, suffix):
+        if suffix.endswith(".zst"):
+            zstandard = pytest.importorskip("zstandard")
+        path = tmp_path / f"users.{suffix}"
+        before = EXPORT_USERS.value("test-realm")
+
+        result = await export_users(str(path), stub_keycloak, page_size=40)
+
+        raw = path.read_bytes()
+        if suffix.endswith(".gz"):
+            raw = gzip.decompress(raw)
+        elif suffix.endswith(".zst"):
+            raw = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(raw), read_across_frames=True).read()
+        users = [json.loads(line) for line in raw.decode("utf-8").splitlines()]
+        assert len(users) == len({u["username"] for u in users}) == 252 == result["users"]
+        assert next(u for u in users if u["username"] == "user001")["realmRoles"] == ["vpn_user"]
+        assert EXPORT_USERS.value("test-realm") - before == 252
+        assert not (tmp_path / f"users.{suffix}.progress").exists()
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_resume_after_failure(self, seeded_provider, stub_keycloak, tmp_path):
+        """An interrupted export continues from the last completed page"""
+        path = str(tmp_path / "users.ndjson.gz")
+        admin = RealmAdmin(stub_keycloak, page_size=40)
+        exporter = FailingExporter(admin, concurrency=2, compression="gzip", fail_at=120)
+        with pytest.raises(ConnectionError):
+            await exporter.export(path)
+        checkpoint = json.loads((tmp_path / "users.ndjson.gz.progress").read_text())
+        assert checkpoint["next"] == 120
+
+        exporter.fetched.clear()
+        await exporter.export(path)
+        assert exporter.fetched[0] == 120
+
+        users = [json.loads(line) for line in gzip.decompress(open(path, "rb").read()).splitlines()]
+        assert len(users) == len({u["username"] for u in users}) == 252
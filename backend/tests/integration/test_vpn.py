@@ -0,0 +1,157 @@
+"""
+Integration tests for VPN config generation, caching and download
+"""
+import asyncio
+import ipaddress
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.vpn import AddressTable, VPNConfigStore
+
+
+def headers(username, roles="vpn_user"):
+    return {"X-User": f"sub-{username}", "X-Preferred-Username": username, "X-Roles": roles}
+
+
+def principal(sub="sub-alice", username="alice", roles=("vpn_user",)):
+    return {"sub": sub, "preferred_username": username, "realm_access": {"roles": list(roles)}}
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = VPNConfigStore(str(tmp_path), "vpn.test:51820", "c2VydmVyLWtleQ==", secret="test-secret")
+    yield store
+    store.shutdown()
+
+
+class TestVPNConfigStore:
+    """Test content-addressed generation on the process pool"""
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_generate_then_hit(self, store):
+        path = await store.get(principal())
+        text = open(path).read()
+        assert "Endpoint = vpn.test:51820" in text
+        assert "AllowedIPs = 10.0.10.0/24" in text
+        assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+
+        mtime = os.stat(path).st_mtime_ns
+        assert await store.get(principal()) == path
+        assert os.stat(path).st_mtime_ns == mtime
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_role_change_yields_new_file_same_key(self, store):
+        user_path = await store.get(principal())
+        admin_path = await store.get(principal(roles=("vpn_user", "vpn_admin", "user")))
+        assert admin_path != user_path
+        # Unrelated roles do not change the address
+        assert await store.get(principal(roles=("vpn_user", "vpn_admin"))) == admin_path
+
+        key_line = lambda p: next(line for line in open(p) if line.startswith("PrivateKey"))
+        assert key_line(user_path) == key_line(admin_path)
+        assert "AllowedIPs = 10.0.0.0/16, 10.0.10.0/24" in open(admin_path).read()
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_read_survives_prune(self, store, monkeypatch):
+        """A file pruned between lookup and read is generated again"""
+        get = store.get
+        pruned = []
+
+        async def get_then_prune(p):
+            path = await get(p)
+            if not pruned:
+                os.remove(path)
+                pruned.append(path)
+            return path
+
+        monkeypatch.setattr(store, "get", get_then_prune)
+        config_id, content = await store.read(principal())
+        assert pruned[0].endswith(f"{config_id}.conf")
+        assert b"[Interface]" in content
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_render(self, store):
+        paths = await asyncio.gather(*(store.get(principal(sub="sub-bob", username="bob")) for _ in range(5)))
+        assert len(set(paths)) == 1
+        assert len(os.listdir(os.path.dirname(paths[0]))) == 1
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_addresses_are_unique_and_persistent(self, tmp_path):
+        """Users whose preferred address collides get the next free one, and keep it across restarts"""
+        path = str(tmp_path / "addresses.db")
+        table = AddressTable(path, network=ipaddress.ip_network("10.8.0.0/29"))
+        addresses = [await table.address(f"sub-{i}") for i in range(table.hosts)]
+        assert len(set(addresses)) == table.hosts
+        with pytest.raises(RuntimeError, match="exhausted"):
+            await table.address("one-too-many")
+        table.close()
+
+        reopened = AddressTable(path, network=ipaddress.ip_network("10.8.0.0/29"))
+        assert [await reopened.address(f"sub-{i}") for i in range(table.hosts)] == addresses
+        reopened.close()
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_prewarm_on_role_grant(self, oidc_provider, stub_keycloak, store):
+        user_id = next(u["id"] for u in oidc_provider.users.values() if u["username"] == "testuser")
+        oidc_provider.add_role("vpn_user")
+        response = await stub_keycloak.admin_request(
+            "POST", f"users/{user_id}/role-mappings/realm", json=[oidc_provider.roles["vpn_user"]]
+        )
+        assert response.status_code == 204
+
+        store.on_keycloak_event("admin", oidc_provider.admin_events[-1], client=stub_keycloak)
+        await asyncio.gather(*store._prewarm_tasks)
+
+        address = await store.addresses.address(user_id)
+        digest = store.digest(principal(sub=user_id, username="testuser", roles=["vpn_user"]), address)
+        assert os.path.exists(store.path_for(digest))
+
+    @pytest.mark.integration
+    @pytest.mark.asyncio
+    async def test_other_role_grants_are_ignored(self, store):
+        store.on_keycloak_event("admin", {
+            "operationType": "CREATE", "resourceType": "REALM_ROLE_MAPPING",
+            "resourcePath": "users/x/role-mappings/realm", "representation": '[{"name": "user"}]',
+        })
+        assert not store._prewarm_tasks
+
+
+class TestVPNEndpoints:
+    """Test the POST and download endpoints"""
+
+    @pytest.mark.integration
+    def test_create_then_download(self, client):
+        created = client.post("/api/vpn", headers=headers("carol"))
+        assert created.status_code == 200
+        config_id = created.json()["config_id"]
+
+        response = client.get("/api/vpn/config", headers=headers("carol"))
+        assert response.status_code == 200
+        assert response.headers["etag"] == f'"{config_id}"'
+        assert 'filename="carol.conf"' in response.headers["content-disposition"]
+        assert "[Interface]" in response.text
+
+        assert "Address = 10.8." in response.text
+
+        again = client.get("/api/vpn/config", headers={**headers("carol"), "If-None-Match": f'"{config_id}"'})
+        assert again.status_code == 304
+
+    @pytest.mark.integration
+    def test_download_requires_vpn_role(self, client):
+        response = client.get("/api/vpn/config", headers=headers("dave", roles="vpn_viewer"))
+        assert response.status_code == 403
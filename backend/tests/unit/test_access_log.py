@@ -0,0 +1,93 @@
+"""
+Unit tests for the structured access log
+"""
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from app import access_log as access_log_module
+from app.access_log import AccessLog, AccessLogMiddleware, BufferedRotatingFileHandler
+from app.main import app
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+
+@pytest.fixture
+def captured():
+    """Route the access logger to an in-memory handler through a real listener thread"""
+    saved = access_log_module.logger.handlers
+    handler = ListHandler()
+    log = AccessLog(handler)
+    log.start()
+    yield handler, log
+    log.stop()
+    access_log_module.logger.handlers = saved
+
+
+class TestAccessLog:
+    """Test what gets logged and how"""
+
+    @pytest.mark.unit
+    def test_fields(self, captured):
+        handler, log = captured
+        client = TestClient(app)
+        client.get("/api/packages", headers={"X-User": "u-1", "X-Roles": "view_dashboard"})
+        client.post("/api/vpn", headers={"X-User": "u-2", "X-Roles": "user"})
+        log.stop()
+
+        allowed, denied = handler.lines
+        assert allowed["route"] == "/api/packages"
+        assert allowed["status"] == 200
+        assert allowed["sub"] == "u-1"
+        assert allowed["decision"] == "allow"
+        assert allowed["latency_ms"] >= 0
+        assert (denied["status"], denied["decision"], denied["sub"]) == (403, "deny", "u-2")
+
+    @pytest.mark.unit
+    def test_route_template_not_raw_path(self, captured):
+        handler, log = captured
+        TestClient(app).get("/does/not/exist")
+        log.stop()
+        assert handler.lines[0]["route"] == "unmatched"
+        assert handler.lines[0]["path"] == "/does/not/exist"
+
+    @pytest.mark.unit
+    def test_sampling_never_drops_denials(self, captured):
+        handler, log = captured
+        sampled = FastAPI()
+        sampled.add_middleware(AccessLogMiddleware, sample_rates={"/items/{item_id}": 0.0})
+
+        @sampled.get("/items/{item_id}")
+        async def item(item_id: int):
+            if item_id == 0:
+                raise HTTPException(status_code=403)
+            return {}
+
+        client = TestClient(sampled)
+        for i in range(1, 6):
+            client.get(f"/items/{i}")
+        client.get("/items/0")
+        log.stop()
+
+        assert [(line["route"], line["decision"]) for line in handler.lines] == [("/items/{item_id}", "deny")]
+
+    @pytest.mark.unit
+    def test_buffered_handler_rotates(self, tmp_path):
+        path = tmp_path / "access.log"
+        handler = BufferedRotatingFileHandler(str(path), max_bytes=300, backup_count=2, flush_every=10)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        for i in range(40):
+            handler.emit(logging.LogRecord("a", logging.INFO, "", 0, "x" * 20, None, None))
+        handler.close()
+        assert path.with_name("access.log.1").exists()
+        assert path.with_name("access.log.2").exists()
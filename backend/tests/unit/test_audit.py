@@ -0,0 +1,143 @@
+"""
+Unit tests for the authorization audit log
+"""
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.audit import AUDIT_DROPPED, AuditLog, AuditSink, MemorySink, RotatingFileSink, audit_log
+from app.main import app
+
+
+@pytest.fixture
+def memory_sink(monkeypatch):
+    """Send the app's audit records to memory instead of the log file"""
+    sink = MemorySink()
+    monkeypatch.setattr(audit_log, "sinks", [])
+    audit_log.drain()
+    audit_log.add_sink(sink)
+    return sink
+
+
+ALICE = {"sub": "1", "preferred_username": "alice", "realm_access": {"roles": ["user"]}}
+
+
+class TestAuditLog:
+    """Test queueing, overflow and sinks"""
+
+    @pytest.mark.unit
+    def test_drop_when_full(self):
+        log = AuditLog([MemorySink()], max_queue=3)
+        before = AUDIT_DROPPED.value()
+        for _ in range(5):
+            log.record("deny", ALICE, "POST", "/api/vpn")
+        assert len(log) == 3
+        assert AUDIT_DROPPED.value() - before == 2
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_block_policy_waits_without_blocking_the_loop(self):
+        class Slow(MemorySink):
+            def write(self, lines):
+                time.sleep(0.2)
+                super().write(lines)
+
+        sink = Slow()
+        log = AuditLog([sink], max_queue=2, overflow="block", flush_interval=10)
+        log.start()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        try:
+            for i in range(5):
+                await log.put("allow", ALICE, "POST", f"/api/console/{i}")
+        finally:
+            task.cancel()
+            log.stop()
+
+        assert ticks >= 10  # the loop kept running while put() waited on the writer
+        assert [r["path"] for r in sink.records] == [f"/api/console/{i}" for i in range(5)]
+
+    @pytest.mark.unit
+    def test_writer_thread_drains_to_all_sinks(self):
+        first, second = MemorySink(), MemorySink()
+        log = AuditLog([first, second], batch_size=2, flush_interval=0.01)
+        log.start()
+        for i in range(5):
+            log.record("allow", ALICE, "POST", f"/api/console/{i}", "console:execute")
+        log.stop()
+
+        assert [r["path"] for r in first.records] == [f"/api/console/{i}" for i in range(5)]
+        assert list(first.records) == list(second.records)
+        assert first.records[0]["user"] == "alice"
+        assert first.records[0]["policy"] == "console:execute"
+
+    @pytest.mark.unit
+    def test_failing_sink_does_not_block_others(self):
+        class Broken(AuditSink):
+            name = "broken"
+
+            def write(self, lines):
+                raise OSError("disk full")
+
+        sink = MemorySink()
+        log = AuditLog([Broken(), sink])
+        log.record("deny", ALICE, "GET", "/api/admin")
+        assert log.drain() == 1
+        assert len(sink.records) == 1
+
+    @pytest.mark.unit
+    def test_file_sink_rotates(self, tmp_path):
+        path = tmp_path / "audit.log"
+        log = AuditLog([RotatingFileSink(str(path), max_bytes=500, backup_count=2)], batch_size=1)
+        for i in range(20):
+            log.record("deny", ALICE, "POST", "/api/vpn")
+            log.drain()
+        log.stop()
+
+        assert path.with_name("audit.log.1").exists()
+        assert path.with_name("audit.log.2").exists()
+        assert not path.with_name("audit.log.3").exists()
+        for line in path.with_name("audit.log.1").read_text().splitlines():
+            assert json.loads(line)["decision"] == "deny"
+
+
+class TestAuditedEndpoints:
+    """Test which decisions the app records"""
+
+    @pytest.mark.unit
+    def test_denials_are_recorded(self, memory_sink, headers):
+        client = TestClient(app)
+        assert client.get("/api/packages", headers=headers("bob", "vpn_user")).status_code == 403
+        assert client.get("/api/admin", headers=headers("bob", "vpn_user")).status_code == 403
+        audit_log.drain()
+
+        records = list(memory_sink.records)
+        assert [(r["decision"], r["method"], r["path"], r["status"]) for r in records] == [
+            ("deny", "GET", "/api/packages", 403),
+            ("deny", "GET", "/api/admin", 403),
+        ]
+        assert records[0]["policy"] == "packages:read"
+        assert records[1]["policy"] == "admin"
+
+    @pytest.mark.unit
+    def test_granted_console_and_vpn_posts_are_recorded(self, memory_sink, headers):
+        client = TestClient(app)
+        client.post("/api/vpn", headers=headers("alice", "vpn_user"))
+        client.post("/api/console", headers=headers("alice", "console_accesser"))
+        client.get("/api/vpn", headers=headers("alice", "vpn_user"))
+        audit_log.drain()
+
+        assert [(r["decision"], r["path"], r["policy"]) for r in memory_sink.records] == [
+            ("allow", "/api/vpn", "vpn:write"),
+            ("allow", "/api/console", "console:execute"),
+        ]
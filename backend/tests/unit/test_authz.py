@@ -0,0 +1,101 @@
+"""
+Unit tests for the batch authorization check endpoint
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    """Test client for FastAPI app"""
+    return TestClient(app)
+
+
+def headers(roles, groups=""):
+    return {"X-User": "user1", "X-Preferred-Username": "alice", "X-Roles": roles, "X-Groups": groups}
+
+
+class TestAuthzCheck:
+    """Test POST /api/authz/check"""
+
+    @pytest.mark.unit
+    def test_route_checks(self, client):
+        """Routes are evaluated against the policies require_role enforces"""
+        response = client.post(
+            "/api/authz/check",
+            json={"checks": [
+                {"method": "GET", "path": "/api/packages"},
+                {"method": "post", "path": "/api/packages"},
+                {"method": "GET", "path": "/api/vpn"},
+                {"method": "GET", "path": "/api/admin"},
+                {"method": "GET", "path": "/api/dashboard"},
+                {"method": "GET", "path": "/api/unknown"},
+            ]},
+            headers=headers("view_dashboard,vpn_viewer"),
+        )
+
+        assert response.status_code == 200
+        assert response.json()["allowed"] == {
+            "GET /api/packages": True,
+            "POST /api/packages": False,
+            "GET /api/vpn": True,
+            "GET /api/admin": False,
+            "GET /api/dashboard": True,
+            "GET /api/unknown": False,
+        }
+
+    @pytest.mark.unit
+    def test_permission_checks(self, client):
+        """Named permissions resolve to the same policies"""
+        response = client.post(
+            "/api/authz/check",
+            json={"checks": [
+                {"permission": "admin"},
+                {"permission": "console:execute"},
+                {"permission": "console:read"},
+                {"permission": "nope"},
+            ]},
+            headers=headers("admin,console_viewer"),
+        )
+
+        assert response.json()["allowed"] == {
+            "admin": True,
+            "console:execute": False,
+            "console:read": True,
+            "nope": False,
+        }
+
+    @pytest.mark.unit
+    def test_decisions_match_endpoints(self, client):
+        """Every answer agrees with what the endpoint itself returns"""
+        user_headers = headers("packages_editor,console_accesser")
+        checks = [
+            ("GET", "/api/packages"), ("POST", "/api/packages"),
+            ("GET", "/api/vpn"), ("POST", "/api/vpn"),
+            ("GET", "/api/console"), ("POST", "/api/console"),
+            ("GET", "/api/admin"),
+        ]
+        response = client.post(
+            "/api/authz/check",
+            json={"checks": [{"method": m, "path": p} for m, p in checks]},
+            headers=user_headers,
+        )
+        allowed = response.json()["allowed"]
+
+        for method, path in checks:
+            status = client.request(method, path, headers=user_headers).status_code
+            assert allowed[f"{method} {path}"] == (status not in (401, 403)), f"{method} {path}"
+
+    @pytest.mark.unit
+    def test_requires_authentication(self, client):
+        """Anonymous callers get 401"""
+        response = client.post("/api/authz/check", json={"checks": [{"permission": "admin"}]})
+        assert response.status_code == 401
+
+    @pytest.mark.unit
+    def test_rejects_incomplete_check(self, client):
+        """A check with neither permission nor method/path is a bad request"""
+        response = client.post("/api/authz/check", json={"checks": [{"method": "GET"}]}, headers=headers("admin"))
+        assert response.status_code == 400
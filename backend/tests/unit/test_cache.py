@@ -0,0 +1,165 @@
+"""
+Unit tests for the role-keyed response cache
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import CacheEntry, ResponseCache, response_cache, role_fingerprint
+from app.main import app
+
+
+@pytest.fixture
+def client():
+    """Test client with an empty response cache"""
+    response_cache.invalidate()
+    return TestClient(app)
+
+
+class TestRoleFingerprint:
+    """Test role-set fingerprints"""
+
+    @pytest.mark.unit
+    def test_order_and_duplicates_do_not_matter(self):
+        a = {"realm_access": {"roles": ["b", "a", "a"]}, "groups": ["g"]}
+        b = {"realm_access": {"roles": ["a", "b"]}, "groups": ["g"]}
+        assert role_fingerprint(a) == role_fingerprint(b)
+
+    @pytest.mark.unit
+    def test_groups_are_part_of_the_key(self):
+        a = {"realm_access": {"roles": ["a"]}, "groups": []}
+        b = {"realm_access": {"roles": ["a"]}, "groups": ["g"]}
+        assert role_fingerprint(a) != role_fingerprint(b)
+
+
+class TestResponseCache:
+    """Test the LRU store"""
+
+    @pytest.mark.unit
+    def test_entry_body_splices_user(self):
+        """The echoed username is appended to the pre-encoded body"""
+        entry = CacheEntry({"message": "ok", "user": "alice", "items": [1]}, ttl=10, echo_user=True)
+        assert json.loads(entry.body("bob")) == {"message": "ok", "items": [1], "user": "bob"}
+        assert entry.etag("alice") != entry.etag("bob")
+
+    @pytest.mark.unit
+    def test_ttl_expiry(self):
+        cache = ResponseCache(ttl=10)
+        cache.put(("ns", 1), CacheEntry({}, ttl=-1, echo_user=False))
+        assert cache.get(("ns", 1)) is None
+        assert len(cache) == 0
+
+    @pytest.mark.unit
+    def test_lru_eviction_by_count_and_bytes(self):
+        cache = ResponseCache(max_entries=2, max_bytes=10_000)
+        for i in range(3):
+            cache.put(("ns", i), CacheEntry({"i": i}, ttl=10, echo_user=False))
+        assert cache.get(("ns", 0)) is None
+        assert cache.get(("ns", 2)) is not None
+
+        small = ResponseCache(max_entries=100, max_bytes=500)
+        for i in range(5):
+            small.put(("ns", i), CacheEntry({"i": i}, ttl=10, echo_user=False))
+        assert small.bytes <= 500
+        assert len(small) < 5
+
+    @pytest.mark.unit
+    def test_invalidate_namespace(self):
+        cache = ResponseCache()
+        cache.put(("a", 1), CacheEntry({}, ttl=10, echo_user=False))
+        cache.put(("b", 1), CacheEntry({}, ttl=10, echo_user=False))
+        cache.invalidate("a")
+        assert cache.get(("a", 1)) is None
+        assert cache.get(("b", 1)) is not None
+
+
+class TestCachedEndpoints:
+    """Test the decorator on the real endpoints"""
+
+    @pytest.mark.unit
+    def test_shared_entry_per_role_set(self, client, headers):
+        """Users with the same roles share one entry but get their own username"""
+        first = client.get("/api/vpn", headers=headers("alice", "vpn_user"))
+        second = client.get("/api/vpn", headers=headers("bob", "vpn_user"))
+
+        assert first.status_code == second.status_code == 200
+        assert first.json()["user"] == "alice"
+        assert second.json()["user"] == "bob"
+        assert first.json()["vpn"] == {}
+        assert len(response_cache) == 1
+        assert response_cache.hits >= 1
+
+    @pytest.mark.unit
+    def test_if_none_match_returns_304(self, client, headers):
+        """A matching ETag yields an empty 304"""
+        response = client.get("/api/vpn", headers=headers("alice", "vpn_user"))
+        etag = response.headers["ETag"]
+        assert response.headers["Cache-Control"] == "private, no-cache"
+
+        response = client.get("/api/vpn", headers={**headers("alice", "vpn_user"), "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        response = client.get("/api/vpn", headers={**headers("bob", "vpn_user"), "If-None-Match": etag})
+        assert response.status_code == 200
+
+    @pytest.mark.unit
+    def test_post_invalidates(self, client, headers):
+        """POST handlers drop their namespace"""
+        client.get("/api/console", headers=headers("alice", "console_accesser"))
+        assert len(response_cache) == 1
+
+        response = client.post("/api/console", headers=headers("alice", "console_accesser"))
+        assert response.status_code == 202
+        assert len(response_cache) == 0
+
+    @pytest.mark.unit
+    def test_denied_requests_are_not_cached(self, client, headers):
+        response = client.get("/api/packages", headers=headers("alice", "vpn_user"))
+        assert response.status_code == 403
+        assert len(response_cache) == 0
+
+
+class TestConditionalPrincipalEndpoints:
+    """Test ETag handling on /api/user/me and /api/dashboard"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("path", ["/api/user/me", "/api/dashboard"])
+    def test_etag_round_trip(self, client, path, headers):
+        """Unchanged claims revalidate with an empty 304"""
+        user_headers = headers("alice", "view_dashboard")
+        response = client.get(path, headers=user_headers)
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "private, no-cache"
+        etag = response.headers["ETag"]
+
+        response = client.get(path, headers={**user_headers, "If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+    @pytest.mark.unit
+    def test_etag_changes_with_claims(self, client, headers):
+        """A role change produces a new tag and a full body"""
+        response = client.get("/api/user/me", headers=headers("alice", "view_dashboard"))
+        etag = response.headers["ETag"]
+
+        response = client.get(
+            "/api/user/me",
+            headers={**headers("alice", "view_dashboard,vpn_user"), "If-None-Match": etag}
+        )
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["roles"] == ["view_dashboard", "vpn_user"]
+
+    @pytest.mark.unit
+    def test_user_me_body(self, client, headers):
+        response = client.get("/api/user/me", headers=headers("alice", "admin"))
+        assert response.json() == {
+            "username": "alice",
+            "email": None,
+            "roles": ["admin"],
+            "first_name": None,
+            "last_name": None,
+        }
@@ -0,0 +1,199 @@
+"""
+Unit tests for response compression and precompressed cache variants
+"""
+import gzip
+import json
+import zlib
+
+import pytest
+import zstandard
+from fastapi import Depends, FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app import cache as cache_module
+from app import compression
+from app.cache import CacheEntry, ResponseCache, cached_response
+from app.compression import CompressionMiddleware, negotiate
+
+BIG = json.dumps({"items": [{"name": f"package-{i}", "version": "1.0.0"} for i in range(200)]}).encode()
+
+
+def build_client(**options):
+    app = FastAPI()
+
+    @app.get("/big")
+    async def big():
+        return Response(BIG, media_type="application/json", headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    async def small():
+        return {"ok": True}
+
+    @app.get("/image")
+    async def image():
+        return Response(BIG, media_type="image/png")
+
+    @app.get("/stream")
+    async def stream():
+        async def rows():
+            for i in range(500):
+                yield json.dumps({"row": i}).encode() + b"\n"
+        return StreamingResponse(rows(), media_type="application/x-ndjson")
+
+    @app.get("/events")
+    async def events():
+        async def ticks():
+            yield b"data: tick\n\n" * 200
+        return StreamingResponse(ticks(), media_type="text/event-stream")
+
+    app.add_middleware(CompressionMiddleware, **{"min_size": 256, "flush_bytes": 1024, **options})
+    return TestClient(app)
+
+
+def raw_get(client, path, encoding):
+    """GET without letting the client decode the body"""
+    with client.stream("GET", path, headers={"Accept-Encoding": encoding}) as response:
+        return response, b"".join(response.iter_raw())
+
+
+class TestNegotiation:
+    """Test Accept-Encoding parsing"""
+
+    @pytest.mark.unit
+    def test_preference_and_q_values(self):
+        available = ("zstd", "br", "gzip")
+        assert negotiate("gzip, deflate, br, zstd", available) == "zstd"
+        assert negotiate("gzip, br;q=0.5", available) == "gzip"
+        assert negotiate("zstd;q=0, gzip", available) == "gzip"
+        assert negotiate("*", available) == "zstd"
+        assert negotiate("*, zstd;q=0", available) == "br"
+        assert negotiate("identity", available) is None
+        assert negotiate("br", ("zstd", "gzip")) is None
+        assert negotiate(None, available) is None
+
+
+class TestCompressionMiddleware:
+    """Test which responses are compressed and how"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("encoding,decode", [("gzip", gzip.decompress), ("zstd", zstandard.decompress)])
+    def test_whole_body(self, encoding, decode):
+        response, body = raw_get(build_client(), "/big", encoding)
+        assert response.headers["content-encoding"] == encoding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"] == 'W/"abc"'
+        assert int(response.headers["content-length"]) == len(body) < len(BIG)
+        assert decode(body) == BIG
+
+    @pytest.mark.unit
+    def test_skipped_responses(self):
+        client = build_client()
+        for path in ("/small", "/image", "/events"):
+            response, body = raw_get(client, path, "gzip")
+            assert "content-encoding" not in response.headers, path
+
+        response, body = raw_get(client, "/big", "identity")
+        assert "content-encoding" not in response.headers
+        assert body == BIG
+        assert client.head("/big", headers={"Accept-Encoding": "gzip"}).headers.get("content-encoding") is None
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("encoding", ["gzip", "zstd"])
+    def test_stream_compressed_per_chunk(self, encoding):
+        chunks = []
+        with build_client().stream("GET", "/stream", headers={"Accept-Encoding": encoding}) as response:
+            assert response.headers["content-encoding"] == encoding
+            assert "content-length" not in response.headers
+            chunks = list(response.iter_raw())
+
+        expected = b"".join(json.dumps({"row": i}).encode() + b"\n" for i in range(500))
+        if encoding == "gzip":
+            assert zlib.decompress(b"".join(chunks), 31) == expected
+        else:
+            reader = zstandard.ZstdDecompressor().decompressobj()
+            assert b"".join(reader.decompress(chunk) for chunk in chunks) == expected
+
+    @pytest.mark.unit
+    def test_brotli_when_installed(self):
+        brotli = pytest.importorskip("brotli")
+        response, body = raw_get(build_client(available=("br", "gzip")), "/big", "br")
+        assert response.headers["content-encoding"] == "br"
+        assert brotli.decompress(body) == BIG
+
+
+class TestCachedVariants:
+    """Test cached bodies are compressed once per coding"""
+
+    @pytest.mark.unit
+    def test_hit_reuses_variant(self, monkeypatch):
+        monkeypatch.setattr(cache_module.settings, "compression_min_size", 256)
+        calls = []
+        real = compression.compress
+        monkeypatch.setattr(compression, "compress", lambda *args: calls.append(args[1]) or real(*args))
+
+        store = ResponseCache()
+        app = FastAPI()
+
+        def principal():
+            return {"preferred_username": "alice", "realm_access": {"roles": ["viewer"]}}
+
+        @app.get("/catalog")
+        @cached_response(store, "catalog", echo_user=False)
+        async def catalog(current_user=Depends(principal)):
+            return json.loads(BIG)
+
+        app.add_middleware(CompressionMiddleware, min_size=256)
+        client = TestClient(app)
+        for _ in range(3):
+            response, body = raw_get(client, "/catalog", "gzip")
+            assert response.headers["content-encoding"] == "gzip"
+            assert json.loads(gzip.decompress(body)) == json.loads(BIG)
+        raw_get(client, "/catalog", "zstd")
+        assert calls == ["gzip", "zstd"]
+
+        etag = response.headers["etag"]
+        assert etag.startswith('W/"')
+        assert client.get("/catalog", headers={"If-None-Match": etag}).status_code == 304
+        assert store.bytes == sum(entry.size for entry in store._entries.values())
+
+    @pytest.mark.unit
+    def test_per_user_bodies_share_one_compressed_prefix(self, monkeypatch):
+        monkeypatch.setattr(compression, "compress", lambda *args: pytest.fail("full body recompressed"))
+        entry = CacheEntry({"items": list(range(1000))}, ttl=10, echo_user=True)
+        assert entry.encodings == ("gzip",)
+
+        first = entry.variant("gzip", "user0")
+        size = entry.size
+        for i in range(100):
+            body = entry.variant("gzip", f"user{i}")
+            assert json.loads(gzip.decompress(body)) == {"items": list(range(1000)), "user": f"user{i}"}
+        assert json.loads(zlib.decompress(first, 31))["user"] == "user0"
+        assert entry.size == size  # the shared head is stored once
+
+    @pytest.mark.unit
+    def test_per_user_cached_responses(self, monkeypatch):
+        monkeypatch.setattr(cache_module.settings, "compression_min_size", 256)
+        app = FastAPI()
+
+        def principal():
+            return {"preferred_username": "alice", "realm_access": {"roles": ["viewer"]}}
+
+        @app.get("/mine")
+        @cached_response(ResponseCache(), "mine")
+        async def mine(current_user=Depends(principal)):
+            return json.loads(BIG)
+
+        app.add_middleware(CompressionMiddleware, min_size=256)
+        client = TestClient(app)
+        expected = {**json.loads(BIG), "user": "alice"}
+
+        # gzip comes from the cache entry even when zstd is preferred
+        response, body = raw_get(client, "/mine", "zstd, gzip")
+        assert response.headers["content-encoding"] == "gzip"
+        assert json.loads(gzip.decompress(body)) == expected
+
+        # a zstd-only client is compressed per request by the middleware
+        response, body = raw_get(client, "/mine", "zstd")
+        assert response.headers["content-encoding"] == "zstd"
+        assert json.loads(zstandard.decompress(body)) == expected
@@ -0,0 +1,81 @@
+"""
+Unit tests for the allow-list CORS middleware
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.cors import CORSMiddleware
+from app.main import app as main_app
+
+ORIGIN = "https://app.example.com"
+PREFLIGHT = {"Origin": ORIGIN, "Access-Control-Request-Method": "POST", "Access-Control-Request-Headers": "Authorization"}
+
+
+def build_client(**options):
+    app = FastAPI()
+    calls = []
+
+    @app.api_route("/api/thing", methods=["GET", "POST", "OPTIONS"])
+    async def thing():
+        calls.append(1)
+        return {"ok": True}
+
+    app.add_middleware(CORSMiddleware, **{"allow_origins": [ORIGIN], **options})
+    return TestClient(app), calls
+
+
+class TestCORS:
+    """Test preflights and actual requests"""
+
+    @pytest.mark.unit
+    def test_preflight_answered_before_the_app(self):
+        client, calls = build_client(max_age=600)
+        response = client.options("/api/thing", headers=PREFLIGHT)
+        assert response.status_code == 204
+        assert response.headers["access-control-allow-origin"] == ORIGIN
+        assert response.headers["access-control-allow-credentials"] == "true"
+        assert "Authorization" in response.headers["access-control-allow-headers"]
+        assert response.headers["access-control-max-age"] == "600"
+        assert response.headers["vary"] == "Origin"
+        assert calls == []
+
+    @pytest.mark.unit
+    def test_unlisted_origin_gets_no_grant(self):
+        client, calls = build_client()
+        response = client.options("/api/thing", headers={**PREFLIGHT, "Origin": "https://evil.example"})
+        assert response.status_code == 204
+        assert "access-control-allow-origin" not in response.headers
+
+        response = client.get("/api/thing", headers={"Origin": "https://evil.example"})
+        assert response.status_code == 200
+        assert "access-control-allow-origin" not in response.headers
+
+    @pytest.mark.unit
+    def test_actual_request_carries_grant(self):
+        client, calls = build_client()
+        response = client.post("/api/thing", headers={"Origin": ORIGIN})
+        assert response.json() == {"ok": True}
+        assert response.headers["access-control-allow-origin"] == ORIGIN
+        assert response.headers["access-control-allow-credentials"] == "true"
+        assert "ETag" in response.headers["access-control-expose-headers"]
+
+        # Plain OPTIONS (no Access-Control-Request-Method) reaches the app
+        assert client.options("/api/thing", headers={"Origin": ORIGIN}).status_code == 200
+        assert calls == [1, 1]
+
+    @pytest.mark.unit
+    def test_wildcard_never_with_credentials(self):
+        with pytest.raises(ValueError):
+            CORSMiddleware(None, allow_origins=["*"], allow_credentials=True)
+
+        client, _ = build_client(allow_origins=["*"], allow_credentials=False)
+        response = client.get("/api/thing", headers={"Origin": "https://anywhere.example"})
+        assert response.headers["access-control-allow-origin"] == "*"
+        assert "access-control-allow-credentials" not in response.headers
+
+    @pytest.mark.unit
+    def test_app_preflight(self):
+        response = TestClient(main_app).options("/api/vpn", headers={**PREFLIGHT, "Origin": "http://localhost:3000"})
+        assert response.status_code == 204
+        assert response.headers["access-control-allow-origin"] == "http://localhost:3000"
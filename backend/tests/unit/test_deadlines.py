@@ -0,0 +1,155 @@
+"""
+Unit tests for request deadlines: budgets, the middleware and outbound Keycloak calls
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app import deadlines
+from app.deadlines import REQUESTS_ABANDONED, DeadlineExceeded, DeadlineMiddleware, route_budget
+from app.keycloak import KeycloakClient
+
+
+class TestBudgets:
+    """Test how a request's budget is chosen"""
+
+    @pytest.mark.unit
+    def test_longest_prefix_wins(self):
+        routes = {"/api": 10.0, "/api/admin": 60.0}
+        assert route_budget("/api/admin/events", 45.0, routes) == 60.0
+        assert route_budget("/api/vpn", 45.0, routes) == 10.0
+        assert route_budget("/health", 45.0, routes) == 45.0
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("value,expected", [(b"5", 5.0), (b"90", 30.0), (b"soon", 30.0), (b"-1", 0.0)])
+    def test_header_only_shortens(self, value, expected):
+        middleware = DeadlineMiddleware(None, default=30.0)
+        assert middleware.budget({"path": "/api/x", "headers": [(b"x-request-timeout", value)]}) == expected
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_timeout_is_capped_by_remaining_time(self):
+        assert deadlines.timeout(5.0) == 5.0
+        token = deadlines.set_deadline(1.0)
+        try:
+            assert 0.9 < deadlines.timeout(5.0) <= 1.0
+            deadlines.set_deadline(-1)
+            with pytest.raises(DeadlineExceeded):
+                deadlines.timeout(5.0)
+        finally:
+            deadlines.reset(token)
+        assert deadlines.remaining() is None
+
+
+def build_app(events):
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                await asyncio.sleep(0.05)
+                yield f"{i}\n"
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app.add_middleware(DeadlineMiddleware, default=0.1)
+    return app
+
+
+class TestDeadlineMiddleware:
+    """Test the 504 answer, streams and client disconnects"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_answers_504_and_cancels_handler(self):
+        events = []
+        transport = httpx.ASGITransport(app=build_app(events))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/slow")
+        assert response.status_code == 504
+        assert response.json() == {"error": "Request deadline exceeded"}
+        assert events == ["cancelled"]
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_started_stream_outlives_budget(self):
+        transport = httpx.ASGITransport(app=build_app([]))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/stream")
+        assert response.status_code == 200
+        assert response.text == "0\n1\n2\n"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_disconnect_cancels_request(self):
+        events = []
+        app = build_app(events)
+        disconnect = asyncio.Event()
+        received, sent = [], []
+
+        async def receive():
+            if not received:
+                received.append(1)
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": "/slow", "raw_path": b"/slow", "root_path": "", "query_string": b"",
+            "headers": [(b"x-request-timeout", b"5")], "client": ("test", 1), "server": ("test", 80),
+        }
+        before = REQUESTS_ABANDONED.value()
+        request = asyncio.ensure_future(app(scope, receive, send))
+        await asyncio.sleep(0.02)
+        disconnect.set()
+        await asyncio.wait_for(request, 1)
+
+        assert events == ["cancelled"]
+        assert sent == []
+        assert REQUESTS_ABANDONED.value() == before + 1
+
+
+class TestKeycloakDeadline:
+    """Test that outbound calls inherit the request deadline"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_call_timeout_follows_deadline(self):
+        seen = []
+
+        def handler(request):
+            seen.append(request.extensions["timeout"]["read"])
+            return httpx.Response(200, json={"keys": []})
+
+        client = KeycloakClient("http://kc", "demo", "app", timeout=5.0, transport=httpx.MockTransport(handler))
+        await client.get_jwks()
+        token = deadlines.set_deadline(1.0)
+        try:
+            await client.get_jwks()
+            deadlines.set_deadline(-1)
+            with pytest.raises(DeadlineExceeded):
+                await client.get_jwks()
+        finally:
+            deadlines.reset(token)
+            await client.aclose()
+
+        assert seen[0] == 5.0
+        assert 0.9 < seen[1] <= 1.0
+        assert len(seen) == 2
+        assert client.breaker("jwks").failures == 0
@@ -0,0 +1,135 @@
+"""
+Unit tests for the background dependency prober and the /health and /ready endpoints
+"""
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.health import DEGRADED, FAILING, OK, HealthProber, health_prober, jwks_check, requests_check
+from app.load_shedding import AdaptiveLimiter
+from app.main import app
+from app.tokens import TokenVerifier
+
+
+def fixed(status, **details):
+    async def check():
+        return status, details
+    return check
+
+
+def body(response):
+    return response[0], json.loads(response[1])
+
+
+class TestHealthProber:
+    """Test snapshots, readiness and liveness"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_not_ready_until_first_probe(self):
+        prober = HealthProber()
+        prober.add_check("a", fixed(OK))
+        assert body(prober.readiness()) == (503, {"status": "starting"})
+        assert body(prober.liveness()) == (200, {"status": "healthy"})
+
+        await prober.probe()
+        assert body(prober.readiness()) == (200, {"status": "ready"})
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_failing_checks_do_not_affect_readiness(self):
+        prober = HealthProber()
+        prober.add_check("keycloak", fixed(FAILING, http_status=502))
+        prober.add_check("jwks", fixed(DEGRADED))
+        snapshot = await prober.probe()
+        assert snapshot["status"] == FAILING
+        assert snapshot["checks"]["keycloak"]["http_status"] == 502
+        assert snapshot["ready"] is True
+        assert body(prober.readiness()) == (200, {"status": "ready"})
+
+        prober.hold("warmup")
+        assert body(prober.readiness()) == (503, {"status": "starting"})
+        prober.release("warmup")
+        assert body(prober.readiness())[0] == 200
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_slow_and_broken_checks_fail(self):
+        async def slow():
+            await asyncio.sleep(1)
+            return OK, {}
+
+        async def broken():
+            raise ConnectionError("refused")
+
+        prober = HealthProber(timeout=0.05)
+        prober.add_check("slow", slow)
+        prober.add_check("broken", broken)
+        checks = (await prober.probe())["checks"]
+        assert checks["slow"]["status"] == FAILING
+        assert checks["slow"]["error"].startswith("timed out")
+        assert checks["broken"]["error"] == "ConnectionError: refused"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_stalled_prober_fails_liveness(self, clock):
+        prober = HealthProber(interval=5, timeout=2, clock=clock)
+        await prober.probe()
+        clock.now += 16
+        assert body(prober.liveness()) == (200, {"status": "healthy"})
+        clock.now += 2
+        assert body(prober.liveness()) == (503, {"status": "unhealthy"})
+        assert body(prober.readiness()) == (503, {"status": "unhealthy"})
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_jwks_freshness(self):
+        verifier = TokenVerifier(lambda: None, ttl=10, max_stale=100)
+        check = jwks_check(verifier)
+        assert await check() == (OK, {"loaded": False})
+
+        verifier.load({"keys": []})
+        assert (await check())[0] == OK
+        verifier._fetched_at -= 50
+        assert (await check())[0] == DEGRADED
+        verifier._fetched_at -= 100
+        assert (await check())[0] == FAILING
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_saturation_does_not_affect_readiness(self):
+        """A saturated worker reports degraded but stays in the (single-server) HAProxy backend"""
+        limiter = AdaptiveLimiter(initial_limit=10)
+        limiter.in_flight = 10
+        prober = HealthProber()
+        prober.add_check("requests", requests_check(limiter, 0.9))
+        assert (await prober.probe())["checks"]["requests"]["status"] == DEGRADED
+        assert body(prober.readiness()) == (200, {"status": "ready"})
+
+
+class TestHealthEndpoints:
+    """Test the endpoints serve the snapshot"""
+
+    @pytest.mark.unit
+    def test_endpoints(self, monkeypatch):
+        monkeypatch.setattr(health_prober, "checks", {"keycloak": fixed(OK, http_status=200)})
+        with TestClient(app) as client:
+            # Startup warm-up holds readiness until it is done
+            for _ in range(200):
+                if not health_prober.holds:
+                    break
+                time.sleep(0.05)
+            client.portal.call(health_prober.probe)
+
+            assert client.get("/health").json() == {"status": "healthy"}
+            response = client.get("/ready")
+            assert response.status_code == 200
+            assert response.headers["cache-control"] == "no-store"
+
+            assert client.get("/api/admin/health", headers={"X-User": "u", "X-Roles": "viewer"}).status_code == 403
+            details = client.get("/api/admin/health", headers={"X-User": "root", "X-Roles": "admin"}).json()
+            assert details["checks"]["keycloak"]["http_status"] == 200
+            assert details["ready"] is True
@@ -0,0 +1,131 @@
+"""
+Unit tests for the adaptive concurrency limiter and load-shedding middleware
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.load_shedding import HIGH, LOW, NORMAL, REQUESTS_SHED, AdaptiveLimiter, LoadSheddingMiddleware, classify
+
+
+class TestClassify:
+    """Test priority classes"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("method,path,expected", [
+        ("GET", "/health", HIGH),
+        ("GET", "/api/admin/events", HIGH),
+        ("POST", "/api/console", LOW),
+        ("POST", "/api/vpn", LOW),
+        ("GET", "/api/vpn", NORMAL),
+        ("GET", "/api/console/jobs/1", NORMAL),
+    ])
+    def test_classes(self, method, path, expected):
+        assert classify(method, path) == expected
+
+
+class TestAdaptiveLimiter:
+    """Test AIMD adjustments"""
+
+    @pytest.mark.unit
+    def test_grows_while_fast_and_utilized(self):
+        limiter = AdaptiveLimiter(initial_limit=10, min_limit=2, max_limit=20)
+        for _ in range(100):
+            for _ in range(6):
+                assert limiter.try_acquire()
+            for _ in range(6):
+                limiter.release(0.01, key="GET /x")
+        assert limiter.limit > 10
+
+    @pytest.mark.unit
+    def test_does_not_grow_when_idle(self):
+        limiter = AdaptiveLimiter(initial_limit=10)
+        for _ in range(100):
+            limiter.try_acquire()
+            limiter.release(0.01, key="GET /x")
+        assert limiter.limit == 10
+
+    @pytest.mark.unit
+    def test_backs_off_once_per_cooldown_when_latency_climbs(self, clock):
+        limiter = AdaptiveLimiter(initial_limit=100, min_limit=10, clock=clock)
+        limiter.try_acquire()
+        limiter.release(0.01, key="GET /x")
+
+        for _ in range(5):
+            limiter.try_acquire()
+            limiter.release(0.5, key="GET /x")
+        assert limiter.limit == pytest.approx(90)
+
+        for _ in range(30):
+            clock.now += 1
+            limiter.try_acquire()
+            limiter.release(0.5, key="GET /x")
+        assert limiter.limit == 10
+
+    @pytest.mark.unit
+    def test_baselines_are_per_request_kind(self, clock):
+        """A route that is always slow is not read as congestion"""
+        limiter = AdaptiveLimiter(initial_limit=100, clock=clock)
+        limiter.try_acquire()
+        limiter.release(0.001, key="GET /health")
+        for _ in range(10):
+            clock.now += 1
+            limiter.try_acquire()
+            limiter.release(0.2, key="GET /api/packages")
+        assert limiter.limit == 100
+
+
+def build_app(limiter):
+    app = FastAPI()
+    gate = asyncio.Event()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/api/slow")
+    async def slow():
+        await gate.wait()
+        return {"ok": True}
+
+    @app.post("/api/console")
+    async def console():
+        return {"ok": True}
+
+    app.add_middleware(LoadSheddingMiddleware, limiter=limiter, retry_after=3)
+    return app, gate
+
+
+class TestLoadSheddingMiddleware:
+    """Test shedding order and the 503 answer"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_sheds_low_priority_first_and_keeps_health(self):
+        limiter = AdaptiveLimiter(initial_limit=4, min_limit=4, max_limit=4)
+        app, gate = build_app(limiter)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            busy = [asyncio.ensure_future(client.get("/api/slow")) for _ in range(3)]
+            while limiter.in_flight < 3:
+                await asyncio.sleep(0.01)
+
+            shed_before = REQUESTS_SHED.value(LOW)
+            console = await client.post("/api/console")
+            assert console.status_code == 503
+            assert console.headers["retry-after"] == "3"
+            assert console.json() == {"error": "Server is overloaded, retry later"}
+            assert REQUESTS_SHED.value(LOW) == shed_before + 1
+
+            # Normal traffic may still take the last slot, health goes past the limit
+            busy.append(asyncio.ensure_future(client.get("/api/slow")))
+            while limiter.in_flight < 4:
+                await asyncio.sleep(0.01)
+            assert (await client.get("/api/slow")).status_code == 503
+            assert (await client.get("/health")).status_code == 200
+
+            gate.set()
+            assert [r.status_code for r in await asyncio.gather(*busy)] == [200] * 4
+        assert limiter.in_flight == 0
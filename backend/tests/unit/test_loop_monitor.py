@@ -0,0 +1,80 @@
+"""
+Unit tests for the event-loop lag monitor and blocked-callback watchdog
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.loop_monitor import LOOP_BLOCKED, LOOP_LAG, LoopMonitor
+from app.main import app
+from app.tokens import VERIFICATIONS_OFFLOADED, TokenVerifier
+
+
+def blocker(seconds):
+    time.sleep(seconds)
+
+
+class TestLoopMonitor:
+    """Test lag measurement, stack capture and the offload signal"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_blocking_callback_is_captured(self):
+        monitor = LoopMonitor(interval=0.01, block_threshold=0.05, offload_lag=0.05)
+        blocked = LOOP_BLOCKED.value()
+        observed = LOOP_LAG.labels().count
+        monitor.start()
+        await asyncio.sleep(0.05)
+        assert not monitor.lagging()
+
+        blocker(0.3)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+        assert LOOP_LAG.labels().count > observed
+        assert LOOP_BLOCKED.value() == blocked + 1
+        record = monitor.slow_callbacks[0]
+        assert any(frame.startswith("blocker (test_loop_monitor.py") for frame in record["stack"])
+        assert record["blocked_for"] >= 0.25
+        assert monitor.lagging()
+        assert all(thread.name != "loop-watchdog" for thread in threading.enumerate())
+
+    @pytest.mark.unit
+    def test_lag_rises_at_once_and_decays(self):
+        monitor = LoopMonitor(offload_lag=0.1)
+        monitor.tick(0.5)
+        assert monitor.lagging()
+        for _ in range(10):
+            monitor.tick(0.0)
+        assert not monitor.lagging()
+        assert not LoopMonitor().lagging()  # no offload_lag, never offloads
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_verifier_offloads_while_lagging(self):
+        lagging = False
+        verifier = TokenVerifier(lambda: None, offload=lambda: lagging)
+        verifier.load({"keys": []})
+        threads = []
+
+        def verify_sync(token):
+            threads.append(threading.get_ident())
+            return {"sub": token}
+
+        verifier.verify_sync = verify_sync
+        offloaded = VERIFICATIONS_OFFLOADED.value()
+        assert await verifier.verify("a") == {"sub": "a"}
+        lagging = True
+        assert await verifier.verify("b") == {"sub": "b"}
+        assert threads[0] == threading.get_ident() != threads[1]
+        assert VERIFICATIONS_OFFLOADED.value() == offloaded + 1
+
+    @pytest.mark.unit
+    def test_admin_endpoint(self):
+        client = TestClient(app)
+        assert client.get("/api/admin/loop", headers={"X-User": "u", "X-Roles": "viewer"}).status_code == 403
+        details = client.get("/api/admin/loop", headers={"X-User": "root", "X-Roles": "admin"}).json()
+        assert set(details) == {"lag", "offloading", "block_threshold", "slow_callbacks"}
@@ -0,0 +1,110 @@
+"""
+Unit tests for memory diagnostics: cache sizing, process gauges and tracemalloc
+"""
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import CacheEntry, response_cache
+from app.main import app
+from app.memory import (
+    MemoryDiagnostics, TracemallocNotRunning, deep_size, memory_diagnostics, sampled_size,
+)
+
+ADMIN = {"X-User": "root", "X-Roles": "admin"}
+
+
+def allocate(n):
+    return [bytes(1000) for _ in range(n)]
+
+
+class TestSizing:
+    """Test size estimates"""
+
+    @pytest.mark.unit
+    def test_deep_size_follows_containers_and_attributes(self):
+        class Holder:
+            def __init__(self, value):
+                self.value = value
+
+        payload = ["x" * 1000, {"k": "y" * 1000}]
+        assert deep_size(payload) > 2000
+        assert deep_size(Holder(payload)) > deep_size(payload)
+        shared = "z" * 1000
+        assert deep_size([shared, shared]) < deep_size([shared, "w" * 1000])
+
+    @pytest.mark.unit
+    def test_sampled_size_scales_to_count(self):
+        items = [bytes(100) for _ in range(10)]
+        assert sampled_size(items, 1000, sample=4) == deep_size(items[0]) * 1000
+        assert sampled_size([], 0) == 0
+
+    @pytest.mark.unit
+    def test_named_caches_reported(self):
+        response_cache.invalidate()
+        response_cache.put(("t", "/x"), CacheEntry({"a": 1}, ttl=10, echo_user=False))
+        sizes = memory_diagnostics.cache_sizes()
+        assert {"response", "jwks", "route_policies", "console_jobs"} <= set(sizes)
+        assert sizes["response"] == {"entries": 1, "bytes": response_cache.bytes}
+        response_cache.invalidate()
+
+
+class TestTracemalloc:
+    """Test the admin-controlled tracemalloc session"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_top_sites_and_diff(self):
+        diagnostics = MemoryDiagnostics(frames=1)
+        with pytest.raises(TracemallocNotRunning):
+            await diagnostics.allocations()
+
+        assert diagnostics.start_tracing()
+        try:
+            assert not diagnostics.start_tracing()
+            first = await diagnostics.allocations(limit=5)
+            assert first["diff"] is False
+            assert len(first["sites"]) <= 5
+
+            kept = allocate(2000)
+            changes = await diagnostics.allocations(diff=True, limit=10)
+            assert changes["diff"] is True
+            top = next(site for site in changes["sites"] if site["file"].endswith("test_memory.py"))
+            assert top["size_diff"] >= 1000 * 2000
+            assert diagnostics.report()["tracemalloc"]["has_snapshot"] is True
+            del kept
+        finally:
+            assert diagnostics.stop_tracing()
+        assert not tracemalloc.is_tracing()
+        assert not diagnostics.stop_tracing()
+
+
+class TestMemoryEndpoints:
+    """Test the admin endpoints and the scrape-time gauges"""
+
+    @pytest.mark.unit
+    def test_endpoints(self):
+        client = TestClient(app)
+        assert client.get("/api/admin/memory", headers={"X-User": "u", "X-Roles": "viewer"}).status_code == 403
+
+        report = client.get("/api/admin/memory", headers=ADMIN).json()
+        assert report["tracemalloc"]["tracing"] is False
+        assert "response" in report["caches"]
+        assert [gen["generation"] for gen in report["gc"]] == [0, 1, 2]
+
+        assert client.get("/api/admin/memory/allocations", headers=ADMIN).status_code == 409
+        assert client.post("/api/admin/memory/tracemalloc/start?frames=1", headers=ADMIN).json() == {"started": True}
+        try:
+            sites = client.get("/api/admin/memory/allocations?limit=3&group_by=filename", headers=ADMIN).json()
+            assert sites["group_by"] == "filename"
+            assert len(sites["sites"]) <= 3
+        finally:
+            assert client.post("/api/admin/memory/tracemalloc/stop", headers=ADMIN).json() == {"stopped": True}
+
+    @pytest.mark.unit
+    def test_metrics_include_memory_gauges(self):
+        text = TestClient(app).get("/metrics", headers={"Accept-Encoding": "identity"}).text
+        assert "process_resident_memory_bytes " in text
+        assert 'python_gc_collections{generation="2"}' in text
+        assert 'cache_entries{cache="response"}' in text
@@ -0,0 +1,57 @@
+"""
+Unit tests for the in-process metrics registry
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import Counter, Gauge, Histogram, Registry, render
+
+
+class TestMetrics:
+    """Test metric types and text exposition"""
+
+    @pytest.mark.unit
+    def test_counter_and_gauge_render(self):
+        registry = Registry()
+        requests = Counter("requests", "Requests served", ["route"], registry=registry)
+        in_flight = Gauge("in_flight", "Requests in flight", registry=registry)
+        requests.labels("/a").inc()
+        requests.labels(route="/a").inc(2)
+        in_flight.set(4)
+        in_flight.dec()
+
+        text = registry.render()
+        assert "# TYPE requests counter" in text
+        assert 'requests_total{route="/a"} 3' in text
+        assert "in_flight 3" in text
+
+    @pytest.mark.unit
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        latency = Histogram("latency_seconds", "Latency", registry=registry, buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            latency.observe(value)
+
+        text = registry.render()
+        assert 'latency_seconds_bucket{le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{le="1"} 2' in text
+        assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+        assert "latency_seconds_count 3" in text
+
+    @pytest.mark.unit
+    def test_label_mismatch_and_duplicates_rejected(self):
+        registry = Registry()
+        requests = Counter("requests", "Requests", ["route"], registry=registry)
+        with pytest.raises(ValueError):
+            requests.inc()
+        with pytest.raises(ValueError):
+            Counter("requests", "Again", registry=registry)
+
+    @pytest.mark.unit
+    def test_metrics_endpoint(self):
+        # Uncompressed, as compressing counts the bytes after the body is rendered
+        response = TestClient(app).get("/metrics", headers={"Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert response.text == render()
@@ -0,0 +1,154 @@
+"""
+Tests for the local OIDC provider stand-in
+"""
+import time
+
+import pytest
+from jose import jwt
+
+from tests.fixtures.oidc_provider import OIDCProvider
+
+
+class TestTokenMinting:
+    """Test offline token minting"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("alg", ["RS256", "ES256"])
+    def test_mint_token_verifies_against_jwks(self, alg):
+        """Minted tokens verify against the published JWK"""
+        provider = OIDCProvider(algorithms=[alg])
+        token = provider.mint_token({"preferred_username": "alice", "realm_access": {"roles": ["admin"]}})
+
+        header = jwt.get_unverified_header(token)
+        key = provider.jwks()["keys"][0]
+        claims = jwt.decode(token, key, algorithms=[alg], options={"verify_aud": False})
+
+        assert header["kid"] == key["kid"]
+        assert claims["preferred_username"] == "alice"
+        assert claims["realm_access"]["roles"] == ["admin"]
+        assert claims["iss"] == "http://oidc-stub/auth/realms/test-realm"
+        assert claims["exp"] > time.time()
+
+    @pytest.mark.unit
+    def test_rotate_keys(self):
+        """Rotation publishes the new key first and keeps old tokens valid"""
+        provider = OIDCProvider()
+        old_token = provider.mint_token()
+        new_key = provider.rotate_keys()
+
+        assert provider.jwks()["keys"][0]["kid"] == new_key.kid
+        assert len(provider.jwks()["keys"]) == 2
+        assert provider.decode(old_token)
+
+        provider.rotate_keys(keep_previous=False)
+        with pytest.raises(Exception):
+            provider.decode(old_token)
+
+
+class TestHttpSurface:
+    """Test the served endpoints"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_discovery_and_jwks(self, oidc_client, oidc_provider):
+        """Discovery points at the JWKS endpoint"""
+        response = await oidc_client.get("/auth/realms/test-realm/.well-known/openid-configuration")
+        assert response.status_code == 200
+        jwks_uri = response.json()["jwks_uri"]
+
+        response = await oidc_client.get(jwks_uri)
+        assert response.status_code == 200
+        assert response.json() == oidc_provider.jwks()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_password_grant_and_introspection(self, oidc_client, oidc_provider):
+        """Password grant issues a token carrying the user's roles"""
+        response = await oidc_client.post(
+            "/auth/realms/test-realm/protocol/openid-connect/token",
+            data={"grant_type": "password", "client_id": "test-client", "username": "admin", "password": "admin"},
+        )
+        assert response.status_code == 200
+        access_token = response.json()["access_token"]
+        assert "admin" in oidc_provider.decode(access_token)["realm_access"]["roles"]
+
+        response = await oidc_client.post(
+            "/auth/realms/test-realm/protocol/openid-connect/token/introspect",
+            data={"token": access_token},
+        )
+        assert response.json()["active"] is True
+
+        oidc_provider.revoke(access_token)
+        response = await oidc_client.post(
+            "/auth/realms/test-realm/protocol/openid-connect/token/introspect",
+            data={"token": access_token},
+        )
+        assert response.json() == {"active": False}
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_refresh_grant_needs_a_refresh_token(self, oidc_client):
+        """Only a refresh token is exchanged; an access token is rejected like Keycloak does"""
+        url = "/auth/realms/test-realm/protocol/openid-connect/token"
+        tokens = (await oidc_client.post(
+            url, data={"grant_type": "password", "client_id": "test-client", "username": "admin", "password": "admin"},
+        )).json()
+
+        response = await oidc_client.post(url, data={"grant_type": "refresh_token", "refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+        assert response.json()["access_token"]
+
+        response = await oidc_client.post(url, data={"grant_type": "refresh_token", "refresh_token": tokens["access_token"]})
+        assert response.status_code == 400
+        assert response.json()["error"] == "invalid_grant"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_password_grant_invalid_credentials(self, oidc_client):
+        """Wrong password answers like Keycloak"""
+        response = await oidc_client.post(
+            "/auth/realms/test-realm/protocol/openid-connect/token",
+            data={"grant_type": "password", "username": "admin", "password": "wrong"},
+        )
+        assert response.status_code == 401
+        assert response.json()["error_description"] == "Invalid user credentials"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_admin_users(self, oidc_client, oidc_provider):
+        """Admin user endpoints require a token and support create/list"""
+        response = await oidc_client.get("/auth/admin/realms/test-realm/users")
+        assert response.status_code == 401
+
+        headers = {"Authorization": f"Bearer {oidc_provider.mint_token()}"}
+        response = await oidc_client.post(
+            "/auth/admin/realms/test-realm/users",
+            json={"username": "carol", "enabled": True, "credentials": [{"type": "password", "value": "pw"}]},
+            headers=headers,
+        )
+        assert response.status_code == 201
+        assert response.headers["Location"].startswith(oidc_provider.keycloak_url)
+
+        response = await oidc_client.get(
+            "/auth/admin/realms/test-realm/users", params={"username": "carol", "exact": "true"}, headers=headers
+        )
+        assert [u["username"] for u in response.json()] == ["carol"]
+
+        response = await oidc_client.get("/auth/admin/realms/test-realm/users/count", headers=headers)
+        assert response.json() == 3
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_fault_injection(self, oidc_client, oidc_provider):
+        """Injected errors and latency are applied per endpoint"""
+        oidc_provider.inject("jwks", latency=0.05, status=503)
+
+        started = time.perf_counter()
+        response = await oidc_client.get("/auth/realms/test-realm/protocol/openid-connect/certs")
+        assert response.status_code == 503
+        assert time.perf_counter() - started >= 0.05
+        assert oidc_provider.request_counts["jwks"] == 1
+
+        oidc_provider.clear_faults()
+        response = await oidc_client.get("/auth/realms/test-realm/protocol/openid-connect/certs")
+        assert response.status_code == 200
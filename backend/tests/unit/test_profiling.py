@@ -0,0 +1,106 @@
+"""
+Unit tests for the on-demand sampling profiler
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.profiling import IDLE, Profile, ProfilerBusy, SamplingProfiler
+
+ADMIN = {"X-User": "root", "X-Roles": "admin"}
+
+
+def spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestSamplingProfiler:
+    """Test sampling, limits and output formats"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_samples_running_task_and_idle(self):
+        profiler = SamplingProfiler(interval=0.002)
+
+        async def busy():
+            await asyncio.sleep(0.02)
+            spin(0.1)
+
+        task = asyncio.create_task(busy(), name="busy")
+        profile = await profiler.run(0.2)
+        await task
+
+        assert profile.samples[(IDLE,)] > 0
+        busy_stacks = [stack for stack in profile.samples if stack[0] == "task:busy"]
+        assert busy_stacks
+        assert any("spin (test_profiling.py" in frame for stack in busy_stacks for frame in stack)
+        assert all(stack[0] != "<awaiting>" for stack in profile.samples)
+        # The sampler thread only lives for the run
+        assert all(thread.name != "sampling-profiler" for thread in threading.enumerate())
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_wall_mode_records_awaiting_tasks(self):
+        async def waiter():
+            await asyncio.Event().wait()
+
+        task = asyncio.create_task(waiter(), name="waiter")
+        profile = await SamplingProfiler(interval=0.002).run(0.05, mode="wall")
+        task.cancel()
+
+        stacks = [stack for stack in profile.samples if stack[:2] == ("<awaiting>", "task:waiter")]
+        assert stacks
+        assert any("waiter (test_profiling.py" in frame for frame in stacks[0])
+        assert stacks[0][-1] == "<Future>"
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_one_run_at_a_time_and_bounded(self):
+        profiler = SamplingProfiler(interval=0.01, max_seconds=1)
+        with pytest.raises(ValueError):
+            await profiler.run(2)
+
+        first = asyncio.create_task(profiler.run(0.05))
+        await asyncio.sleep(0)
+        assert profiler.running
+        with pytest.raises(ProfilerBusy):
+            await profiler.run(0.05)
+        await first
+        assert not profiler.running
+
+    @pytest.mark.unit
+    def test_output_formats(self):
+        profile = Profile({("task:a", "f (x.py:1)", "g (x.py:5)"): 3, (IDLE,): 2}, interval=0.01, duration=0.05, mode="cpu")
+        assert profile.collapsed() == "<idle> 2\ntask:a;f (x.py:1);g (x.py:5) 3\n"
+
+        document = profile.speedscope("w")
+        names = [frame["name"] for frame in document["shared"]["frames"]]
+        sampled = document["profiles"][0]
+        assert sampled["type"] == "sampled"
+        assert [[names[i] for i in stack] for stack in sampled["samples"]] == [
+            ["task:a", "f (x.py:1)", "g (x.py:5)"], ["<idle>"]
+        ]
+        assert sampled["weights"] == pytest.approx([0.03, 0.02])
+
+
+class TestProfileEndpoint:
+    """Test the admin-only endpoint"""
+
+    @pytest.mark.unit
+    def test_endpoint(self):
+        client = TestClient(app)
+        assert client.get("/debug/profile?seconds=0.05", headers={"X-User": "u", "X-Roles": "viewer"}).status_code == 403
+        assert client.get("/debug/profile?seconds=3600", headers=ADMIN).status_code == 422
+
+        response = client.get("/debug/profile?seconds=0.05", headers=ADMIN)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+
+        document = client.get("/debug/profile?seconds=0.05&format=speedscope&mode=wall", headers=ADMIN).json()
+        assert document["profiles"][0]["type"] == "sampled"
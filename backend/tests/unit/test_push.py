@@ -0,0 +1,99 @@
+"""
+Unit tests for the server-sent event push hub
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.push import PushHub
+
+
+async def collect(stream, count):
+    frames = []
+    async for frame in stream:
+        frames.append(frame)
+        if len(frames) == count:
+            break
+    return frames
+
+
+def principal(sub, exp=None):
+    return {"sub": sub, "exp": exp}
+
+
+class TestPushHub:
+    """Test fan-out and per-stream events"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_broadcast_shares_one_frame(self):
+        hub = PushHub()
+        streams = [hub.stream(principal(sub)) for sub in ("a", "b", "b")]
+        for stream in streams:
+            await stream.__anext__()  # "ready"
+        assert len(hub) == 3
+
+        assert hub.publish("notice", {"x": 1}) == 3
+        frames = [await stream.__anext__() for stream in streams]
+        assert frames[0] == b'event: notice\ndata: {"x":1}\n\n'
+        assert frames[0] is frames[1] is frames[2]
+
+        assert hub.publish("notice", {}, ["b"]) == 2
+        for stream in streams:
+            await stream.aclose()
+        assert len(hub) == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_logout_event_ends_stream(self):
+        hub = PushHub()
+        stream = hub.stream(principal("user-1"))
+        await stream.__anext__()
+
+        hub.on_keycloak_event("login", {"type": "LOGOUT", "userId": "user-1", "time": 5})
+        frames = [frame async for frame in stream]
+        assert frames == [b'event: logout\ndata: {"time":5}\n\n']
+        assert len(hub) == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_role_mapping_admin_event(self):
+        hub = PushHub()
+        stream = hub.stream(principal("user-1"))
+        await stream.__anext__()
+        hub.on_keycloak_event("admin", {
+            "operationType": "CREATE", "resourceType": "REALM_ROLE_MAPPING",
+            "resourcePath": "users/user-1/role-mappings/realm", "time": 7,
+        })
+        hub.on_keycloak_event("admin", {"operationType": "UPDATE", "resourceType": "USER", "resourcePath": "users/user-1"})
+        frame = await stream.__anext__()
+        assert frame.startswith(b"event: role-change\n")
+        assert hub._by_sub["user-1"].pop().queue.empty()
+        await stream.aclose()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_token_expiry_warning(self):
+        hub = PushHub(keepalive=5, expiry_warning=30)
+        stream = hub.stream(principal("user-1", exp=time.time() + 30.2))
+        ready, warning = await asyncio.wait_for(collect(stream, 2), 2)
+        assert warning.startswith(b"event: token-expiring\n")
+        await stream.aclose()
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_is_dropped(self):
+        hub = PushHub(max_queue=2)
+        stream = hub.stream(principal("slow"))
+        await stream.__anext__()
+        for i in range(3):
+            hub.publish("tick", i)
+        assert len(hub) == 0
+        assert len([frame async for frame in stream]) <= 2
+
+    @pytest.mark.unit
+    def test_stream_requires_authentication(self):
+        assert TestClient(app).get("/api/events/stream").status_code == 401
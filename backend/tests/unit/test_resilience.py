@@ -0,0 +1,121 @@
+"""
+Unit tests for the Keycloak circuit breaker
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.resilience import (
+    BREAKER_STATE, CLOSED, HALF_OPEN, OPEN,
+    CircuitBreaker, CircuitOpenError, ConcurrencyLimitError, is_failure,
+)
+
+
+def response(status_code):
+    return httpx.Response(status_code, request=httpx.Request("GET", "http://keycloak/x"))
+
+
+async def ok():
+    return response(200)
+
+
+async def server_error():
+    return response(503)
+
+
+async def connect_error():
+    raise httpx.ConnectError("refused")
+
+
+class TestCircuitBreaker:
+    """Test breaker transitions and concurrency limiting"""
+
+    @pytest.mark.unit
+    def test_classification(self):
+        assert is_failure(response(502))
+        assert not is_failure(response(404))
+        assert is_failure(error=httpx.ReadTimeout("slow"))
+        assert not is_failure(error=CircuitOpenError("open", "admin", 1.0))
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_opens_after_threshold_and_fails_fast(self, clock):
+        breaker = CircuitBreaker("t-open", failure_threshold=3, reset_timeout=10, clock=clock)
+        for _ in range(2):
+            await breaker.call(server_error)
+        assert breaker.state == CLOSED
+        with pytest.raises(httpx.ConnectError):
+            await breaker.call(connect_error)
+        assert breaker.state == OPEN
+
+        calls = []
+
+        async def tracked():
+            calls.append(1)
+            return response(200)
+
+        with pytest.raises(CircuitOpenError) as excinfo:
+            await breaker.call(tracked)
+        assert calls == []
+        assert excinfo.value.retry_after == 10
+        assert isinstance(excinfo.value, httpx.HTTPError)
+        assert BREAKER_STATE.value("t-open") == 2
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_half_open_trial_closes_or_reopens(self, clock):
+        breaker = CircuitBreaker("t-half", failure_threshold=1, reset_timeout=5, clock=clock)
+        await breaker.call(server_error)
+        assert breaker.state == OPEN
+
+        clock.now += 5
+        await breaker.call(server_error)
+        assert breaker.state == OPEN
+
+        clock.now += 5
+        await breaker.call(ok)
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_only_one_half_open_trial_at_a_time(self, clock):
+        breaker = CircuitBreaker("t-trial", failure_threshold=1, reset_timeout=5, clock=clock)
+        await breaker.call(server_error)
+        clock.now += 5
+
+        release = asyncio.Event()
+
+        async def slow_ok():
+            await release.wait()
+            return response(200)
+
+        trial = asyncio.ensure_future(breaker.call(slow_ok))
+        await asyncio.sleep(0)
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            await breaker.call(ok)
+        release.set()
+        await trial
+        assert breaker.state == CLOSED
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_concurrency_cap_rejects_after_queue_timeout(self):
+        breaker = CircuitBreaker("t-cap", max_concurrency=2, queue_timeout=0.05)
+        release = asyncio.Event()
+
+        async def held():
+            await release.wait()
+            return response(200)
+
+        running = [asyncio.ensure_future(breaker.call(held)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert breaker.in_flight == 2
+        with pytest.raises(ConcurrencyLimitError):
+            await breaker.call(ok)
+        release.set()
+        await asyncio.gather(*running)
+        assert breaker.in_flight == 0
+        assert breaker.state == CLOSED
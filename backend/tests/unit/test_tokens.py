@@ -0,0 +1,213 @@
+"""
+Unit tests for in-process token verification
+"""
+import base64
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from fastapi.testclient import TestClient
+
+from app.keycloak import keycloak
+from app.main import app
+from app.resilience import OPEN
+from app.tokens import KeySet, TokenError, TokenVerifier, UnknownKeyError, token_verifier
+from tests.fixtures.oidc_provider import OIDCProvider
+
+
+@pytest.fixture
+def provider():
+    return OIDCProvider(algorithms=["RS256", "ES256"])
+
+
+@pytest.fixture
+def verifier(provider):
+    async def fetch_jwks():
+        return provider.jwks()
+
+    verifier = TokenVerifier(fetch_jwks, issuer=provider.issuer())
+    verifier.load(provider.jwks())
+    return verifier
+
+
+class TestKeySet:
+    """Test JWKS parsing"""
+
+    @pytest.mark.unit
+    def test_keys_are_parsed_once(self, provider):
+        """Every signing key is parsed with its verifier pre-built"""
+        key_set = KeySet.from_jwks(provider.jwks())
+        assert len(key_set) == 2
+        for key in key_set.keys.values():
+            assert key.public_key is not None
+            assert key._verifiers[key.alg] is key.verifier(key.alg)
+
+    @pytest.mark.unit
+    def test_skips_encryption_and_broken_keys(self, provider):
+        """Keys not usable for signatures are ignored"""
+        jwks = provider.jwks()
+        jwks["keys"].append({"kty": "RSA", "kid": "enc", "use": "enc", "n": "AQAB", "e": "AQAB"})
+        jwks["keys"].append({"kty": "EC", "kid": "broken", "crv": "P-256"})
+        assert len(KeySet.from_jwks(jwks)) == 2
+
+
+class TestTokenVerifier:
+    """Test token verification"""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("alg", ["RS256", "ES256"])
+    def test_verify_valid_token(self, provider, verifier, alg):
+        """Valid tokens verify through the native fast path"""
+        token = provider.mint_token({"preferred_username": "alice"}, alg=alg)
+        assert verifier.verify_sync(token)["preferred_username"] == "alice"
+
+    @pytest.mark.unit
+    def test_rejects_tampered_token(self, provider, verifier):
+        """A modified payload fails signature verification"""
+        header, payload, signature = provider.mint_token().split(".")
+        other_payload = provider.mint_token({"realm_access": {"roles": ["admin"]}}).split(".")[1]
+        with pytest.raises(TokenError, match="signature"):
+            verifier.verify_sync(f"{header}.{other_payload}.{signature}")
+
+    @pytest.mark.unit
+    def test_rejects_expired_token(self, provider, verifier):
+        """Expired tokens are rejected"""
+        token = provider.mint_token({"exp": int(time.time()) - 10})
+        with pytest.raises(TokenError, match="expired"):
+            verifier.verify_sync(token)
+
+    @pytest.mark.unit
+    def test_rejects_wrong_issuer(self, provider, verifier):
+        """Tokens from another realm are rejected"""
+        token = provider.mint_token(realm="other")
+        with pytest.raises(TokenError, match="issuer"):
+            verifier.verify_sync(token)
+
+    @pytest.mark.unit
+    def test_rejects_malformed_token(self, verifier):
+        """Garbage is rejected without raising anything else"""
+        with pytest.raises(TokenError):
+            verifier.verify_sync("not-a-token")
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("header,payload,error", [
+        ({"alg": "RS256"}, {"exp": "tomorrow"}, "exp"),
+        ({"alg": "RS256"}, {"exp": 4102444800, "nbf": "now"}, "nbf"),
+        ({"alg": "RS256"}, ["not", "an", "object"], "Malformed"),
+        (["RS256"], {"exp": 4102444800}, "Malformed"),
+    ])
+    def test_rejects_signed_token_of_wrong_shape(self, provider, verifier, header, payload, error):
+        """Correctly signed but ill-typed headers and claims are invalid tokens, not crashes"""
+        key = provider.keys[0]
+        if isinstance(header, dict):
+            header = {**header, "kid": key.kid}
+        segments = [base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=") for part in (header, payload)]
+        signing_input = b".".join(segments)
+        signature = key.private_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+        token = (signing_input + b"." + base64.urlsafe_b64encode(signature).rstrip(b"=")).decode("ascii")
+        with pytest.raises(TokenError, match=error):
+            verifier.verify_sync(token)
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("header,error", [
+        ({"alg": "RS256", "kid": ["x"]}, "Malformed"),
+        ({"alg": "RS256", "kid": {"x": 1}}, "Malformed"),
+        ({"alg": ["RS256"], "kid": "x"}, "Algorithm"),
+        ({"alg": {"RS256": 1}, "kid": "x"}, "Algorithm"),
+    ])
+    def test_rejects_unsigned_ill_typed_header(self, provider, header, error):
+        """Non-string alg or kid is rejected before the key lookup, even with an allow-list"""
+        async def fetch_jwks():
+            return provider.jwks()
+
+        verifier = TokenVerifier(fetch_jwks, issuer=provider.issuer(), algorithms=["RS256"])
+        verifier.load(provider.jwks())
+        segments = [base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=") for part in (header, {})]
+        token = (b".".join(segments) + b".c2ln").decode("ascii")
+        with pytest.raises(TokenError, match=error):
+            verifier.verify_sync(token)
+
+    @pytest.mark.unit
+    def test_jose_fallback_key_errors_are_invalid_tokens(self):
+        """A key python-jose cannot use (JWKError) fails the token, not the request"""
+        key = SimpleNamespace(jwk={"kty": "RSA", "n": "AQAB", "e": "AQAB"})
+        with pytest.raises(TokenError, match="signature"):
+            TokenVerifier._verify_with_jose("eyJhbGciOiJIUzI1NiJ9.e30.c2ln", key, "HS256")
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_unknown_kid_refreshes_jwks(self, provider, verifier):
+        """Key rotation is picked up by re-fetching the JWKS"""
+        verifier.min_refresh_interval = 0
+        provider.rotate_keys("ES256")
+        token = provider.mint_token({"preferred_username": "rotated"})
+
+        with pytest.raises(UnknownKeyError):
+            verifier.verify_sync(token)
+        claims = await verifier.verify(token)
+        assert claims["preferred_username"] == "rotated"
+
+
+class TestBearerAuthentication:
+    """Test get_current_user with a forwarded raw token"""
+
+    @pytest.mark.unit
+    def test_user_from_forwarded_token(self, provider):
+        """X-Authorization from HAProxy is verified in-process"""
+        token_verifier.load(provider.jwks())
+        token = provider.mint_token({
+            "preferred_username": "alice",
+            "realm_access": {"roles": ["view_dashboard"]},
+        })
+
+        client = TestClient(app)
+        response = client.get("/api/user/me", headers={"X-Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 200
+        assert response.json()["username"] == "alice"
+        assert response.json()["roles"] == ["view_dashboard"]
+
+    @pytest.mark.unit
+    def test_invalid_forwarded_token(self, provider):
+        """An invalid token yields 401"""
+        token_verifier.load(provider.jwks())
+        token = provider.mint_token({"exp": int(time.time()) - 10})
+
+        client = TestClient(app)
+        response = client.get("/api/user/me", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 401
+
+    @pytest.mark.unit
+    def test_open_breaker_sends_retry_after(self, monkeypatch):
+        """A 503 from an open JWKS breaker carries its Retry-After hint to the client"""
+        breaker = keycloak.breaker("jwks")
+        monkeypatch.setattr(breaker, "state", OPEN)
+        monkeypatch.setattr(breaker, "opened_at", time.monotonic())
+        monkeypatch.setattr(token_verifier, "_fetched_at", 0.0)
+
+        client = TestClient(app)
+        response = client.get("/api/user/me", headers={"Authorization": "Bearer a.b.c"})
+
+        assert response.status_code == 503
+        assert int(response.headers["retry-after"]) >= 1
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize("claims", [
+        {"realm_access": None},
+        {"realm_access": {"roles": "admin"}},
+        {"realm_access": {"roles": [{"name": "admin"}]}},
+        {"groups": "admin"},
+    ])
+    def test_ill_typed_role_claims_are_unauthorized(self, provider, claims):
+        """Signed tokens with malformed role or group claims yield 401, not 500"""
+        token_verifier.load(provider.jwks())
+        token = provider.mint_token(claims)
+
+        client = TestClient(app)
+        response = client.get("/api/user/me", headers={"Authorization": f"Bearer {token}"})
+
+        assert response.status_code == 401
@@ -0,0 +1,67 @@
+"""
+Unit tests for the startup warm-up stage
+"""
+import asyncio
+
+import pytest
+
+from app.health import HealthProber
+from app.main import app
+from app.warmup import WARMUP_STEP_FAILURES, WARMUP_STEP_SECONDS, WarmUp, synthetic_request, synthetic_routes
+
+
+class TestWarmUp:
+    """Test step timing, failures and the readiness hold"""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_holds_readiness_until_done(self):
+        prober = HealthProber()
+        await prober.probe()
+        release = asyncio.Event()
+        seen = []
+
+        async def slow():
+            seen.append(prober.readiness()[0])
+            await release.wait()
+
+        async def broken():
+            raise ConnectionError("keycloak down")
+
+        warm_up = WarmUp([("t-slow", slow), ("t-broken", broken)], prober)
+        task = asyncio.ensure_future(warm_up.run())
+        await asyncio.sleep(0.01)
+        assert seen == [503]
+        assert prober.snapshot["ready"] is True  # the snapshot predates the hold
+
+        failures = WARMUP_STEP_FAILURES.value("t-broken")
+        release.set()
+        results = await task
+        assert prober.readiness()[0] == 200
+        assert results["t-slow"]["error"] is None
+        assert results["t-broken"]["error"] == "ConnectionError: keycloak down"
+        assert WARMUP_STEP_FAILURES.value("t-broken") == failures + 1
+        assert WARMUP_STEP_SECONDS.value("t-slow") > 0
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_step_timeout_does_not_block_readiness(self):
+        async def hang():
+            await asyncio.sleep(10)
+
+        prober = HealthProber()
+        await prober.probe()
+        results = await WarmUp([("t-hang", hang)], prober, timeout=0.05).run()
+        assert results["t-hang"]["error"] == "timed out after 0.05s"
+        assert prober.readiness()[0] == 200
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_synthetic_requests_stop_at_authentication(self):
+        routes = synthetic_routes(app)
+        assert ("GET", "/api/console/jobs/warmup") in routes
+        assert ("POST", "/api/vpn") in routes
+
+        assert await synthetic_request(app, "GET", "/health") == 200
+        assert await synthetic_request(app, "POST", "/api/console") == 401
+        assert await synthetic_request(app, "GET", "/api/events/stream") == 401
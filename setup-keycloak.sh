@@ -155,17 +155,11 @@ export_realm() {
     # Create exports directory
     mkdir -p exports
     
-    # Export realm
-    docker exec keycloak /opt/keycloak/bin/kcadm.sh get realms/myrealm > exports/myrealm.json
-    
-    # Export users
-    docker exec keycloak /opt/keycloak/bin/kcadm.sh get users -r myrealm > exports/users.json
-    
-    # Export roles
-    docker exec keycloak /opt/keycloak/bin/kcadm.sh get roles -r myrealm > exports/roles.json
-    
-    # Export clients
-    docker exec keycloak /opt/keycloak/bin/kcadm.sh get clients -r myrealm > exports/clients.json
+    # Export realm, roles, clients, groups and users in one pass through the
+    # Admin REST API (pooled connection, concurrent requests)
+    docker exec -e KEYCLOAK_ADMIN_PASSWORD="${KEYCLOAK_ADMIN_PASSWORD:?set KEYCLOAK_ADMIN_PASSWORD to the Keycloak admin password}" backend-api \
+        python -m app.realm_sync --realm myrealm export /tmp/myrealm-export.json
+    docker cp backend-api:/tmp/myrealm-export.json exports/myrealm-export.json
     
     print_success "Realm configuration exported to exports/ directory"
 }
@@ -197,10 +191,7 @@ main() {
     echo ""
     echo "📁 Exported Files:"
     echo "=================="
-    echo "Realm Config:  exports/myrealm.json"
-    echo "Users:         exports/users.json"
-    echo "Roles:         exports/roles.json"
-    echo "Clients:       exports/clients.json"
+    echo "Realm Export:  exports/myrealm-export.json (realm, roles, clients, groups, users)"
     echo ""
     echo "🌐 Access Keycloak Admin Console:"
     echo "https://localhost/auth/admin/master/console/"